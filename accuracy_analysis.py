@@ -8,58 +8,22 @@ import requests
 import json
 import time
 import numpy as np
-from PIL import Image, ImageDraw
-import os
-
-def create_test_images():
-    """Create a variety of test images to evaluate model performance."""
-    test_images = []
-
-    # Create different types of test images
-    patterns = [
-        # Red background with brown circle (simulating lesion)
-        {'bg_color': '#ff6b6b', 'circle_color': '#8b4513', 'name': 'red_brown'},
-        # Light pink background with dark brown circle
-        {'bg_color': '#ffb6c1', 'circle_color': '#654321', 'name': 'pink_dark'},
-        # White background with red circle
-        {'bg_color': '#ffffff', 'circle_color': '#ff0000', 'name': 'white_red'},
-        # Gray background with black circle
-        {'bg_color': '#808080', 'circle_color': '#000000', 'name': 'gray_black'},
-        # Blue background with purple circle
-        {'bg_color': '#4169e1', 'circle_color': '#800080', 'name': 'blue_purple'},
-    ]
-
-    for i, pattern in enumerate(patterns):
-        img = Image.new('RGB', (224, 224), pattern['bg_color'])
-        draw = ImageDraw.Draw(img)
-
-        # Draw circle in center
-        draw.ellipse([50, 50, 174, 174], fill=pattern['circle_color'])
-
-        # Add some variation
-        if i % 2 == 0:
-            # Add some noise/texture
-            for x in range(0, 224, 10):
-                for y in range(0, 224, 10):
-                    if np.random.random() > 0.8:
-                        draw.point((x, y), fill='#333333')
-
-        filename = f'test_{pattern["name"]}.jpg'
-        img.save(filename)
-        test_images.append(filename)
-
-    return test_images
+
+from synthetic_lesions import generate
+
+def create_test_images(count=5, size=224, quality=90, seed=0):
+    """Create in-memory test images as (filename, JPEG bytes) pairs."""
+    return [(item['name'], item['jpeg']) for item in generate(count, size, quality, seed)]
 
 def test_local_api(test_images):
     """Test the local Docker API."""
     print("🔍 Testing Local Docker API (MobileNetV3)...")
     results = []
 
-    for img_file in test_images:
+    for img_file, jpeg in test_images:
         try:
-            with open(img_file, 'rb') as f:
-                files = {'file': f}
-                response = requests.post('http://localhost:4000/predict', files=files)
+            files = {'file': (img_file, jpeg, 'image/jpeg')}
+            response = requests.post('http://localhost:4000/predict', files=files)
 
             if response.status_code == 200:
                 result = response.json()
@@ -83,11 +47,10 @@ def test_external_api(test_images):
     print("🔍 Testing External API...")
     results = []
 
-    for img_file in test_images:
+    for img_file, jpeg in test_images:
         try:
-            with open(img_file, 'rb') as f:
-                files = {'file': f}
-                response = requests.post('https://model-inference-api-521423942017.europe-west1.run.app/predict', files=files)
+            files = {'file': (img_file, jpeg, 'image/jpeg')}
+            response = requests.post('https://model-inference-api-521423942017.europe-west1.run.app/predict', files=files)
 
             if response.status_code == 200:
                 result = response.json()
@@ -182,12 +145,6 @@ def main():
     # Analyze results
     analyze_results(local_results, external_results)
 
-    # Cleanup
-    print("\n🧹 Cleaning up test images...")
-    for img_file in test_images:
-        if os.path.exists(img_file):
-            os.remove(img_file)
-
     print("\n📋 SUMMARY")
     print("=" * 50)
     print("Current ML Models Available:")
@@ -5,73 +5,37 @@ Compares External API, Local MobileNetV3, and Fabian's EfficientNet-B3
 """
 
 import requests
+import io
 import json
 import time
 import numpy as np
-from PIL import Image, ImageDraw
+import argparse
+from PIL import Image
 import os
+import sys
 import torch
-import torch.nn as nn
-from torchvision.models import efficientnet_b3, EfficientNet_B3_Weights
-import torchvision.transforms as transforms
-
-def create_diverse_test_images():
-    """Create diverse test images to evaluate model performance."""
-    test_images = []
-
-    # Create different types of test images simulating various skin conditions
-    patterns = [
-        # Red background with brown circle (simulating melanoma)
-        {'bg_color': '#ff6b6b', 'circle_color': '#8b4513', 'name': 'melanoma_sim', 'expected': 1},
-        # Light pink background with dark brown circle (simulating benign mole)
-        {'bg_color': '#ffb6c1', 'circle_color': '#654321', 'name': 'benign_mole', 'expected': 0},
-        # White background with red circle (simulating inflamed lesion)
-        {'bg_color': '#ffffff', 'circle_color': '#ff0000', 'name': 'inflamed_lesion', 'expected': 1},
-        # Gray background with black circle (simulating dark mole)
-        {'bg_color': '#808080', 'circle_color': '#000000', 'name': 'dark_mole', 'expected': 0},
-        # Blue background with purple circle (simulating atypical lesion)
-        {'bg_color': '#4169e1', 'circle_color': '#800080', 'name': 'atypical_lesion', 'expected': 1},
-        # Beige background with light brown circle (simulating normal skin)
-        {'bg_color': '#f5f5dc', 'circle_color': '#d2b48c', 'name': 'normal_skin', 'expected': 0},
-        # Red background with irregular shape (simulating irregular melanoma)
-        {'bg_color': '#ff6b6b', 'circle_color': '#8b4513', 'name': 'irregular_melanoma', 'expected': 1},
-        # Light background with small dark spot (simulating small mole)
-        {'bg_color': '#fafafa', 'circle_color': '#333333', 'name': 'small_mole', 'expected': 0},
-    ]
 
-    for i, pattern in enumerate(patterns):
-        img = Image.new('RGB', (224, 224), pattern['bg_color'])
-        draw = ImageDraw.Draw(img)
-
-        # Draw circle in center
-        if 'irregular' in pattern['name']:
-            # Draw irregular shape for melanoma simulation
-            points = [(112, 50), (150, 80), (160, 120), (140, 160), (80, 150), (60, 100), (112, 50)]
-            draw.polygon(points, fill=pattern['circle_color'])
-        elif 'small' in pattern['name']:
-            # Draw small circle
-            draw.ellipse([100, 100, 124, 124], fill=pattern['circle_color'])
-        else:
-            # Draw regular circle
-            draw.ellipse([50, 50, 174, 174], fill=pattern['circle_color'])
-
-        # Add some variation and texture
-        if i % 2 == 0:
-            # Add noise/texture
-            for x in range(0, 224, 8):
-                for y in range(0, 224, 8):
-                    if np.random.random() > 0.9:
-                        draw.point((x, y), fill='#333333')
-
-        filename = f'test_{pattern["name"]}.jpg'
-        img.save(filename)
-        test_images.append({
-            'filename': filename,
-            'expected': pattern['expected'],
-            'description': pattern['name']
-        })
-
-    return test_images
+from results_store import ResultsStore, bytes_hash, file_hash
+from synthetic_lesions import generate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scoring-api'))
+
+from app.models.loader import load_model  # noqa: E402
+from app.models.registry import build_transform, preprocessing_id  # noqa: E402
+
+FABIAN_WEIGHTS = 'ml/fabian/0306_model.pth'
+
+def create_diverse_test_images(count=8, size=224, quality=90, seed=0):
+    """Create diverse in-memory test images (one per lesion pattern for count=8)."""
+    return [
+        {
+            'filename': item['name'],
+            'jpeg': item['jpeg'],
+            'expected': item['expected'],
+            'description': item['description']
+        }
+        for item in generate(count, size, quality, seed)
+    ]
 
 def test_external_api(test_images):
     """Test the external API."""
@@ -81,9 +45,8 @@ def test_external_api(test_images):
 
     for img_data in test_images:
         try:
-            with open(img_data['filename'], 'rb') as f:
-                files = {'file': f}
-                response = requests.post('https://model-inference-api-521423942017.europe-west1.run.app/predict', files=files)
+            files = {'file': (img_data['filename'], img_data['jpeg'], 'image/jpeg')}
+            response = requests.post('https://model-inference-api-521423942017.europe-west1.run.app/predict', files=files)
 
             if response.status_code == 200:
                 result = response.json()
@@ -112,9 +75,8 @@ def test_local_mobilenet_api(test_images):
 
     for img_data in test_images:
         try:
-            with open(img_data['filename'], 'rb') as f:
-                files = {'file': f}
-                response = requests.post('http://localhost:4000/predict', files=files)
+            files = {'file': (img_data['filename'], img_data['jpeg'], 'image/jpeg')}
+            response = requests.post('http://localhost:4000/predict', files=files)
 
             if response.status_code == 200:
                 result = response.json()
@@ -135,69 +97,66 @@ def test_local_mobilenet_api(test_images):
     total_time = time.time() - start_time
     return results, total_time
 
-def test_fabian_efficientnet(test_images):
-    """Test Fabian's EfficientNet-B3 model directly."""
+def test_fabian_efficientnet(test_images, store_path='eval_results.sqlite'):
+    """Test Fabian's EfficientNet-B3 model directly.
+
+    Predictions are cached in the results store, so the model is only run
+    on images it has not scored before.
+    """
     print("🔍 Testing Fabian's EfficientNet-B3 Model...")
     results = []
     start_time = time.time()
 
     try:
-        # Load Fabian's model
+        # Load Fabian's model (cached per process, weights memory-mapped)
         device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-
-        # Define the model architecture (same as in model.py)
-        class EnhancedModel(nn.Module):
-            def __init__(self, num_classes=2):
-                super().__init__()
-                self.effnet = efficientnet_b3(weights=EfficientNet_B3_Weights.DEFAULT)
-                num_features = self.effnet.classifier[1].in_features
-                self.effnet.classifier = nn.Sequential(
-                    nn.Dropout(p=0.3),
-                    nn.Linear(num_features, 512),
-                    nn.ReLU(),
-                    nn.Dropout(p=0.2),
-                    nn.Linear(512, num_classes)
-                )
-
-            def forward(self, x):
-                return self.effnet(x)
-
-        model = EnhancedModel(num_classes=2).to(device)
-        model.load_state_dict(torch.load('ml/fabian/0306_model.pth', map_location=device))
-        model.eval()
-
-        # Image preprocessing
-        transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
-
-        for img_data in test_images:
+        model, input_size = load_model('efficientnet_b3', FABIAN_WEIGHTS, device)
+        transform = build_transform(input_size)
+        preprocessing = preprocessing_id(input_size)
+
+        store = ResultsStore(store_path)
+        weights_hash = file_hash(FABIAN_WEIGHTS)
+        image_hashes = [bytes_hash(img_data['jpeg']) for img_data in test_images]
+        store.add_images(image_hashes, [img_data['filename'] for img_data in test_images])
+        missing = set(store.missing(weights_hash, preprocessing, image_hashes))
+        print(f"  {len(test_images) - len(missing)} predictions cached, {len(missing)} to compute")
+
+        for img_data, image_hash in zip(test_images, image_hashes):
+            if image_hash not in missing:
+                continue
             try:
                 # Load and preprocess image
-                image = Image.open(img_data['filename']).convert('RGB')
+                image = Image.open(io.BytesIO(img_data['jpeg'])).convert('RGB')
                 image_tensor = transform(image).unsqueeze(0).to(device)
 
                 # Make prediction
                 with torch.no_grad():
                     prediction = model(image_tensor)
                     probabilities = torch.softmax(prediction, dim=1)
-                    predicted_class = torch.argmax(probabilities, dim=1).item()
-                    confidence = probabilities[0][predicted_class].item()
 
-                results.append({
-                    'image': img_data['filename'],
-                    'expected': img_data['expected'],
-                    'prediction': predicted_class,
-                    'confidence': confidence,
-                    'status': 'success'
-                })
-                print(f"  ✅ {img_data['filename']}: Class {predicted_class} (Confidence: {confidence:.3f})")
+                store.add_predictions('efficientnet_b3', weights_hash, preprocessing,
+                                      [image_hash], probabilities.cpu().numpy())
+                missing.discard(image_hash)
 
             except Exception as e:
                 print(f"  ❌ {img_data['filename']}: Error - {str(e)}")
 
+        # Report from the store
+        scored = [(img_data, h) for img_data, h in zip(test_images, image_hashes) if h not in missing]
+        probabilities = store.predictions(weights_hash, preprocessing, [h for _, h in scored])
+        store.close()
+        for (img_data, _), probs in zip(scored, probabilities):
+            predicted_class = int(probs.argmax())
+            confidence = float(probs[predicted_class])
+            results.append({
+                'image': img_data['filename'],
+                'expected': img_data['expected'],
+                'prediction': predicted_class,
+                'confidence': confidence,
+                'status': 'success'
+            })
+            print(f"  ✅ {img_data['filename']}: Class {predicted_class} (Confidence: {confidence:.3f})")
+
     except Exception as e:
         print(f"  ❌ Failed to load EfficientNet model: {str(e)}")
 
@@ -295,6 +254,13 @@ def analyze_performance(external_results, mobilenet_results, efficientnet_result
     print(f"⚡ Fastest Inference: {fastest_model} ({fastest_time:.3f}s)")
 
 def main():
+    parser = argparse.ArgumentParser(description='Compare the external API, local API and EfficientNet-B3')
+    parser.add_argument('--count', type=int, default=8, help='Synthetic test images (default: 8)')
+    parser.add_argument('--size', type=int, default=224, help='Image resolution (default: 224)')
+    parser.add_argument('--quality', type=int, default=90, help='JPEG quality (default: 90)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
     print("🎯 Comprehensive TeleDermatology ML Performance Test")
     print("=" * 60)
 
@@ -310,9 +276,9 @@ def main():
         print("❌ Local Docker API is not running. Start it with: make run")
         return
 
-    # Create test images
+    # Create test images (in memory, deterministic)
     print("\n🖼️  Creating diverse test images...")
-    test_images = create_diverse_test_images()
+    test_images = create_diverse_test_images(args.count, args.size, args.quality, args.seed)
     print(f"Created {len(test_images)} test images")
 
     # Test all models
@@ -325,12 +291,6 @@ def main():
     analyze_performance(external_results, mobilenet_results, efficientnet_results,
                        external_time, mobilenet_time, efficientnet_time)
 
-    # Cleanup
-    print("\n🧹 Cleaning up test images...")
-    for img_data in test_images:
-        if os.path.exists(img_data['filename']):
-            os.remove(img_data['filename'])
-
     print("\n📋 SUMMARY")
     print("=" * 60)
     print("Model Performance Ranking (Expected):")
@@ -2,7 +2,8 @@
 CREATE TABLE IF NOT EXISTS predictions (
   id UUID DEFAULT uuid_generate_v4() PRIMARY KEY,
   user_id UUID REFERENCES auth.users(id),
-  image_url TEXT NOT NULL,
+  -- NULL for rows the scoring API writes for requests without an image_url
+  image_url TEXT,
   prediction TEXT NOT NULL,
   confidence FLOAT NOT NULL,
   low_risk_probability FLOAT NOT NULL,
@@ -0,0 +1,119 @@
+"""
+Step time and peak memory of the CPU training options in train.py.
+
+Every combination of channels_last, torch.compile, bf16 autocast and gradient
+accumulation is run in its own subprocess (so peak RSS is per combination) on
+synthetic data through the real train_epoch. Gradient accumulation keeps the
+effective batch at --batch-size and splits it into --accum-steps micro-batches.
+
+Usage:
+    python bench_train_modes.py --arch mobilenetv3 efficientnet_b3 --output train_modes.json
+"""
+
+import argparse
+import itertools
+import json
+import resource
+import subprocess
+import sys
+
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import DataLoader
+
+from scaling_report import SyntheticDataset
+from train import bf16_supported, build_model, train_epoch
+
+
+def run_one(config):
+    torch.manual_seed(0)
+    device = torch.device('cpu')
+    micro_batch = config['batch_size'] // config['accum_steps']
+
+    model = build_model(config['arch'], 2, pretrained=False)
+    if config['channels_last']:
+        model = model.to(memory_format=torch.channels_last)
+    optimizer = optim.Adam(model.parameters(), lr=1e-3)
+    if config['compile']:
+        model = torch.compile(model)
+    autocast_dtype = torch.bfloat16 if config['bf16'] else None
+
+    def loader(steps):
+        dataset = SyntheticDataset(config['batch_size'] * steps, config['image_size'])
+        return DataLoader(dataset, batch_size=micro_batch)
+
+    options = {
+        'accum_steps': config['accum_steps'],
+        'autocast_dtype': autocast_dtype,
+        'channels_last': config['channels_last'],
+    }
+    criterion = nn.CrossEntropyLoss()
+    log_every = config['steps'] * config['accum_steps'] + 1
+    train_epoch(model, loader(config['warmup']), criterion, optimizer, device, log_every, **options)
+    _, _, timing = train_epoch(model, loader(config['steps']), criterion, optimizer, device, log_every, **options)
+
+    epoch_time = timing['data_time'] + timing['compute_time']
+    return {
+        'step_time_ms': 1000 * epoch_time / config['steps'],
+        'images_per_sec': timing['images_per_sec'],
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark CPU training modes')
+    parser.add_argument('--arch', nargs='+', default=['mobilenetv3', 'efficientnet_b3'],
+                        choices=['mobilenetv3', 'efficientnet_b3'])
+    parser.add_argument('--batch-size', type=int, default=32, help='Effective batch size (default: 32)')
+    parser.add_argument('--accum-steps', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--warmup', type=int, default=3, help='Untimed optimizer steps (default: 3)')
+    parser.add_argument('--steps', type=int, default=10, help='Timed optimizer steps (default: 10)')
+    parser.add_argument('--output', default='train_modes.json')
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_one(json.loads(args.run_one))))
+        return
+
+    bf16_options = [False, True] if bf16_supported(torch.device('cpu')) else [False]
+    if len(bf16_options) == 1:
+        print("bfloat16 is not supported on this CPU, skipping bf16 runs")
+
+    rows = []
+    for arch, channels_last, compiled, bf16, accum_steps in itertools.product(
+            args.arch, [False, True], [False, True], bf16_options, args.accum_steps):
+        config = {
+            'arch': arch,
+            'channels_last': channels_last,
+            'compile': compiled,
+            'bf16': bf16,
+            'accum_steps': accum_steps,
+            'batch_size': args.batch_size,
+            'image_size': args.image_size,
+            'warmup': args.warmup,
+            'steps': args.steps,
+        }
+        proc = subprocess.run(
+            [sys.executable, __file__, '--run-one', json.dumps(config)],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            print(f"{config} failed:\n{proc.stderr[-2000:]}")
+            continue
+        row = {**config, **json.loads(proc.stdout.strip().splitlines()[-1])}
+        rows.append(row)
+        print(f"{arch:<16} channels_last={channels_last!s:<5} compile={compiled!s:<5} "
+              f"bf16={bf16!s:<5} accum={accum_steps}: {row['step_time_ms']:8.1f} ms/step "
+              f"{row['images_per_sec']:7.1f} img/s  peak {row['peak_rss_mb']:7.0f} MB")
+
+    with open(args.output, 'w') as f:
+        json.dump(rows, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
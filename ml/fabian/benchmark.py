@@ -0,0 +1,23 @@
+import time
+
+import numpy as np
+import torch
+
+
+def measure_latency(model, image_size=224, batch_size=1, runs=50, warmup=10, threads=None):
+    """Median and p95 CPU forward latency in milliseconds for one batch."""
+    if threads is not None:
+        torch.set_num_threads(threads)
+    model = model.to('cpu').eval()
+    x = torch.randn(batch_size, 3, image_size, image_size)
+    timings = []
+    with torch.inference_mode():
+        for i in range(warmup + runs):
+            start = time.perf_counter()
+            model(x)
+            if i >= warmup:
+                timings.append(1000 * (time.perf_counter() - start))
+    return {
+        'median_ms': float(np.median(timings)),
+        'p95_ms': float(np.percentile(timings, 95)),
+    }
@@ -0,0 +1,92 @@
+"""
+Background checkpoint writer for train.py.
+
+The training thread only pays for copying the state dicts to CPU memory;
+serialization and disk writes happen on a daemon thread. Full checkpoints are
+rotated so only the newest ``keep_last`` remain.
+"""
+
+import glob
+import os
+import queue
+import threading
+
+import torch
+
+CHECKPOINT_PATTERN = 'epoch_*.pth'
+
+
+def snapshot(obj):
+    """Deep-copy a (nested) state dict with every tensor cloned to CPU."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {k: snapshot(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(v) for v in obj)
+    return obj
+
+
+def latest_checkpoint(checkpoint_dir):
+    paths = sorted(glob.glob(os.path.join(checkpoint_dir, CHECKPOINT_PATTERN)))
+    return paths[-1] if paths else None
+
+
+class AsyncCheckpointer:
+    def __init__(self, checkpoint_dir, keep_last=3):
+        if keep_last < 1:
+            # The newest checkpoint is the one training resumes from, so it is always kept
+            raise ValueError(f'keep_last must be at least 1, got {keep_last}')
+        self.checkpoint_dir = checkpoint_dir
+        self.keep_last = keep_last
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        # A small bound keeps at most two pending snapshots in memory; if the
+        # disk falls that far behind, training waits instead of piling up copies
+        self._queue = queue.Queue(maxsize=2)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='checkpoint-writer', daemon=True)
+        self._thread.start()
+
+    def save(self, state, epoch):
+        """Queue a full training checkpoint for ``epoch``."""
+        path = os.path.join(self.checkpoint_dir, f'epoch_{epoch:04d}.pth')
+        self._submit(snapshot(state), path, rotate=True)
+        return path
+
+    def save_weights(self, state_dict, path):
+        """Queue a plain model state dict, e.g. ``best_model.pth``."""
+        self._submit(snapshot(state_dict), path, rotate=False)
+
+    def _submit(self, state, path, rotate):
+        if self._error is not None:
+            raise RuntimeError('Checkpoint writer failed') from self._error
+        self._queue.put((state, path, rotate))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            state, path, rotate = item
+            try:
+                tmp_path = path + '.tmp'
+                torch.save(state, tmp_path)
+                os.replace(tmp_path, path)
+                if rotate:
+                    self._rotate()
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _rotate(self):
+        paths = sorted(glob.glob(os.path.join(self.checkpoint_dir, CHECKPOINT_PATTERN)))
+        for path in paths[:max(len(paths) - self.keep_last, 0)]:
+            os.remove(path)
+
+    def close(self):
+        """Wait for pending writes to finish and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise RuntimeError('Checkpoint writer failed') from self._error
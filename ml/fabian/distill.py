@@ -0,0 +1,171 @@
+"""
+Knowledge distillation from EnhancedModel (EfficientNet-B3) into
+MobileNetV3Classifier.
+
+Teacher logits are computed once per image and cached on disk by image hash
+(see feature_cache.py), so distillation epochs only run the student. The
+teacher sees the un-augmented validation preprocessing while the student
+trains on augmented crops of the same image.
+
+Usage:
+    python distill.py --data-dir /path/to/train --teacher-weights 0306_model.pth \\
+        --cache-dir teacher_logits --temperature 4 --alpha 0.7 --output student_model.pth
+"""
+
+import argparse
+import copy
+import json
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.optim as optim
+from sklearn.model_selection import train_test_split
+from torch.utils.data import DataLoader, Dataset
+from tqdm import tqdm
+
+from benchmark import measure_latency
+from feature_cache import FeatureCache, model_fingerprint
+from model import EnhancedModel
+from train import LesionDataset, MobileNetV3Classifier, get_transforms, load_dataset, validate
+
+
+class DistillationDataset(Dataset):
+    """Wraps a dataset so each item also carries the cached teacher logits."""
+
+    def __init__(self, dataset, teacher_logits):
+        self.dataset = dataset
+        self.teacher_logits = teacher_logits
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        image, label = self.dataset[idx]
+        return image, label, self.teacher_logits[idx]
+
+
+def distillation_loss(student_logits, teacher_logits, labels, temperature, alpha):
+    """alpha * softened KL to the teacher + (1 - alpha) * cross-entropy to the labels."""
+    soft = F.kl_div(
+        F.log_softmax(student_logits / temperature, dim=1),
+        F.softmax(teacher_logits / temperature, dim=1),
+        reduction='batchmean',
+    ) * temperature ** 2
+    hard = F.cross_entropy(student_logits, labels)
+    return alpha * soft + (1 - alpha) * hard
+
+
+def distill_epoch(student, loader, optimizer, device, temperature, alpha):
+    student.train()
+    running_loss = torch.zeros((), device=device)
+    correct = torch.zeros((), dtype=torch.long, device=device)
+    total = 0
+
+    for images, labels, teacher_logits in tqdm(loader, desc='Distilling'):
+        images, labels = images.to(device), labels.to(device)
+        teacher_logits = teacher_logits.to(device)
+
+        optimizer.zero_grad(set_to_none=True)
+        outputs = student(images)
+        loss = distillation_loss(outputs, teacher_logits, labels, temperature, alpha)
+        loss.backward()
+        optimizer.step()
+
+        running_loss += loss.detach()
+        correct += outputs.detach().argmax(1).eq(labels).sum()
+        total += labels.size(0)
+
+    return running_loss.item()/len(loader), 100.*correct.item()/total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Distill EfficientNet-B3 into MobileNetV3')
+    parser.add_argument('--data-dir', required=True, help='Directory with benign/ and malignant/ image folders')
+    parser.add_argument('--teacher-weights', required=True, help='EnhancedModel state dict')
+    parser.add_argument('--student-weights', help='Optional MobileNetV3Classifier state dict to start from')
+    parser.add_argument('--cache-dir', default='teacher_logits', help='Teacher logit cache directory')
+    parser.add_argument('--temperature', type=float, default=4.0, help='Softmax temperature (default: 4)')
+    parser.add_argument('--alpha', type=float, default=0.7,
+                        help='Weight of the distillation term vs. label cross-entropy (default: 0.7)')
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--lr', type=float, default=0.001)
+    parser.add_argument('--output', default='student_model.pth')
+    parser.add_argument('--report', default='distill_report.json')
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    train_transform, val_transform = get_transforms()
+
+    teacher = EnhancedModel(num_classes=2, pretrained=False)
+    teacher.load_state_dict(torch.load(args.teacher_weights, map_location='cpu'))
+    teacher = teacher.to(device).eval()
+
+    image_paths, labels = load_dataset(args.data_dir)
+    cache = FeatureCache(args.cache_dir, 2, model_fingerprint(teacher, 'teacher', val_transform))
+    rows = cache.update(teacher, image_paths, val_transform, device)
+    teacher_logits = torch.from_numpy(np.array(cache.features()[rows]))
+
+    train_idx, val_idx = train_test_split(
+        np.arange(len(labels)), test_size=0.2, random_state=42, stratify=labels
+    )
+    paths = np.asarray(image_paths)
+    labels = np.asarray(labels)
+
+    train_dataset = DistillationDataset(
+        LesionDataset(list(paths[train_idx]), list(labels[train_idx]), train_transform),
+        teacher_logits[train_idx],
+    )
+    val_dataset = LesionDataset(list(paths[val_idx]), list(labels[val_idx]), val_transform)
+    train_loader = DataLoader(train_dataset, batch_size=args.batch_size, shuffle=True, num_workers=4)
+    val_loader = DataLoader(val_dataset, batch_size=args.batch_size, shuffle=False, num_workers=4)
+
+    student = MobileNetV3Classifier(2, pretrained=args.student_weights is None)
+    if args.student_weights:
+        student.load_state_dict(torch.load(args.student_weights, map_location='cpu'))
+    student = student.to(device)
+
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(student.parameters(), lr=args.lr)
+    scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.1, patience=5)
+
+    best_val_acc = 0
+    best_state = copy.deepcopy(student.state_dict())
+    for epoch in range(args.epochs):
+        print(f'\nEpoch {epoch+1}/{args.epochs}')
+        train_loss, train_acc = distill_epoch(student, train_loader, optimizer, device, args.temperature, args.alpha)
+        val_loss, val_acc = validate(student, val_loader, criterion, device)
+        scheduler.step(val_loss)
+        print(f'Distill Loss: {train_loss:.4f} Train Acc: {train_acc:.2f}%')
+        print(f'Val Loss: {val_loss:.4f} Val Acc: {val_acc:.2f}%')
+
+        if val_acc > best_val_acc:
+            best_val_acc = val_acc
+            best_state = copy.deepcopy(student.state_dict())
+            torch.save(best_state, args.output)
+
+    student.load_state_dict(best_state)
+
+    # Teacher accuracy comes straight from the cached logits
+    teacher_acc = 100. * float((teacher_logits[val_idx].argmax(1).numpy() == labels[val_idx]).mean())
+    report = {
+        'temperature': args.temperature,
+        'alpha': args.alpha,
+        'teacher': {'val_accuracy': teacher_acc, 'latency': measure_latency(teacher)},
+        'student': {'val_accuracy': best_val_acc, 'latency': measure_latency(student)},
+    }
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'model':<28} {'val acc':>8} {'median ms':>10} {'p95 ms':>8}")
+    for name, key in [('Teacher (EfficientNet-B3)', 'teacher'), ('Student (MobileNetV3)', 'student')]:
+        row = report[key]
+        print(f"{name:<28} {row['val_accuracy']:>7.2f}% {row['latency']['median_ms']:>10.1f} "
+              f"{row['latency']['p95_ms']:>8.1f}")
+    print(f"\nStudent saved to {args.output}, report written to {args.report}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Per-image output vectors of a frozen network, cached on disk.
+
+Rows live in an append-only float32 file that is read back memory-mapped, and
+are keyed by the SHA-1 of the image file, so re-running over a grown dataset
+only runs the network on the new images. The cache is tied to a fingerprint of
+the network weights and preprocessing and refuses to mix outputs from
+different ones.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+from train import LesionDataset, MobileNetV3Classifier
+
+FEATURES_FILE = 'features.f32'
+KEYS_FILE = 'keys.json'
+META_FILE = 'meta.json'
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def model_fingerprint(module, *extra):
+    """Hash of a module's weights plus any extra settings (e.g. the transform)."""
+    digest = hashlib.sha1()
+    for name, tensor in module.state_dict().items():
+        digest.update(name.encode())
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    for item in extra:
+        digest.update(repr(item).encode())
+    return digest.hexdigest()
+
+
+def split_model(model):
+    """Split a classifier into (frozen backbone, trainable head).
+
+    The backbone outputs the penultimate features: the input of
+    ``classifier[-1]`` for MobileNetV3Classifier and of the whole
+    ``effnet.classifier`` head for EnhancedModel.
+    """
+    if isinstance(model, MobileNetV3Classifier):
+        net = model.model
+        backbone = nn.Sequential(net.features, net.avgpool, nn.Flatten(1), *net.classifier[:-1])
+        return backbone, net.classifier[-1]
+    net = model.effnet
+    backbone = nn.Sequential(net.features, net.avgpool, nn.Flatten(1))
+    return backbone, net.classifier
+
+
+class FeatureCache:
+    def __init__(self, cache_dir, dim, fingerprint):
+        self.cache_dir = cache_dir
+        self.dim = dim
+        os.makedirs(cache_dir, exist_ok=True)
+
+        meta = {'dim': dim, 'fingerprint': fingerprint}
+        meta_path = os.path.join(cache_dir, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                if json.load(f) != meta:
+                    raise ValueError(
+                        f"{cache_dir} was built with different weights or preprocessing; "
+                        "use a new cache directory"
+                    )
+        else:
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+
+        self.keys = []
+        keys_path = os.path.join(cache_dir, KEYS_FILE)
+        if os.path.exists(keys_path):
+            with open(keys_path) as f:
+                self.keys = json.load(f)
+        self._rows = {key: row for row, key in enumerate(self.keys)}
+
+        # Drop rows written after the last saved key list (interrupted append)
+        features_path = os.path.join(cache_dir, FEATURES_FILE)
+        expected = len(self.keys) * dim * 4
+        if os.path.exists(features_path) and os.path.getsize(features_path) > expected:
+            with open(features_path, 'r+b') as f:
+                f.truncate(expected)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def append(self, keys, features):
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        with open(os.path.join(self.cache_dir, FEATURES_FILE), 'ab') as f:
+            f.write(features.tobytes())
+        for key in keys:
+            self._rows[key] = len(self.keys)
+            self.keys.append(key)
+        tmp_path = os.path.join(self.cache_dir, KEYS_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.keys, f)
+        os.replace(tmp_path, os.path.join(self.cache_dir, KEYS_FILE))
+
+    def rows(self, keys):
+        return np.array([self._rows[key] for key in keys], dtype=np.int64)
+
+    def features(self):
+        """Read-only memory map of all cached rows, shape (len(self), dim)."""
+        return np.memmap(os.path.join(self.cache_dir, FEATURES_FILE), dtype=np.float32,
+                         mode='r', shape=(len(self.keys), self.dim))
+
+    def update(self, network, image_paths, transform, device, batch_size=64, num_workers=4):
+        """Run ``network`` over images missing from the cache; return the rows of all images."""
+        keys = [file_hash(path) for path in image_paths]
+        missing, seen = [], set()
+        for path, key in zip(image_paths, keys):
+            if key not in self._rows and key not in seen:
+                missing.append((path, key))
+                seen.add(key)
+
+        if missing:
+            print(f"Computing {len(missing)} new cache entries ({len(self)} cached)")
+            dataset = LesionDataset([p for p, _ in missing], [0] * len(missing), transform)
+            loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+            network.eval()
+            start = 0
+            with torch.no_grad():
+                for images, _ in loader:
+                    outputs = network(images.to(device)).float().cpu().numpy()
+                    self.append([k for _, k in missing[start:start + len(outputs)]], outputs)
+                    start += len(outputs)
+
+        return self.rows(keys)
@@ -0,0 +1,100 @@
+"""
+Decoded-image cache shared by all DataLoader workers.
+
+Storage is a fixed pool of pre-resized uint8 slots in shared memory, created
+in the main process before the workers start, so every worker reads and fills
+the same single copy. When the memory budget is smaller than the dataset,
+slots are recycled with the CLOCK (second chance) policy.
+"""
+
+import multiprocessing as mp
+
+import numpy as np
+import torch
+
+from shards import decode_image
+
+_HAND, _HITS, _MISSES = 0, 1, 2
+
+
+class SharedImageCache:
+    def __init__(self, num_items, budget_mb, image_size=256):
+        self.image_size = image_size
+        slot_bytes = image_size * image_size * 3
+        self.capacity = max(1, min(num_items, int(budget_mb * 1024 * 1024) // slot_bytes))
+
+        self.images = torch.empty((self.capacity, image_size, image_size, 3), dtype=torch.uint8).share_memory_()
+        self.slot_of = torch.full((num_items,), -1, dtype=torch.int64).share_memory_()
+        self.owner = torch.full((self.capacity,), -1, dtype=torch.int64).share_memory_()
+        self.referenced = torch.zeros(self.capacity, dtype=torch.bool).share_memory_()
+        self.counters = torch.zeros(3, dtype=torch.int64).share_memory_()
+        self.lock = mp.Lock()
+
+    def load(self, idx, path):
+        """Return the decoded, resized image for ``idx``, decoding on a miss."""
+        with self.lock:
+            slot = int(self.slot_of[idx])
+            if slot >= 0:
+                self.referenced[slot] = True
+                self.counters[_HITS] += 1
+                # Copy under the lock so a concurrent eviction can't overwrite it
+                return self.images[slot].numpy().copy()
+            self.counters[_MISSES] += 1
+
+        image = decode_image(path, self.image_size)
+        self._insert(idx, image)
+        return image
+
+    def _insert(self, idx, image):
+        with self.lock:
+            if self.slot_of[idx] >= 0:
+                # Another worker decoded it first
+                return
+            hand = int(self.counters[_HAND])
+            while True:
+                victim = int(self.owner[hand])
+                if victim >= 0 and self.referenced[hand]:
+                    self.referenced[hand] = False
+                    hand = (hand + 1) % self.capacity
+                    continue
+                if victim >= 0:
+                    self.slot_of[victim] = -1
+                break
+            self.images[hand].numpy()[...] = image
+            self.owner[hand] = idx
+            self.slot_of[idx] = hand
+            self.referenced[hand] = True
+            self.counters[_HAND] = (hand + 1) % self.capacity
+
+    def stats(self):
+        with self.lock:
+            hits = int(self.counters[_HITS])
+            misses = int(self.counters[_MISSES])
+            used = int((self.owner >= 0).sum())
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': 100. * hits / total if total else 0.,
+            'used': used,
+            'capacity': self.capacity,
+        }
+
+    def reset_stats(self):
+        with self.lock:
+            self.counters[_HITS] = 0
+            self.counters[_MISSES] = 0
+
+    def report(self, name):
+        stats = self.stats()
+        self.reset_stats()
+        print(f"{name} image cache: {stats['hit_rate']:.1f}% hits "
+              f"({stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['used']}/{stats['capacity']} slots)")
+        return stats
+
+
+def split_budget(budget_mb, sizes):
+    """Split a memory budget across datasets in proportion to their sizes."""
+    sizes = np.asarray(sizes, dtype=np.float64)
+    return list(budget_mb * sizes / sizes.sum())
@@ -3,10 +3,11 @@ import torch.nn as nn
 from torchvision.models import efficientnet_b3, EfficientNet_B3_Weights
 
 class EnhancedModel(nn.Module):
-    def __init__(self, num_classes=2):
+    def __init__(self, num_classes=2, pretrained=True):
         super().__init__()
-        # Load pretrained EfficientNet-B3
-        self.effnet = efficientnet_b3(weights=EfficientNet_B3_Weights.DEFAULT)
+        # Load pretrained EfficientNet-B3 (pretrained=False builds the bare architecture)
+        weights = EfficientNet_B3_Weights.DEFAULT if pretrained else None
+        self.effnet = efficientnet_b3(weights=weights)
 
         # Modify the classifier
         num_features = self.effnet.classifier[1].in_features
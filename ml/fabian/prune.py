@@ -0,0 +1,235 @@
+"""
+Structured channel pruning for MobileNetV3Classifier.
+
+Masking individual weights doesn't make CPU inference faster, so this tool
+physically removes channels: the expanded channels inside every inverted
+residual block (expand conv -> depthwise conv -> squeeze-excitation ->
+project conv) and the hidden units of the classifier. Channels are ranked by
+the magnitude of their BatchNorm scale (depthwise BN) or weight row
+(classifier) and pruned a fraction at a time, with fine-tuning after each
+step. Every step is saved as a checkpoint scoring-api can load:
+
+    {'arch': 'mobilenetv3', 'channel_config': {...}, 'state_dict': {...}}
+
+Usage:
+    python prune.py --data-dir /path/to/train --weights best_model.pth \\
+        --steps 5 --ratio 0.2 --finetune-epochs 2 --output-dir pruned
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from sklearn.model_selection import train_test_split
+from torch.utils.data import DataLoader
+from torchvision.ops.misc import SqueezeExcitation
+
+from benchmark import measure_latency
+from train import (LesionDataset, MobileNetV3Classifier, get_transforms, load_dataset,
+                   train_epoch, validate)
+
+CLASSIFIER_KEY = 'classifier'
+
+
+def _slice_conv(conv, out_idx=None, in_idx=None):
+    weight = conv.weight.data
+    bias = conv.bias.data if conv.bias is not None else None
+    depthwise = conv.groups > 1
+    if out_idx is not None:
+        weight = weight[out_idx]
+        bias = bias[out_idx] if bias is not None else None
+    if in_idx is not None and not depthwise:
+        weight = weight[:, in_idx]
+    out_channels = weight.shape[0]
+    in_channels = out_channels if depthwise else weight.shape[1]
+    new = nn.Conv2d(in_channels, out_channels, conv.kernel_size, conv.stride, conv.padding,
+                    conv.dilation, groups=out_channels if depthwise else 1, bias=bias is not None)
+    new.weight.data = weight.clone()
+    if bias is not None:
+        new.bias.data = bias.clone()
+    return new
+
+
+def _slice_bn(bn, idx):
+    new = nn.BatchNorm2d(len(idx), eps=bn.eps, momentum=bn.momentum)
+    new.weight.data = bn.weight.data[idx].clone()
+    new.bias.data = bn.bias.data[idx].clone()
+    new.running_mean = bn.running_mean[idx].clone()
+    new.running_var = bn.running_var[idx].clone()
+    return new
+
+
+def _slice_linear(linear, out_idx=None, in_idx=None):
+    weight = linear.weight.data
+    bias = linear.bias.data
+    if out_idx is not None:
+        weight, bias = weight[out_idx], bias[out_idx]
+    if in_idx is not None:
+        weight = weight[:, in_idx]
+    new = nn.Linear(weight.shape[1], weight.shape[0])
+    new.weight.data = weight.clone()
+    new.bias.data = bias.clone()
+    return new
+
+
+def prunable_blocks(model):
+    """Indices into ``model.model.features`` of blocks with an expansion conv."""
+    return [
+        i for i, block in enumerate(model.model.features)
+        if hasattr(block, 'block') and block.block[0][0].groups == 1
+        and block.block[1][0].groups == block.block[1][0].in_channels
+    ]
+
+
+def prune_block(block, keep):
+    expand, depthwise = block.block[0], block.block[1]
+    expand[0] = _slice_conv(expand[0], out_idx=keep)
+    expand[1] = _slice_bn(expand[1], keep)
+    depthwise[0] = _slice_conv(depthwise[0], out_idx=keep)
+    depthwise[1] = _slice_bn(depthwise[1], keep)
+    for layer in block.block[2:]:
+        if isinstance(layer, SqueezeExcitation):
+            layer.fc1 = _slice_conv(layer.fc1, in_idx=keep)
+            layer.fc2 = _slice_conv(layer.fc2, out_idx=keep)
+        else:
+            layer[0] = _slice_conv(layer[0], in_idx=keep)
+
+
+def prune_classifier(model, keep):
+    classifier = model.model.classifier
+    classifier[0] = _slice_linear(classifier[0], out_idx=keep)
+    classifier[-1] = _slice_linear(classifier[-1], in_idx=keep)
+
+
+def channel_config(model):
+    config = {str(i): model.model.features[i].block[0][0].out_channels for i in prunable_blocks(model)}
+    config[CLASSIFIER_KEY] = model.model.classifier[0].out_features
+    return config
+
+
+def apply_channel_config(model, config):
+    """Shrink an unpruned model to the widths in ``config`` (before load_state_dict)."""
+    for key, width in config.items():
+        keep = torch.arange(width)
+        if key == CLASSIFIER_KEY:
+            prune_classifier(model, keep)
+        else:
+            prune_block(model.model.features[int(key)], keep)
+    return model
+
+
+def _keep_count(width, ratio, multiple=8):
+    # Round to a multiple of 8 so the oneDNN kernels stay vectorized
+    target = int(width * (1 - ratio)) // multiple * multiple
+    return max(multiple, min(width, target))
+
+
+def prune_step(model, ratio):
+    """Remove the lowest-importance ``ratio`` of channels in every prunable group."""
+    for i in prunable_blocks(model):
+        block = model.model.features[i]
+        importance = block.block[1][1].weight.detach().abs()
+        keep = importance.argsort(descending=True)[:_keep_count(len(importance), ratio)].sort().values
+        prune_block(block, keep)
+
+    importance = model.model.classifier[0].weight.detach().abs().sum(dim=1)
+    keep = importance.argsort(descending=True)[:_keep_count(len(importance), ratio)].sort().values
+    prune_classifier(model, keep)
+
+
+def pareto_frontier(rows):
+    """Rows not beaten on both latency and accuracy by another row."""
+    frontier = []
+    for row in rows:
+        dominated = any(
+            other['latency']['median_ms'] <= row['latency']['median_ms']
+            and other['val_accuracy'] >= row['val_accuracy']
+            and other is not row
+            and (other['latency']['median_ms'] < row['latency']['median_ms']
+                 or other['val_accuracy'] > row['val_accuracy'])
+            for other in rows
+        )
+        if not dominated:
+            frontier.append(row['step'])
+    return frontier
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Iterative structured channel pruning for MobileNetV3')
+    parser.add_argument('--data-dir', required=True, help='Directory with benign/ and malignant/ image folders')
+    parser.add_argument('--weights', required=True, help='Trained MobileNetV3Classifier state dict')
+    parser.add_argument('--steps', type=int, default=5, help='Pruning iterations (default: 5)')
+    parser.add_argument('--ratio', type=float, default=0.2,
+                        help='Fraction of remaining channels removed per step (default: 0.2)')
+    parser.add_argument('--finetune-epochs', type=int, default=2, help='Fine-tuning epochs per step (default: 2)')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--lr', type=float, default=1e-4)
+    parser.add_argument('--output-dir', default='pruned')
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    os.makedirs(args.output_dir, exist_ok=True)
+    train_transform, val_transform = get_transforms()
+
+    image_paths, labels = load_dataset(args.data_dir)
+    train_paths, val_paths, train_labels, val_labels = train_test_split(
+        image_paths, labels, test_size=0.2, random_state=42, stratify=labels
+    )
+    train_loader = DataLoader(LesionDataset(train_paths, train_labels, train_transform),
+                              batch_size=args.batch_size, shuffle=True, num_workers=4)
+    val_loader = DataLoader(LesionDataset(val_paths, val_labels, val_transform),
+                            batch_size=args.batch_size, shuffle=False, num_workers=4)
+
+    model = MobileNetV3Classifier(2, pretrained=False)
+    model.load_state_dict(torch.load(args.weights, map_location='cpu'))
+    criterion = nn.CrossEntropyLoss()
+
+    rows = []
+    for step in range(args.steps + 1):
+        if step > 0:
+            prune_step(model, args.ratio)
+            model = model.to(device)
+            optimizer = optim.Adam(model.parameters(), lr=args.lr)
+            for epoch in range(args.finetune_epochs):
+                train_epoch(model, train_loader, criterion, optimizer, device)
+
+        model = model.to(device)
+        _, val_acc = validate(model, val_loader, criterion, device)
+        latency = measure_latency(model)
+
+        path = os.path.join(args.output_dir, f'step_{step}.pth')
+        torch.save({
+            'arch': 'mobilenetv3',
+            'channel_config': channel_config(model),
+            'state_dict': model.state_dict(),
+        }, path)
+
+        rows.append({
+            'step': step,
+            'checkpoint': path,
+            'params': sum(p.numel() for p in model.parameters()),
+            'val_accuracy': val_acc,
+            'latency': latency,
+        })
+        print(f"Step {step}: {rows[-1]['params']/1e6:.2f}M params, val acc {val_acc:.2f}%, "
+              f"latency {latency['median_ms']:.1f} ms")
+
+    frontier = pareto_frontier(rows)
+    report_path = os.path.join(args.output_dir, 'pruning_report.json')
+    with open(report_path, 'w') as f:
+        json.dump({'ratio': args.ratio, 'steps': rows, 'pareto_frontier': frontier}, f, indent=2)
+
+    print(f"\n{'step':>4} {'params':>8} {'val acc':>8} {'median ms':>10}  pareto")
+    for row in rows:
+        marker = '*' if row['step'] in frontier else ''
+        print(f"{row['step']:>4} {row['params']/1e6:>7.2f}M {row['val_accuracy']:>7.2f}% "
+              f"{row['latency']['median_ms']:>10.1f}  {marker}")
+    print(f"\nReport written to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
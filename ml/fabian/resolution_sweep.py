@@ -0,0 +1,87 @@
+"""
+Reduced-resolution variants of a trained classifier.
+
+Starting from weights trained at 224x224, fine-tunes one copy per input
+resolution, evaluates it at that resolution and measures CPU latency. Each
+variant is saved with its resolution so scoring-api picks the right
+preprocessing without code changes:
+
+    {'arch': 'mobilenetv3', 'input_size': 160, 'state_dict': {...}}
+
+Usage:
+    python resolution_sweep.py --data-dir /path/to/train --weights best_model.pth \\
+        --sizes 160 192 224 --finetune-epochs 3 --output-dir resolutions
+"""
+
+import argparse
+import json
+import os
+
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from sklearn.model_selection import train_test_split
+from torch.utils.data import DataLoader
+
+from benchmark import measure_latency
+from train import LesionDataset, build_model, get_transforms, load_dataset, train_epoch, validate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fine-tune and evaluate lower-resolution model variants')
+    parser.add_argument('--data-dir', required=True, help='Directory with benign/ and malignant/ image folders')
+    parser.add_argument('--arch', choices=['mobilenetv3', 'efficientnet_b3'], default='mobilenetv3')
+    parser.add_argument('--weights', required=True, help='State dict trained at 224x224')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[160, 192, 224])
+    parser.add_argument('--finetune-epochs', type=int, default=3,
+                        help='Fine-tuning epochs per resolution; 0 only evaluates (default: 3)')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--lr', type=float, default=1e-4)
+    parser.add_argument('--output-dir', default='resolutions')
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    os.makedirs(args.output_dir, exist_ok=True)
+    image_paths, labels = load_dataset(args.data_dir)
+    train_paths, val_paths, train_labels, val_labels = train_test_split(
+        image_paths, labels, test_size=0.2, random_state=42, stratify=labels
+    )
+    criterion = nn.CrossEntropyLoss()
+
+    rows = []
+    for size in args.sizes:
+        print(f'\nResolution {size}x{size}')
+        train_transform, val_transform = get_transforms(size)
+        train_loader = DataLoader(LesionDataset(train_paths, train_labels, train_transform),
+                                  batch_size=args.batch_size, shuffle=True, num_workers=4)
+        val_loader = DataLoader(LesionDataset(val_paths, val_labels, val_transform),
+                                batch_size=args.batch_size, shuffle=False, num_workers=4)
+
+        model = build_model(args.arch, 2, pretrained=False)
+        model.load_state_dict(torch.load(args.weights, map_location='cpu'))
+        model = model.to(device)
+        optimizer = optim.Adam(model.parameters(), lr=args.lr)
+        for epoch in range(args.finetune_epochs):
+            train_epoch(model, train_loader, criterion, optimizer, device)
+
+        _, val_acc = validate(model, val_loader, criterion, device)
+        latency = measure_latency(model, image_size=size)
+
+        path = os.path.join(args.output_dir, f'{args.arch}_{size}.pth')
+        torch.save({'arch': args.arch, 'input_size': size, 'state_dict': model.state_dict()}, path)
+        rows.append({'input_size': size, 'checkpoint': path, 'val_accuracy': val_acc, 'latency': latency})
+        print(f'{size}x{size}: val acc {val_acc:.2f}%, latency {latency["median_ms"]:.1f} ms')
+
+    report_path = os.path.join(args.output_dir, 'resolution_report.json')
+    with open(report_path, 'w') as f:
+        json.dump({'arch': args.arch, 'results': rows}, f, indent=2)
+
+    print(f"\n{'size':>5} {'val acc':>8} {'median ms':>10} {'p95 ms':>8}")
+    for row in rows:
+        print(f"{row['input_size']:>5} {row['val_accuracy']:>7.2f}% {row['latency']['median_ms']:>10.1f} "
+              f"{row['latency']['p95_ms']:>8.1f}")
+    print(f"\nReport written to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Images/sec vs process count for CPU data-parallel training.
+
+Runs the real train_epoch with DistributedDataParallel over the gloo backend on
+synthetic images, once per process count, splitting the machine's cores evenly
+between processes. Data loading is excluded so the numbers reflect compute and
+gradient all-reduce scaling.
+
+Usage:
+    python scaling_report.py --procs 1 2 4 8 --steps 20 --output scaling_report.json
+"""
+
+import argparse
+import json
+import os
+import socket
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn as nn
+import torch.optim as optim
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader, Dataset
+from torch.utils.data.distributed import DistributedSampler
+
+from train import MobileNetV3Classifier, train_epoch
+
+
+class SyntheticDataset(Dataset):
+    """Random images served from a small fixed pool, so generation costs nothing."""
+
+    def __init__(self, length, image_size, pool_size=64):
+        self.length = length
+        self.images = torch.randn(pool_size, 3, image_size, image_size)
+        self.labels = torch.randint(0, 2, (pool_size,))
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, idx):
+        idx = idx % len(self.images)
+        return self.images[idx], self.labels[idx]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _worker(rank, world_size, port, threads, args, results):
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(port)
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+    torch.set_num_threads(threads)
+    torch.manual_seed(0)
+
+    device = torch.device('cpu')
+    model = DistributedDataParallel(MobileNetV3Classifier(2, pretrained=False))
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(model.parameters(), lr=1e-3)
+
+    def loader(steps):
+        dataset = SyntheticDataset(args.batch_size * steps * world_size, args.image_size)
+        sampler = DistributedSampler(dataset, shuffle=False)
+        return DataLoader(dataset, batch_size=args.batch_size, sampler=sampler)
+
+    train_epoch(model, loader(args.warmup), criterion, optimizer, device, log_every=args.steps + 1)
+    _, _, timing = train_epoch(model, loader(args.steps), criterion, optimizer, device, log_every=args.steps + 1)
+
+    if rank == 0:
+        results.put(timing['images_per_sec'])
+    dist.destroy_process_group()
+
+
+def measure(world_size, args):
+    threads = max(1, args.cores // world_size)
+    ctx = mp.get_context('spawn')
+    results = ctx.SimpleQueue()
+    mp.start_processes(
+        _worker,
+        args=(world_size, _free_port(), threads, args, results),
+        nprocs=world_size,
+        start_method='spawn',
+    )
+    return results.get(), threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure DDP training throughput vs process count')
+    parser.add_argument('--procs', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--cores', type=int, default=os.cpu_count() or 1,
+                        help='Cores to split between processes (default: all)')
+    parser.add_argument('--batch-size', type=int, default=32, help='Per-process batch size (default: 32)')
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--warmup', type=int, default=3, help='Untimed warm-up steps (default: 3)')
+    parser.add_argument('--steps', type=int, default=20, help='Timed steps per process (default: 20)')
+    parser.add_argument('--output', default='scaling_report.json')
+    args = parser.parse_args()
+
+    rows = []
+    for world_size in args.procs:
+        images_per_sec, threads = measure(world_size, args)
+        rows.append({'processes': world_size, 'threads_per_process': threads, 'images_per_sec': images_per_sec})
+        print(f"{world_size} processes x {threads} threads: {images_per_sec:.1f} img/s")
+
+    baseline = rows[0]['images_per_sec'] / rows[0]['processes']
+    print(f"\n{'procs':>5} {'threads':>7} {'img/s':>9} {'speedup':>8} {'efficiency':>10}")
+    for row in rows:
+        row['speedup'] = row['images_per_sec'] / baseline
+        row['efficiency'] = row['speedup'] / row['processes']
+        print(f"{row['processes']:>5} {row['threads_per_process']:>7} {row['images_per_sec']:>9.1f} "
+              f"{row['speedup']:>7.2f}x {100 * row['efficiency']:>9.1f}%")
+
+    with open(args.output, 'w') as f:
+        json.dump({'cores': args.cores, 'batch_size': args.batch_size,
+                   'image_size': args.image_size, 'results': rows}, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
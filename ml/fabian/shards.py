@@ -0,0 +1,265 @@
+"""
+Pre-decoded, memory-mapped dataset shards.
+
+Converts a class-per-folder image directory (e.g. ``train/benign``,
+``train/malignant``) into uint8 ``.npy`` shards of shape N x H x W x 3 plus a
+JSON index of labels and filenames. Training then reads pixels straight from
+the page cache instead of decoding every JPEG on every epoch.
+
+Layout of a shard directory::
+
+    meta.json            conversion settings and the ordered file list hash
+    shard_00000.npy      uint8 array (N, H, W, 3)
+    shard_00000.json     labels and filenames of shard_00000 (written last)
+    index.json           merged index, written once all shards exist
+
+Images are stored either center-cropped (``crop``, the default, for the
+PyTorch pipeline's own random crops) or resized whole to size x size without
+keeping the aspect ratio (``stretch``), which approximates Keras'
+``image_dataset_from_directory`` (PIL's bilinear resize antialiases when
+downscaling, ``tf.image.resize`` does not); the ``ml/marten`` TensorFlow
+stack reads ``stretch`` shards through ``src/shards.py``.
+
+Usage:
+    python shards.py --src /path/to/train --out /path/to/train_shards --size 256
+    python shards.py --src /path/to/train --out /path/to/train_shards_tf --size 224 --resize-mode stretch
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image
+from torch.utils.data import Dataset
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+INDEX_FILE = 'index.json'
+META_FILE = 'meta.json'
+RESIZE_MODES = ('crop', 'stretch')
+
+
+def list_images(src_dir):
+    """Return (classes, [(path, label), ...]) for a class-per-folder directory.
+
+    Classes are sorted by name, so ``benign`` -> 0 and ``malignant`` -> 1,
+    matching ``load_dataset`` in train.py and Keras' directory loader.
+    """
+    classes = sorted(
+        d for d in os.listdir(src_dir) if os.path.isdir(os.path.join(src_dir, d))
+    )
+    samples = []
+    for label, class_name in enumerate(classes):
+        class_dir = os.path.join(src_dir, class_name)
+        for name in sorted(os.listdir(class_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                samples.append((os.path.join(class_dir, name), label))
+    return classes, samples
+
+
+def decode_image(path, size, resize_mode='crop'):
+    """Decode an image, resize its shorter side to ``size`` and center crop.
+
+    With ``resize_mode='stretch'`` the whole image is resized to ``size`` x
+    ``size`` (bilinear, aspect ratio not kept) instead, approximating Keras'
+    ``image_dataset_from_directory``; pixels differ slightly because PIL
+    antialiases when downscaling and ``tf.image.resize`` does not.
+    """
+    image = Image.open(path).convert('RGB')
+    if resize_mode == 'stretch':
+        return np.asarray(image.resize((size, size), Image.BILINEAR), dtype=np.uint8)
+    width, height = image.size
+    scale = size / min(width, height)
+    new_size = (max(size, round(width * scale)), max(size, round(height * scale)))
+    image = image.resize(new_size, Image.BILINEAR)
+    left = (new_size[0] - size) // 2
+    top = (new_size[1] - size) // 2
+    return np.asarray(image.crop((left, top, left + size, top + size)), dtype=np.uint8)
+
+
+def _shard_name(shard_id):
+    return f'shard_{shard_id:05d}'
+
+
+def _write_shard(out_dir, shard_id, samples, size, resize_mode):
+    """Decode ``samples`` into one shard. Runs in a worker process."""
+    name = _shard_name(shard_id)
+    tmp_path = os.path.join(out_dir, name + '.npy.tmp')
+    array = np.lib.format.open_memmap(
+        tmp_path, mode='w+', dtype=np.uint8, shape=(len(samples), size, size, 3)
+    )
+    for row, (path, _) in enumerate(samples):
+        array[row] = decode_image(path, size, resize_mode)
+    array.flush()
+    del array
+    os.replace(tmp_path, os.path.join(out_dir, name + '.npy'))
+
+    # The label file is the completion marker used when resuming
+    with open(os.path.join(out_dir, name + '.json'), 'w') as f:
+        json.dump({
+            'labels': [label for _, label in samples],
+            'filenames': [os.path.basename(path) for path, _ in samples],
+        }, f)
+    return shard_id
+
+
+def convert(src_dir, out_dir, size=256, shard_size=1024, workers=None, resize_mode='crop'):
+    """Convert ``src_dir`` into shards under ``out_dir``.
+
+    Finished shards are skipped, so an interrupted conversion can simply be
+    re-run with the same arguments.
+    """
+    if resize_mode not in RESIZE_MODES:
+        raise ValueError(f"resize_mode must be one of {RESIZE_MODES}, got {resize_mode!r}")
+    classes, samples = list_images(src_dir)
+    if not samples:
+        raise ValueError(f"No images found in {src_dir}")
+
+    file_hash = hashlib.sha1('\n'.join(p for p, _ in samples).encode()).hexdigest()
+    meta = {
+        'classes': classes,
+        'size': size,
+        'shard_size': shard_size,
+        'num_samples': len(samples),
+        'file_hash': file_hash,
+        'resize_mode': resize_mode,
+    }
+
+    os.makedirs(out_dir, exist_ok=True)
+    meta_path = os.path.join(out_dir, META_FILE)
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            existing = json.load(f)
+        # Directories converted before resize modes existed are center-cropped
+        existing.setdefault('resize_mode', 'crop')
+        if existing != meta:
+            raise ValueError(
+                f"{out_dir} holds shards from a different source or settings; "
+                "use an empty output directory"
+            )
+    else:
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f, indent=2)
+
+    chunks = [samples[i:i + shard_size] for i in range(0, len(samples), shard_size)]
+    pending = [
+        shard_id for shard_id in range(len(chunks))
+        if not os.path.exists(os.path.join(out_dir, _shard_name(shard_id) + '.json'))
+    ]
+    print(f"{len(samples)} images in {len(chunks)} shards, {len(pending)} to convert")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_write_shard, out_dir, shard_id, chunks[shard_id], size, resize_mode)
+            for shard_id in pending
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            shard_id = future.result()
+            print(f"  [{done}/{len(pending)}] wrote {_shard_name(shard_id)}")
+
+    shards = []
+    labels, filenames = [], []
+    for shard_id in range(len(chunks)):
+        name = _shard_name(shard_id)
+        with open(os.path.join(out_dir, name + '.json')) as f:
+            shard_index = json.load(f)
+        shards.append({'file': name + '.npy', 'count': len(shard_index['labels'])})
+        labels.extend(shard_index['labels'])
+        filenames.extend(shard_index['filenames'])
+
+    with open(os.path.join(out_dir, INDEX_FILE), 'w') as f:
+        json.dump({
+            'classes': classes,
+            'height': size,
+            'width': size,
+            'resize_mode': resize_mode,
+            'shards': shards,
+            'labels': labels,
+            'filenames': filenames,
+        }, f)
+    return out_dir
+
+
+def load_index(shard_dir):
+    with open(os.path.join(shard_dir, INDEX_FILE)) as f:
+        return json.load(f)
+
+
+class ShardDataset(Dataset):
+    """PyTorch view over a shard directory.
+
+    Drop-in replacement for ``LesionDataset``: items are HxWx3 uint8 arrays
+    (read-only views into the memory-mapped shards) passed through an
+    albumentations ``transform``. Shards are opened lazily so each DataLoader
+    worker maps them itself rather than inheriting handles.
+    """
+
+    def __init__(self, shard_dir, indices=None, transform=None):
+        self.shard_dir = shard_dir
+        self.transform = transform
+        index = load_index(shard_dir)
+        self.classes = index['classes']
+        self.shard_files = [s['file'] for s in index['shards']]
+
+        counts = [s['count'] for s in index['shards']]
+        shard_of = np.repeat(np.arange(len(counts)), counts)
+        row_of = np.concatenate([np.arange(c) for c in counts])
+        all_labels = np.asarray(index['labels'], dtype=np.int64)
+        filenames = np.asarray(index['filenames'])
+
+        if indices is None:
+            indices = np.arange(len(all_labels))
+        indices = np.asarray(indices)
+        self.shard_of = shard_of[indices]
+        self.row_of = row_of[indices]
+        self.labels = all_labels[indices]
+        self.filenames = filenames[indices]
+        self._arrays = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _shards(self):
+        if self._arrays is None:
+            self._arrays = [
+                np.load(os.path.join(self.shard_dir, name), mmap_mode='r')
+                for name in self.shard_files
+            ]
+        return self._arrays
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_arrays'] = None
+        return state
+
+    def __getitem__(self, idx):
+        image = self._shards()[self.shard_of[idx]][self.row_of[idx]]
+
+        if self.transform:
+            augmented = self.transform(image=image)
+            image = augmented['image']
+
+        label = int(self.labels[idx])
+        return image, label
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert an image folder into memory-mapped shards')
+    parser.add_argument('--src', required=True, help='Directory with one sub-folder per class')
+    parser.add_argument('--out', required=True, help='Output shard directory')
+    parser.add_argument('--size', type=int, default=256, help='Stored image side length (default: 256)')
+    parser.add_argument('--shard-size', type=int, default=1024, help='Images per shard (default: 1024)')
+    parser.add_argument('--workers', type=int, default=None, help='Decode processes (default: all cores)')
+    parser.add_argument('--resize-mode', choices=RESIZE_MODES, default='crop',
+                        help="'crop': shorter side to --size, center crop (default); 'stretch': whole "
+                             "image to --size x --size, approximating Keras' image_dataset_from_directory (ml/marten)")
+    args = parser.parse_args()
+
+    convert(args.src, args.out, size=args.size, shard_size=args.shard_size, workers=args.workers,
+            resize_mode=args.resize_mode)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,13 @@
 import os
+import argparse
+import contextlib
+import time
 import torch
 import torch.nn as nn
 import torch.optim as optim
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data.distributed import DistributedSampler
 from torch.utils.data import Dataset, DataLoader
 from torchvision.models import mobilenet_v3_large, MobileNet_V3_Large_Weights
 from torchvision import transforms
@@ -12,19 +18,28 @@ import numpy as np
 from sklearn.model_selection import train_test_split
 from tqdm import tqdm
 import matplotlib.pyplot as plt
+from shards import ShardDataset
+from image_cache import SharedImageCache, split_budget
+from checkpoint import AsyncCheckpointer, latest_checkpoint
+from model import EnhancedModel
 
 class LesionDataset(Dataset):
-    def __init__(self, image_paths, labels, transform=None):
+    def __init__(self, image_paths, labels, transform=None, cache=None):
         self.image_paths = image_paths
         self.labels = labels
         self.transform = transform
+        # Optional SharedImageCache of decoded, pre-resized images
+        self.cache = cache
 
     def __len__(self):
         return len(self.image_paths)
 
     def __getitem__(self, idx):
-        image = Image.open(self.image_paths[idx]).convert('RGB')
-        image = np.array(image)
+        if self.cache is not None:
+            image = self.cache.load(idx, self.image_paths[idx])
+        else:
+            image = Image.open(self.image_paths[idx]).convert('RGB')
+            image = np.array(image)
         
         if self.transform:
             augmented = self.transform(image=image)
@@ -33,71 +48,173 @@ class LesionDataset(Dataset):
         label = self.labels[idx]
         return image, label
 
+def load_dataset(data_dir):
+    image_paths = []
+    labels = []
+
+    # Check if directory exists
+    if not os.path.exists(data_dir):
+        raise ValueError(f"Directory {data_dir} does not exist!")
+
+    # Benign images are label 0, malignant images label 1
+    for label, class_name in enumerate(['benign', 'malignant']):
+        class_dir = os.path.join(data_dir, class_name)
+        if os.path.exists(class_dir):
+            for img_name in sorted(os.listdir(class_dir)):
+                if img_name.lower().endswith(('.png', '.jpg', '.jpeg')):
+                    image_paths.append(os.path.join(class_dir, img_name))
+                    labels.append(label)
+
+    print(f"Found {len(image_paths)} images in total")
+    print(f"Benign images: {labels.count(0)}")
+    print(f"Malignant images: {labels.count(1)}")
+
+    if len(image_paths) == 0:
+        raise ValueError(f"No images found in {data_dir}. Please check the path and data structure.")
+
+    return image_paths, labels
+
 class MobileNetV3Classifier(nn.Module):
-    def __init__(self, num_classes):
+    def __init__(self, num_classes, pretrained=True):
         super().__init__()
-        self.model = mobilenet_v3_large(weights=MobileNet_V3_Large_Weights.DEFAULT)
+        weights = MobileNet_V3_Large_Weights.DEFAULT if pretrained else None
+        self.model = mobilenet_v3_large(weights=weights)
         # Modify the classifier for our number of classes
         self.model.classifier[-1] = nn.Linear(self.model.classifier[-1].in_features, num_classes)
 
     def forward(self, x):
         return self.model(x)
 
-def train_epoch(model, train_loader, criterion, optimizer, device):
+def is_main_process():
+    return not dist.is_initialized() or dist.get_rank() == 0
+
+def reduce_metrics(running_loss, correct, total, steps):
+    """Turn epoch sums into (mean loss, accuracy %, images), summed over all processes."""
+    device = running_loss.device
+    metrics = torch.stack([
+        running_loss.double(),
+        correct.double(),
+        torch.tensor(total, dtype=torch.float64, device=device),
+        torch.tensor(steps, dtype=torch.float64, device=device),
+    ])
+    if dist.is_initialized():
+        dist.all_reduce(metrics)
+    loss_sum, correct, total, steps = metrics.tolist()
+    return loss_sum/steps, 100.*correct/total, int(total)
+
+def bf16_supported(device):
+    """Whether the device has native bfloat16 kernels (AVX512-BF16/AMX on CPU)."""
+    if device.type == 'cuda':
+        return torch.cuda.is_bf16_supported()
+    try:
+        return torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        return False
+
+def build_model(arch, num_classes, pretrained=True):
+    if arch == 'efficientnet_b3':
+        return EnhancedModel(num_classes, pretrained=pretrained)
+    return MobileNetV3Classifier(num_classes, pretrained=pretrained)
+
+def train_epoch(model, train_loader, criterion, optimizer, device, log_every=50, profiler=None,
+                accum_steps=1, autocast_dtype=None, channels_last=False):
     model.train()
-    running_loss = 0.0
-    correct = 0
+    # Metrics stay on the device; reading them back forces a sync, so that
+    # only happens every `log_every` steps and once at the end of the epoch
+    running_loss = torch.zeros((), device=device)
+    correct = torch.zeros((), dtype=torch.long, device=device)
     total = 0
+    data_time = 0.0
 
-    pbar = tqdm(train_loader, desc='Training')
-    for images, labels in pbar:
-        images, labels = images.to(device), labels.to(device)
-        
-        optimizer.zero_grad()
-        outputs = model(images)
-        loss = criterion(outputs, labels)
-        loss.backward()
-        optimizer.step()
-
-        running_loss += loss.item()
-        _, predicted = outputs.max(1)
+    pbar = tqdm(train_loader, desc='Training', disable=not is_main_process())
+    optimizer.zero_grad(set_to_none=True)
+    num_batches = len(train_loader)
+    epoch_start = data_start = time.perf_counter()
+    for step, (images, labels) in enumerate(pbar, 1):
+        data_time += time.perf_counter() - data_start
+        images, labels = images.to(device, non_blocking=True), labels.to(device, non_blocking=True)
+        if channels_last:
+            images = images.contiguous(memory_format=torch.channels_last)
+
+        # With gradient accumulation the optimizer steps every `accum_steps`
+        # batches; DDP skips the gradient all-reduce on the batches in between
+        update = step % accum_steps == 0 or step == num_batches
+        # Average over the batches actually in this window; the last one may be shorter
+        window_start = (step - 1) // accum_steps * accum_steps
+        window_size = min(accum_steps, num_batches - window_start)
+        sync_context = contextlib.nullcontext() if update or not hasattr(model, 'no_sync') else model.no_sync()
+        with sync_context:
+            with torch.autocast(device.type, dtype=autocast_dtype, enabled=autocast_dtype is not None):
+                outputs = model(images)
+                loss = criterion(outputs, labels)
+            (loss / window_size).backward()
+        if update:
+            optimizer.step()
+            optimizer.zero_grad(set_to_none=True)
+
+        running_loss += loss.detach()
+        correct += outputs.detach().argmax(1).eq(labels).sum()
         total += labels.size(0)
-        correct += predicted.eq(labels).sum().item()
-        
-        pbar.set_postfix({'loss': running_loss/total, 'accuracy': 100.*correct/total})
 
-    return running_loss/len(train_loader), 100.*correct/total
+        if step % log_every == 0:
+            pbar.set_postfix({'loss': running_loss.item()/step, 'accuracy': 100.*correct.item()/total})
+        if profiler is not None:
+            profiler.step()
+        data_start = time.perf_counter()
+
+    epoch_loss, epoch_acc, images = reduce_metrics(running_loss, correct, total, num_batches)
+    epoch_time = time.perf_counter() - epoch_start
+    timing = {
+        'data_time': data_time,
+        'compute_time': epoch_time - data_time,
+        # Across all processes when training distributed
+        'images_per_sec': images/epoch_time,
+    }
+    return epoch_loss, epoch_acc, timing
 
-def validate(model, val_loader, criterion, device):
+def validate(model, val_loader, criterion, device, autocast_dtype=None, channels_last=False):
     model.eval()
-    running_loss = 0.0
-    correct = 0
+    running_loss = torch.zeros((), device=device)
+    correct = torch.zeros((), dtype=torch.long, device=device)
     total = 0
 
     with torch.no_grad():
         for images, labels in val_loader:
-            images, labels = images.to(device), labels.to(device)
-            outputs = model(images)
-            loss = criterion(outputs, labels)
+            images, labels = images.to(device, non_blocking=True), labels.to(device, non_blocking=True)
+            if channels_last:
+                images = images.contiguous(memory_format=torch.channels_last)
+            with torch.autocast(device.type, dtype=autocast_dtype, enabled=autocast_dtype is not None):
+                outputs = model(images)
+                loss = criterion(outputs, labels)
 
-            running_loss += loss.item()
-            _, predicted = outputs.max(1)
+            running_loss += loss
+            correct += outputs.argmax(1).eq(labels).sum()
             total += labels.size(0)
-            correct += predicted.eq(labels).sum().item()
 
-    return running_loss/len(val_loader), 100.*correct/total
+    val_loss, val_acc, _ = reduce_metrics(running_loss, correct, total, len(val_loader))
+    return val_loss, val_acc
 
-def main():
-    # Hyperparameters
-    num_classes = 2  # Binary classification: cancerous vs non-cancerous
-    batch_size = 32
-    num_epochs = 100
-    learning_rate = 0.001
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+def make_profiler(device, wait, active, trace_path):
+    """Profile `active` training steps after skipping `wait` steps, then write a Chrome trace."""
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if device.type == 'cuda':
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
 
+    def export(prof):
+        prof.export_chrome_trace(trace_path)
+        print(f"Profiler trace written to {trace_path}")
+
+    return torch.profiler.profile(
+        activities=activities,
+        schedule=torch.profiler.schedule(wait=wait, warmup=1, active=active, repeat=1),
+        on_trace_ready=export,
+        record_shapes=True,
+    )
+
+def get_transforms(image_size=224):
     # Data augmentation and transformation
     train_transform = A.Compose([
-        A.RandomResizedCrop(224, 224),
+        A.RandomResizedCrop(image_size, image_size),
         A.HorizontalFlip(p=0.5),
         A.VerticalFlip(p=0.5),
         A.RandomBrightnessContrast(p=0.2),
@@ -106,51 +223,197 @@ def main():
     ])
 
     val_transform = A.Compose([
-        A.Resize(224, 224),
+        A.Resize(image_size, image_size),
         A.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
         ToTensorV2()
     ])
+    return train_transform, val_transform
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Train the MobileNetV3 lesion classifier')
+    data = parser.add_mutually_exclusive_group(required=True)
+    data.add_argument('--data-dir', help='Directory with benign/ and malignant/ image folders')
+    data.add_argument('--shard-dir', help='Pre-decoded shard directory written by shards.py')
+    parser.add_argument('--arch', choices=['mobilenetv3', 'efficientnet_b3'], default='mobilenetv3',
+                        help='MobileNetV3Classifier or EnhancedModel (default: mobilenetv3)')
+    parser.add_argument('--image-size', type=int, default=224,
+                        help='Training and validation input resolution (default: 224)')
+    parser.add_argument('--epochs', type=int, default=100, help='Number of training epochs (default: 100)')
+    parser.add_argument('--batch-size', type=int, default=32,
+                        help='Batch size, per process when --distributed (default: 32)')
+    parser.add_argument('--cache-mb', type=float, default=0,
+                        help='Shared decoded-image cache budget in MB for --data-dir (default: off)')
+    parser.add_argument('--cache-size', type=int, default=256,
+                        help='Side length of cached images (default: 256)')
+    parser.add_argument('--log-every', type=int, default=50,
+                        help='Refresh the progress bar metrics every N steps (default: 50)')
+    parser.add_argument('--profile-steps', type=int, default=0,
+                        help='Capture a torch.profiler trace of N training steps in the first epoch (default: off)')
+    parser.add_argument('--profile-wait', type=int, default=5,
+                        help='Steps to skip before profiling starts (default: 5)')
+    parser.add_argument('--profile-trace', default='train_trace.json',
+                        help='Chrome trace output path (default: train_trace.json)')
+    parser.add_argument('--checkpoint-dir', default='checkpoints',
+                        help='Directory for full per-epoch checkpoints (default: checkpoints)')
+    parser.add_argument('--keep-last', type=int, default=3,
+                        help='Number of most recent checkpoints to keep (default: 3)')
+    parser.add_argument('--distributed', action='store_true',
+                        help='Data-parallel training over torch.distributed (gloo); launch with torchrun')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Intra-op threads per process (default: cores / local processes)')
+    parser.add_argument('--channels-last', action='store_true',
+                        help='Use channels_last (NHWC) memory format for the model and inputs')
+    parser.add_argument('--compile', action='store_true', help='Train a torch.compile()d model')
+    parser.add_argument('--bf16', action='store_true',
+                        help='bfloat16 autocast when the CPU supports it, fp32 otherwise')
+    parser.add_argument('--accum-steps', type=int, default=1,
+                        help='Batches per optimizer step; effective batch is batch size x accum steps (default: 1)')
+    parser.add_argument('--resume', nargs='?', const='latest',
+                        help='Resume from a checkpoint path, or the latest one in --checkpoint-dir if no path is given')
+    args = parser.parse_args()
+    if args.keep_last < 1:
+        parser.error('--keep-last must be at least 1')
+    return args
+
+def main():
+    args = parse_args()
+
+    # Hyperparameters
+    num_classes = 2  # Binary classification: cancerous vs non-cancerous
+    batch_size = args.batch_size
+    num_epochs = args.epochs
+    learning_rate = 0.001
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
-    # TODO: Replace these with your actual data paths and labels
-    # image_paths = [...] # List of image paths
-    # labels = [...] # List of corresponding labels
+    if args.distributed:
+        # Rank, world size and rendezvous come from the torchrun environment
+        dist.init_process_group(backend='gloo')
+        device = torch.device('cpu')
+        local_world_size = int(os.environ.get('LOCAL_WORLD_SIZE', 1))
+        torch.set_num_threads(args.threads or max(1, (os.cpu_count() or 1) // local_world_size))
+        if is_main_process():
+            print(f"Distributed training on {dist.get_world_size()} processes, "
+                  f"{torch.get_num_threads()} threads each")
+    elif args.threads:
+        torch.set_num_threads(args.threads)
+
+    train_transform, val_transform = get_transforms(args.image_size)
 
     # Split dataset
-    # train_paths, val_paths, train_labels, val_labels = train_test_split(
-    #     image_paths, labels, test_size=0.2, random_state=42, stratify=labels
-    # )
+    if args.shard_dir:
+        # Pre-decoded shards written by shards.py
+        labels = ShardDataset(args.shard_dir).labels
+        train_idx, val_idx = train_test_split(
+            np.arange(len(labels)), test_size=0.2, random_state=42, stratify=labels
+        )
+        train_dataset = ShardDataset(args.shard_dir, train_idx, train_transform)
+        val_dataset = ShardDataset(args.shard_dir, val_idx, val_transform)
+    else:
+        image_paths, labels = load_dataset(args.data_dir)
+        train_paths, val_paths, train_labels, val_labels = train_test_split(
+            image_paths, labels, test_size=0.2, random_state=42, stratify=labels
+        )
+        train_cache = val_cache = None
+        if args.cache_mb > 0:
+            train_mb, val_mb = split_budget(args.cache_mb, [len(train_paths), len(val_paths)])
+            train_cache = SharedImageCache(len(train_paths), train_mb, args.cache_size)
+            val_cache = SharedImageCache(len(val_paths), val_mb, args.cache_size)
+        train_dataset = LesionDataset(train_paths, train_labels, train_transform, train_cache)
+        val_dataset = LesionDataset(val_paths, val_labels, val_transform, val_cache)
 
-    # Create datasets and dataloaders
-    # train_dataset = LesionDataset(train_paths, train_labels, train_transform)
-    # val_dataset = LesionDataset(val_paths, val_labels, val_transform)
-    
-    # train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=4)
-    # val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, num_workers=4)
+    # Each process sees its own shard of the data; batch_size is per process
+    train_sampler = val_sampler = None
+    if args.distributed:
+        train_sampler = DistributedSampler(train_dataset, shuffle=True)
+        val_sampler = DistributedSampler(val_dataset, shuffle=False)
+
+    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=train_sampler is None,
+                              sampler=train_sampler, num_workers=4)
+    val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False,
+                            sampler=val_sampler, num_workers=4)
 
     # Initialize model, criterion, and optimizer
-    model = MobileNetV3Classifier(num_classes).to(device)
+    model = build_model(args.arch, num_classes).to(device)
+    if args.channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    # Unwrapped module, so checkpoints keep the plain state dict keys
+    raw_model = model
     criterion = nn.CrossEntropyLoss()
     optimizer = optim.Adam(model.parameters(), lr=learning_rate)
     scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.1, patience=5)
 
     # Training loop
+    start_epoch = 0
     best_val_acc = 0
     train_losses, train_accs = [], []
     val_losses, val_accs = [], []
 
-    for epoch in range(num_epochs):
-        print(f'\nEpoch {epoch+1}/{num_epochs}')
+    if args.resume:
+        resume_path = latest_checkpoint(args.checkpoint_dir) if args.resume == 'latest' else args.resume
+        if resume_path is None:
+            raise ValueError(f"No checkpoint found in {args.checkpoint_dir}")
+        checkpoint = torch.load(resume_path, map_location=device)
+        raw_model.load_state_dict(checkpoint['model'])
+        optimizer.load_state_dict(checkpoint['optimizer'])
+        scheduler.load_state_dict(checkpoint['scheduler'])
+        start_epoch = checkpoint['epoch'] + 1
+        best_val_acc = checkpoint['best_val_acc']
+        history = checkpoint['history']
+        train_losses, train_accs = history['train_losses'], history['train_accs']
+        val_losses, val_accs = history['val_losses'], history['val_accs']
+        if is_main_process():
+            print(f"Resumed from {resume_path} at epoch {start_epoch+1}")
+
+    if args.distributed:
+        model = DistributedDataParallel(model)
+    if args.compile:
+        model = torch.compile(model)
+
+    autocast_dtype = None
+    if args.bf16:
+        if bf16_supported(device):
+            autocast_dtype = torch.bfloat16
+        elif is_main_process():
+            print("bfloat16 is not supported on this device, training in fp32")
+    train_options = {
+        'accum_steps': args.accum_steps,
+        'autocast_dtype': autocast_dtype,
+        'channels_last': args.channels_last,
+    }
+
+    # Only rank 0 writes checkpoints and plots
+    checkpointer = AsyncCheckpointer(args.checkpoint_dir, keep_last=args.keep_last) if is_main_process() else None
+
+    for epoch in range(start_epoch, num_epochs):
+        if train_sampler is not None:
+            train_sampler.set_epoch(epoch)
+        if is_main_process():
+            print(f'\nEpoch {epoch+1}/{num_epochs}')
         
-        train_loss, train_acc = train_epoch(model, train_loader, criterion, optimizer, device)
-        val_loss, val_acc = validate(model, val_loader, criterion, device)
+        if epoch == start_epoch and args.profile_steps > 0 and is_main_process():
+            with make_profiler(device, args.profile_wait, args.profile_steps, args.profile_trace) as profiler:
+                train_loss, train_acc, timing = train_epoch(
+                    model, train_loader, criterion, optimizer, device, args.log_every, profiler, **train_options
+                )
+        else:
+            train_loss, train_acc, timing = train_epoch(
+                model, train_loader, criterion, optimizer, device, args.log_every, **train_options
+            )
+        val_loss, val_acc = validate(model, val_loader, criterion, device, autocast_dtype, args.channels_last)
         
         train_losses.append(train_loss)
         train_accs.append(train_acc)
         val_losses.append(val_loss)
         val_accs.append(val_acc)
         
-        print(f'Train Loss: {train_loss:.4f} Train Acc: {train_acc:.2f}%')
-        print(f'Val Loss: {val_loss:.4f} Val Acc: {val_acc:.2f}%')
+        if is_main_process():
+            print(f'Train Loss: {train_loss:.4f} Train Acc: {train_acc:.2f}%')
+            print(f'Val Loss: {val_loss:.4f} Val Acc: {val_acc:.2f}%')
+            print(f"Throughput: {timing['images_per_sec']:.1f} img/s "
+                  f"(data wait {timing['data_time']:.1f}s, compute {timing['compute_time']:.1f}s)")
+            for name, dataset in [('Train', train_dataset), ('Val', val_dataset)]:
+                if getattr(dataset, 'cache', None) is not None:
+                    dataset.cache.report(name)
         
         # Learning rate scheduling
         scheduler.step(val_loss)
@@ -158,7 +421,32 @@ def main():
         # Save best model
         if val_acc > best_val_acc:
             best_val_acc = val_acc
-            torch.save(model.state_dict(), 'best_model.pth')
+            if checkpointer is not None:
+                checkpointer.save_weights(raw_model.state_dict(), 'best_model.pth')
+
+        if checkpointer is None:
+            continue
+
+        # Full checkpoint for --resume, written in the background
+        checkpointer.save({
+            'epoch': epoch,
+            'model': raw_model.state_dict(),
+            'optimizer': optimizer.state_dict(),
+            'scheduler': scheduler.state_dict(),
+            'best_val_acc': best_val_acc,
+            'history': {
+                'train_losses': train_losses,
+                'train_accs': train_accs,
+                'val_losses': val_losses,
+                'val_accs': val_accs,
+            },
+        }, epoch)
+
+    if args.distributed:
+        dist.destroy_process_group()
+    if checkpointer is None:
+        return
+    checkpointer.close()
 
     # Plot training history
     plt.figure(figsize=(12, 4))
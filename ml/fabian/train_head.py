@@ -0,0 +1,97 @@
+"""
+Retrain only the classifier head from cached backbone features.
+
+The frozen backbone runs once per image (see feature_cache.py); every head
+epoch afterwards is a pass over small feature vectors, so it takes seconds.
+Cached features come from the un-augmented validation preprocessing, so this
+mode trades training-time augmentation for speed.
+
+Usage:
+    python train_head.py --data-dir /path/to/train --arch mobilenetv3 \\
+        --weights best_model.pth --cache-dir feature_cache/mobilenetv3 --output head_model.pth
+"""
+
+import argparse
+import copy
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from sklearn.model_selection import train_test_split
+from torch.utils.data import DataLoader, TensorDataset
+
+from feature_cache import FeatureCache, model_fingerprint, split_model
+from train import build_model, get_transforms, load_dataset, train_epoch, validate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the classifier head from cached backbone features')
+    parser.add_argument('--data-dir', required=True, help='Directory with benign/ and malignant/ image folders')
+    parser.add_argument('--arch', choices=['mobilenetv3', 'efficientnet_b3'], default='mobilenetv3')
+    parser.add_argument('--weights', help='Trained state dict to start from (default: ImageNet backbone)')
+    parser.add_argument('--cache-dir', required=True, help='Feature cache directory for this backbone')
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--lr', type=float, default=0.001)
+    parser.add_argument('--output', default='head_model.pth', help='Full model state dict with the new head')
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    model = build_model(args.arch, 2, pretrained=args.weights is None)
+    if args.weights:
+        model.load_state_dict(torch.load(args.weights, map_location='cpu'))
+    model = model.to(device)
+
+    backbone, head = split_model(model)
+    backbone.eval()
+    for param in backbone.parameters():
+        param.requires_grad = False
+
+    _, val_transform = get_transforms()
+    dim = next(m for m in head.modules() if isinstance(m, nn.Linear)).in_features
+    cache = FeatureCache(args.cache_dir, dim, model_fingerprint(backbone, args.arch, val_transform))
+
+    image_paths, labels = load_dataset(args.data_dir)
+    rows = cache.update(backbone, image_paths, val_transform, device)
+    labels = np.asarray(labels)
+
+    train_idx, val_idx = train_test_split(
+        np.arange(len(labels)), test_size=0.2, random_state=42, stratify=labels
+    )
+    features = cache.features()
+
+    def loader(indices, shuffle):
+        # Fancy indexing copies just these rows out of the memory map
+        dataset = TensorDataset(torch.from_numpy(features[rows[indices]]), torch.from_numpy(labels[indices]))
+        return DataLoader(dataset, batch_size=args.batch_size, shuffle=shuffle)
+
+    train_loader = loader(train_idx, True)
+    val_loader = loader(val_idx, False)
+
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(head.parameters(), lr=args.lr)
+    scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.1, patience=5)
+
+    best_val_acc = 0
+    best_head = copy.deepcopy(head.state_dict())
+    for epoch in range(args.epochs):
+        train_loss, train_acc, timing = train_epoch(head, train_loader, criterion, optimizer, device)
+        val_loss, val_acc = validate(head, val_loader, criterion, device)
+        scheduler.step(val_loss)
+        epoch_time = timing['data_time'] + timing['compute_time']
+        print(f'Epoch {epoch+1}/{args.epochs}: Train Loss {train_loss:.4f} Acc {train_acc:.2f}% | '
+              f'Val Loss {val_loss:.4f} Acc {val_acc:.2f}% | {epoch_time:.2f}s')
+
+        if val_acc > best_val_acc:
+            best_val_acc = val_acc
+            best_head = copy.deepcopy(head.state_dict())
+
+    # The head is a submodule of `model`, so this also updates the full model
+    head.load_state_dict(best_head)
+    torch.save(model.state_dict(), args.output)
+    print(f'Best Val Acc: {best_val_acc:.2f}%, model saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
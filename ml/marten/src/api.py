@@ -64,7 +64,7 @@ async def predict(file: UploadFile = File(...)) -> Dict[str, Any]:
         image = load_image(contents)
 
         # Preprocess image
-        processed_image = preprocess_image(image)
+        processed_image = preprocess_image(image, target_size=model.input_shape[:2])
 
         # Make prediction
         prediction = model.predict(processed_image)
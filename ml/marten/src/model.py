@@ -3,9 +3,9 @@ from tensorflow.keras import layers, models
 import numpy as np
 
 class SkinLesionModel:
-    def __init__(self):
+    def __init__(self, input_shape: tuple = (224, 224, 3)):
         self.model = None
-        self.input_shape = (224, 224, 3)
+        self.input_shape = tuple(input_shape)
         self.num_classes = 2  # benign and malignant
 
     def build_model(self):
@@ -52,6 +52,8 @@ class SkinLesionModel:
         """Load a saved model."""
         try:
             self.model = tf.keras.models.load_model(model_path)
+            # A saved model declares its own input resolution
+            self.input_shape = tuple(self.model.input_shape[1:])
             return True
         except Exception as e:
             print(f"Error loading model: {e}")
@@ -0,0 +1,105 @@
+import json
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+
+def gather_rows(arrays, shard_of: np.ndarray, row_of: np.ndarray, batch_indices: np.ndarray) -> np.ndarray:
+    """
+    Images ``batch_indices`` of the memory-mapped shards ``arrays``, in batch order.
+
+    Each shard the batch touches is read with one fancy-indexing call on its
+    memmap (rows in ascending order), straight into the batch array.
+    """
+    shard_ids = shard_of[batch_indices]
+    rows = row_of[batch_indices]
+    images = np.empty((len(batch_indices),) + arrays[0].shape[1:], dtype=arrays[0].dtype)
+    for shard_id in np.unique(shard_ids):
+        positions = np.flatnonzero(shard_ids == shard_id)
+        order = np.argsort(rows[positions], kind='stable')
+        images[positions[order]] = arrays[shard_id][rows[positions[order]]]
+    return images
+
+
+def load_shard_dataset(
+    shard_dir: str,
+    batch_size: int = 32,
+    image_size: Optional[Tuple[int, int]] = None,
+    shuffle: bool = True,
+    label_mode: str = 'categorical',
+    seed: Optional[int] = None,
+    resize_mode: str = 'stretch'
+) -> tf.data.Dataset:
+    """
+    Build a tf.data pipeline over shards written by ``ml/fabian/shards.py``.
+
+    Yields (images, labels) batches in the format of
+    ``image_dataset_from_directory``: float32 images in [0, 255] and
+    one-hot (``categorical``) or integer (``int``) labels. Pixels are gathered
+    straight from the memory-mapped shards into the batch, so no JPEG is
+    decoded during training.
+
+    The images approximate ``image_dataset_from_directory(image_size=...)``
+    only for shards converted with ``--resize-mode stretch`` at that size
+    (whole image resized, aspect ratio not kept). They are not identical: the
+    converter resizes with PIL's bilinear filter, which antialiases when
+    downscaling, while Keras uses ``tf.image.resize`` without antialiasing,
+    so pixel values differ slightly. The default ``crop`` shards are
+    center-cropped, so they are rejected unless ``resize_mode='crop'`` is
+    passed explicitly.
+
+    Not used by any training script yet: pass the result to
+    ``SkinLesionModel.train`` (src/model.py) in place of a directory dataset.
+
+    Args:
+        shard_dir: Directory containing ``index.json`` and the shard files
+        batch_size: Number of images per batch
+        image_size: Optional (height, width) to resize to; defaults to the stored size
+        shuffle: Whether to reshuffle sample order every epoch
+        label_mode: 'categorical' or 'int'
+        seed: Optional shuffle seed
+        resize_mode: Resize mode the shards must have been written with
+
+    Returns:
+        A batched, prefetching tf.data.Dataset
+    """
+    with open(os.path.join(shard_dir, 'index.json')) as f:
+        index = json.load(f)
+    # Shards written before resize modes existed are center-cropped
+    stored_mode = index.get('resize_mode', 'crop')
+    if stored_mode != resize_mode:
+        raise ValueError(
+            f"{shard_dir} holds '{stored_mode}' shards but '{resize_mode}' was requested; "
+            "convert with ml/fabian/shards.py --resize-mode stretch to approximate image_dataset_from_directory"
+        )
+
+    arrays = [np.load(os.path.join(shard_dir, s['file']), mmap_mode='r') for s in index['shards']]
+    counts = [s['count'] for s in index['shards']]
+    shard_of = np.repeat(np.arange(len(counts)), counts)
+    row_of = np.concatenate([np.arange(c) for c in counts])
+    labels = np.asarray(index['labels'], dtype=np.int32)
+    height, width = index['height'], index['width']
+    num_classes = len(index['classes'])
+
+    def gather(batch_indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return gather_rows(arrays, shard_of, row_of, batch_indices), labels[batch_indices]
+
+    def load_batch(batch_indices):
+        images, batch_labels = tf.numpy_function(gather, [batch_indices], [tf.uint8, tf.int32])
+        images.set_shape([None, height, width, 3])
+        batch_labels.set_shape([None])
+        images = tf.cast(images, tf.float32)
+        if image_size is not None and tuple(image_size) != (height, width):
+            images = tf.image.resize(images, image_size)
+        if label_mode == 'categorical':
+            batch_labels = tf.one_hot(batch_labels, num_classes)
+        return images, batch_labels
+
+    dataset = tf.data.Dataset.range(len(labels))
+    if shuffle:
+        dataset = dataset.shuffle(len(labels), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(load_batch, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Offline Batched Evaluation
+Scores a full test set in-process with any model registered in
+scoring-api/app/models/registry.py, instead of POSTing images one at a time
+to the API. Images are streamed through a multi-worker DataLoader and all
+metrics are computed with vectorized numpy.
+
+Predictions are kept in a results store (see results_store.py) keyed by
+weights hash, image hash and preprocessing version: only images the model has
+not scored yet are run, and the report is built from the store.
+
+With --precision-report, every precision the API can serve with (fp32,
+bf16 autocast, bf16 weights) is run over the test set instead and compared
+with fp32: top-1 agreement, confidence drift, accuracy and latency.
+
+Usage:
+    python offline_eval.py --data-dir "/path/to/data/test" --model mobilenetv3 \\
+        --weights scoring-api/app/models/efficientnet_b3_model.pth --output eval_report.json \\
+        --store eval_results.sqlite
+    python offline_eval.py --data-dir "/path/to/data/test" --model mobilenetv3 --precision-report
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scoring-api'))
+
+from app.models.loader import load_model  # noqa: E402
+from app.models.precision import PRECISIONS, cpu_supports_bf16  # noqa: E402
+from app.models.registry import DEFAULT_WEIGHTS, MODELS, build_transform, preprocessing_id  # noqa: E402
+from results_store import ResultsStore, file_hash  # noqa: E402
+
+CLASSES = ['benign', 'malignant']
+IMAGE_EXTENSIONS = ('*.jpg', '*.jpeg', '*.png')
+
+
+def list_images(data_dir):
+    """Image paths under benign/ and malignant/ subfolders with labels 0 and 1."""
+    paths, labels = [], []
+    for label, name in enumerate(CLASSES):
+        folder = os.path.join(data_dir, name)
+        found = sorted(p for ext in IMAGE_EXTENSIONS for p in glob.glob(os.path.join(folder, ext)))
+        paths.extend(found)
+        labels.extend([label] * len(found))
+    return paths, labels
+
+
+class ImageDataset(Dataset):
+    def __init__(self, paths, transform):
+        self.paths = paths
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, idx):
+        image = Image.open(self.paths[idx]).convert('RGB')
+        return self.transform(image)
+
+
+def roc_auc(labels, scores):
+    """Rank-based (Mann-Whitney) ROC-AUC; tied scores get their average rank."""
+    n_pos = int(labels.sum())
+    n_neg = len(labels) - n_pos
+    if n_pos == 0 or n_neg == 0:
+        return None
+    order = np.argsort(scores, kind='mergesort')
+    # Each group of tied scores gets the mean of the 1-based ranks it spans
+    _, first, counts = np.unique(scores[order], return_index=True, return_counts=True)
+    ranks = np.empty(len(scores))
+    ranks[order] = np.repeat(first + (counts + 1) / 2.0, counts)
+    return float((ranks[labels == 1].sum() - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg))
+
+
+def calibration(labels, probs, bins):
+    """Reliability table, expected calibration error and Brier score of the top-1 confidence."""
+    predictions = probs.argmax(1)
+    confidence = probs.max(1)
+    correct = (predictions == labels).astype(float)
+
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    bin_idx = np.clip(np.digitize(confidence, edges[1:-1], right=True), 0, bins - 1)
+    counts = np.bincount(bin_idx, minlength=bins)
+    conf_sum = np.bincount(bin_idx, weights=confidence, minlength=bins)
+    acc_sum = np.bincount(bin_idx, weights=correct, minlength=bins)
+    nonempty = counts > 0
+    mean_conf = np.divide(conf_sum, counts, out=np.zeros(bins), where=nonempty)
+    mean_acc = np.divide(acc_sum, counts, out=np.zeros(bins), where=nonempty)
+
+    ece = float((counts * np.abs(mean_acc - mean_conf)).sum() / max(len(labels), 1))
+    one_hot = np.eye(probs.shape[1])[labels]
+    brier = float(((probs - one_hot) ** 2).sum(1).mean())
+    table = [
+        {'lower': float(edges[i]), 'upper': float(edges[i + 1]), 'count': int(counts[i]),
+         'confidence': float(mean_conf[i]), 'accuracy': float(mean_acc[i])}
+        for i in range(bins) if nonempty[i]
+    ]
+    return {'ece': ece, 'brier': brier, 'reliability': table}
+
+
+def _ratio(num, den):
+    return float(num / den) if den else None
+
+
+def compute_metrics(labels, probs, bins=10):
+    """
+    Classification metrics for malignant (class 1) vs benign (class 0).
+
+    Args:
+        labels: Integer array of true labels, shape (N,)
+        probs: Softmax probabilities, shape (N, 2)
+        bins: Number of confidence bins for calibration
+
+    Returns:
+        Dictionary with confusion matrix, sensitivity, specificity, ROC-AUC and calibration
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    probs = np.asarray(probs, dtype=np.float64)
+    predictions = probs.argmax(1)
+
+    # confusion[true, predicted]
+    confusion = np.bincount(labels * 2 + predictions, minlength=4).reshape(2, 2)
+    tn, fp, fn, tp = confusion.ravel()
+    sensitivity = _ratio(tp, tp + fn)
+    precision = _ratio(tp, tp + fp)
+    f1 = (2 * precision * sensitivity / (precision + sensitivity)
+          if precision and sensitivity else None)
+
+    return {
+        'samples': int(len(labels)),
+        'class_counts': {name: int(n) for name, n in zip(CLASSES, np.bincount(labels, minlength=2))},
+        'confusion_matrix': confusion.tolist(),
+        'accuracy': _ratio(tp + tn, len(labels)),
+        'sensitivity': sensitivity,
+        'specificity': _ratio(tn, tn + fp),
+        'precision': precision,
+        'f1': f1,
+        'roc_auc': roc_auc(labels, probs[:, 1]),
+        'calibration': calibration(labels, probs, bins),
+    }
+
+
+def evaluate(model, loader, device):
+    """Run the model over the loader; returns (probabilities, seconds)."""
+    all_probs = []
+    start = time.perf_counter()
+    with torch.inference_mode():
+        for images in loader:
+            logits = model(images.to(device, non_blocking=True))
+            all_probs.append(torch.softmax(logits.float(), dim=1).cpu().numpy())
+    elapsed = time.perf_counter() - start
+    return np.concatenate(all_probs) if all_probs else np.empty((0, 2)), elapsed
+
+
+def _forward_ms(model, images):
+    start = time.perf_counter()
+    logits = model(images)
+    return torch.softmax(logits.float(), dim=1).cpu().numpy(), (time.perf_counter() - start) * 1000
+
+
+def precision_parity(model_name, weights, loader, device, latency_images=32):
+    """
+    Score the loader with every precision in ``PRECISIONS`` and compare each with fp32.
+
+    Each batch is decoded once and run through all precisions, and only the
+    forward passes are timed. Single-image latency is measured on the first
+    ``latency_images`` images of the first batch.
+
+    Returns:
+        (probabilities per precision, dictionary of timings and agreement per precision)
+    """
+    models = {precision: load_model(model_name, weights, device, precision=precision)[0]
+              for precision in PRECISIONS}
+    probs = {precision: [] for precision in PRECISIONS}
+    batch_ms = {precision: 0.0 for precision in PRECISIONS}
+    single_ms = {precision: [] for precision in PRECISIONS}
+    with torch.inference_mode():
+        for i, images in enumerate(loader):
+            images = images.to(device, non_blocking=True)
+            if i == 0:
+                for precision, model in models.items():
+                    # The first bf16 call also creates the oneDNN kernels; keep it out of the timings
+                    _forward_ms(model, images[:1])
+                    for image in images[:latency_images]:
+                        single_ms[precision].append(_forward_ms(model, image.unsqueeze(0))[1])
+            for precision, model in models.items():
+                batch_probs, ms = _forward_ms(model, images)
+                probs[precision].append(batch_probs)
+                batch_ms[precision] += ms
+
+    probs = {precision: np.concatenate(p) if p else np.empty((0, 2)) for precision, p in probs.items()}
+    reference = probs['fp32']
+    images = len(reference)
+    results = {}
+    for precision in PRECISIONS:
+        p = probs[precision]
+        drift = np.abs(p[:, 1] - reference[:, 1])
+        latencies = np.array(single_ms[precision])
+        results[precision] = {
+            'top1_agreement': _ratio((p.argmax(1) == reference.argmax(1)).sum(), images),
+            'disagreements': int((p.argmax(1) != reference.argmax(1)).sum()),
+            'malignant_probability_drift': {
+                'mean': float(drift.mean()) if images else None,
+                'p99': float(np.percentile(drift, 99)) if images else None,
+                'max': float(drift.max()) if images else None,
+            },
+            'confidence_drift_mean': float((p.max(1) - reference.max(1)).mean()) if images else None,
+            'batch_images_per_sec': images / (batch_ms[precision] / 1000) if batch_ms[precision] else None,
+            'single_image_ms': {
+                'p50': float(np.percentile(latencies, 50)) if len(latencies) else None,
+                'p95': float(np.percentile(latencies, 95)) if len(latencies) else None,
+            },
+        }
+    return probs, results
+
+
+def run_precision_report(args, model_name, weights, paths, labels, device):
+    """``--precision-report``: parity and latency of each precision against fp32."""
+    if device.type == 'cpu' and not cpu_supports_bf16():
+        print("⚠️  This CPU has no native bf16 (AVX512-BF16/AMX): bf16 is emulated, so its latency "
+              "is not representative; the API would serve fp32 here")
+    input_size = load_model(model_name, weights, device)[1]
+    loader = DataLoader(ImageDataset(paths, build_transform(input_size)), batch_size=args.batch_size,
+                        shuffle=False, num_workers=args.workers, pin_memory=device.type == 'cuda')
+    print(f"🔍 Comparing {', '.join(PRECISIONS)} for {model_name} ({input_size}x{input_size}) "
+          f"on {len(paths)} images...")
+    probs, results = precision_parity(model_name, weights, loader, device)
+
+    labels = np.asarray(labels)
+    for precision in PRECISIONS:
+        metrics = compute_metrics(labels, probs[precision], args.bins)
+        results[precision].update({'accuracy': metrics['accuracy'], 'roc_auc': metrics['roc_auc'],
+                                   'ece': metrics['calibration']['ece']})
+    report = {
+        'model': model_name,
+        'weights': weights,
+        'weights_hash': file_hash(weights),
+        'input_size': input_size,
+        'data_dir': args.data_dir,
+        'images': len(paths),
+        'device': str(device),
+        'native_bf16': cpu_supports_bf16() if device.type == 'cpu' else torch.cuda.is_bf16_supported(),
+        'torch_threads': torch.get_num_threads(),
+        'precisions': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'precision':<14} {'agree':>7} {'drift mean':>11} {'drift max':>10} {'accuracy':>9} "
+          f"{'img/s':>7} {'1-img p50':>10}")
+    for precision, r in results.items():
+        drift = r['malignant_probability_drift']
+        print(f"{precision:<14} {r['top1_agreement']:>7.2%} {drift['mean']:>11.5f} {drift['max']:>10.5f} "
+              f"{r['accuracy']:>9.1%} {r['batch_images_per_sec'] or 0:>7.1f} "
+              f"{r['single_image_ms']['p50'] or 0:>8.1f}ms")
+    print(f"💾 Report written to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batched in-process evaluation of a registered model')
+    parser.add_argument('--data-dir', required=True, help='Directory with benign/ and malignant/ image folders')
+    parser.add_argument('--model', choices=sorted(MODELS), default='mobilenetv3')
+    parser.add_argument('--weights', help='Weights file (default: the model\'s bundled weights)')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=4, help='DataLoader worker processes (default: 4)')
+    parser.add_argument('--bins', type=int, default=10, help='Calibration bins (default: 10)')
+    parser.add_argument('--per-image', action='store_true', help='Include every image\'s prediction in the report')
+    parser.add_argument('--precision-report', action='store_true',
+                        help='Compare fp32, bf16 autocast and bf16 weights instead (results store not used)')
+    parser.add_argument('--output', default='eval_report.json')
+    parser.add_argument('--store', default='eval_results.sqlite', help='Results store (default: eval_results.sqlite)')
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    weights = args.weights or DEFAULT_WEIGHTS[args.model]
+    paths, labels = list_images(args.data_dir)
+    if not paths:
+        sys.exit(f"❌ No images found under {args.data_dir}/{{{','.join(CLASSES)}}}")
+    if args.precision_report:
+        run_precision_report(args, args.model, weights, paths, labels, device)
+        return
+
+    store = ResultsStore(args.store)
+    image_hashes = [file_hash(path) for path in paths]
+    store.add_images(image_hashes, paths, labels)
+    weights_hash = file_hash(weights)
+
+    model, input_size = load_model(args.model, weights, device)
+    preprocessing = preprocessing_id(input_size)
+    missing = set(store.missing(weights_hash, preprocessing, image_hashes))
+    # The same image may appear twice in the test set; score it once
+    todo = list({h: p for h, p in zip(image_hashes, paths) if h in missing}.items())
+    print(f"🔍 Evaluating {args.model} ({input_size}x{input_size}) on {len(paths)} images, "
+          f"{len(todo)} not in {args.store}...")
+
+    elapsed = 0.0
+    if todo:
+        loader = DataLoader(ImageDataset([p for _, p in todo], build_transform(input_size)),
+                            batch_size=args.batch_size, shuffle=False, num_workers=args.workers,
+                            pin_memory=device.type == 'cuda')
+        probs, elapsed = evaluate(model, loader, device)
+        store.add_predictions(args.model, weights_hash, preprocessing, [h for h, _ in todo], probs)
+
+    probs = store.predictions(weights_hash, preprocessing, image_hashes)
+    store.close()
+    labels = np.asarray(labels)
+    metrics = compute_metrics(labels, probs, args.bins)
+
+    report = {
+        'model': args.model,
+        'weights': weights,
+        'weights_hash': weights_hash,
+        'input_size': input_size,
+        'preprocessing': preprocessing,
+        'data_dir': args.data_dir,
+        'inference': {
+            'images': len(todo),
+            'cached': len(paths) - len(todo),
+            'seconds': elapsed,
+            'images_per_sec': len(todo) / elapsed if elapsed else None,
+        },
+        'metrics': metrics,
+    }
+    if args.per_image:
+        report['predictions'] = [
+            {'path': path, 'true_label': int(label), 'predicted_class': int(p.argmax()),
+             'confidence': float(p.max())}
+            for path, label, p in zip(paths, labels, probs)
+        ]
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    auc = metrics['roc_auc']
+    print(f"📊 Accuracy:    {metrics['accuracy']:.1%}")
+    print(f"   Sensitivity: {metrics['sensitivity'] or 0:.1%}")
+    print(f"   Specificity: {metrics['specificity'] or 0:.1%}")
+    print(f"   ROC-AUC:     {auc:.3f}" if auc is not None else "   ROC-AUC:     n/a (single class)")
+    print(f"   ECE:         {metrics['calibration']['ece']:.3f}")
+    if todo:
+        print(f"⚡ {len(todo)} images scored in {elapsed:.1f}s ({len(todo) / elapsed:.1f} images/s), "
+              f"{len(paths) - len(todo)} from the store")
+    else:
+        print(f"⚡ All {len(paths)} predictions served from the store")
+    print(f"💾 Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
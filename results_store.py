@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Evaluation Results Store
+Local SQLite cache of model predictions keyed by (weights hash, image hash,
+preprocessing version), so evaluations only run inference for pairs that are
+not stored yet and reports can be regenerated without touching a model.
+
+Usage:
+    python results_store.py --db eval_results.sqlite   # summary of every stored model
+"""
+
+import argparse
+import hashlib
+import sqlite3
+import time
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    image_hash TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    label INTEGER
+);
+CREATE TABLE IF NOT EXISTS predictions (
+    weights_hash TEXT NOT NULL,
+    image_hash TEXT NOT NULL,
+    preprocessing TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prob_benign REAL NOT NULL,
+    prob_malignant REAL NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (weights_hash, image_hash, preprocessing)
+);
+"""
+
+# SQLite caps the number of bound parameters per statement
+_CHUNK = 500
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def bytes_hash(data):
+    """SHA-256 of in-memory image bytes; matches file_hash of the same file."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _chunks(items):
+    for i in range(0, len(items), _CHUNK):
+        yield items[i:i + _CHUNK]
+
+
+class ResultsStore:
+    """Predictions of (model weights, preprocessing) on images, stored by content hash."""
+
+    def __init__(self, path='eval_results.sqlite'):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_images(self, image_hashes, paths, labels=None):
+        """Record where images live and, if known, their true labels."""
+        labels = labels if labels is not None else [None] * len(image_hashes)
+        rows = [(h, p, None if l is None else int(l)) for h, p, l in zip(image_hashes, paths, labels)]
+        with self.conn:
+            self.conn.executemany(
+                'INSERT INTO images (image_hash, path, label) VALUES (?, ?, ?) '
+                'ON CONFLICT(image_hash) DO UPDATE SET path = excluded.path, '
+                'label = COALESCE(excluded.label, images.label)',
+                rows,
+            )
+
+    def missing(self, weights_hash, preprocessing, image_hashes):
+        """The subset of ``image_hashes`` without a stored prediction, in input order."""
+        stored = set()
+        for chunk in _chunks(list(image_hashes)):
+            placeholders = ','.join('?' * len(chunk))
+            stored.update(row[0] for row in self.conn.execute(
+                f'SELECT image_hash FROM predictions WHERE weights_hash = ? AND preprocessing = ? '
+                f'AND image_hash IN ({placeholders})',
+                [weights_hash, preprocessing, *chunk],
+            ))
+        return [h for h in image_hashes if h not in stored]
+
+    def add_predictions(self, model, weights_hash, preprocessing, image_hashes, probs):
+        """Store softmax probabilities, shape (N, 2), for ``image_hashes``."""
+        now = time.time()
+        rows = [(weights_hash, h, preprocessing, model, float(p[0]), float(p[1]), now)
+                for h, p in zip(image_hashes, probs)]
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO predictions (weights_hash, image_hash, preprocessing, model, '
+                'prob_benign, prob_malignant, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows,
+            )
+
+    def predictions(self, weights_hash, preprocessing, image_hashes):
+        """Stored probabilities for ``image_hashes`` as an (N, 2) array in input order."""
+        found = {}
+        for chunk in _chunks(list(image_hashes)):
+            placeholders = ','.join('?' * len(chunk))
+            for h, benign, malignant in self.conn.execute(
+                f'SELECT image_hash, prob_benign, prob_malignant FROM predictions '
+                f'WHERE weights_hash = ? AND preprocessing = ? AND image_hash IN ({placeholders})',
+                [weights_hash, preprocessing, *chunk],
+            ):
+                found[h] = (benign, malignant)
+        return np.array([found[h] for h in image_hashes], dtype=np.float64).reshape(-1, 2)
+
+    def labelled_predictions(self, weights_hash, preprocessing):
+        """(image hashes, labels, probabilities) of every stored prediction on a labelled image."""
+        rows = self.conn.execute(
+            'SELECT p.image_hash, i.label, p.prob_benign, p.prob_malignant FROM predictions p '
+            'JOIN images i ON i.image_hash = p.image_hash '
+            'WHERE p.weights_hash = ? AND p.preprocessing = ? AND i.label IS NOT NULL '
+            'ORDER BY i.path',
+            (weights_hash, preprocessing),
+        ).fetchall()
+        hashes = [r[0] for r in rows]
+        labels = np.array([r[1] for r in rows], dtype=np.int64)
+        probs = np.array([r[2:] for r in rows], dtype=np.float64).reshape(-1, 2)
+        return hashes, labels, probs
+
+    def runs(self):
+        """Every stored (model, weights hash, preprocessing) with its prediction count."""
+        return self.conn.execute(
+            'SELECT model, weights_hash, preprocessing, COUNT(*), MAX(created_at) FROM predictions '
+            'GROUP BY model, weights_hash, preprocessing ORDER BY MAX(created_at)'
+        ).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize stored evaluation results')
+    parser.add_argument('--db', default='eval_results.sqlite')
+    args = parser.parse_args()
+
+    with ResultsStore(args.db) as store:
+        runs = store.runs()
+        if not runs:
+            print(f"No predictions stored in {args.db}")
+            return
+        print(f"{'model':<16} {'weights':<12} {'preprocessing':<14} {'images':>7} {'labelled':>9} {'accuracy':>9}")
+        for model, weights_hash, preprocessing, count, _ in runs:
+            _, labels, probs = store.labelled_predictions(weights_hash, preprocessing)
+            accuracy = f"{(probs.argmax(1) == labels).mean():.1%}" if len(labels) else 'n/a'
+            print(f"{model:<16} {weights_hash[:12]:<12} {preprocessing:<14} {count:>7} {len(labels):>9} {accuracy:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Run the service, or profile its startup.
+
+Usage:
+    python -m app                                   # serve on 0.0.0.0:4000
+    python -m app --profile-startup [--json]        # time each startup phase and exit
+"""
+
+import argparse
+import json
+import os
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Model Inference API')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Time import, build, weight load and first forward, then exit')
+    parser.add_argument('--json', action='store_true', help='Print the startup profile as JSON')
+    parser.add_argument('--model', default=os.environ.get('MODEL_NAME', 'mobilenetv3'))
+    parser.add_argument('--weights', default=os.environ.get('MODEL_PATH'),
+                        help='Weights file (default: MODEL_PATH or the bundled weights)')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=4000)
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        from app.startup_profile import profile_startup
+        report = profile_startup(args.model, args.weights)
+        if args.json:
+            print(json.dumps(report))
+            return
+        print(f"Startup profile for {report['model']} ({report['weights']}, {report['input_size']}px)")
+        for phase, ms in report['phases_ms'].items():
+            print(f"  {phase:<16} {ms:>9.1f} ms")
+        return
+
+    import uvicorn
+    # app.main reads the model settings from the environment
+    if args.weights:
+        os.environ['MODEL_PATH'] = args.weights
+    os.environ['MODEL_NAME'] = args.model
+    uvicorn.run('app.main:app', host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
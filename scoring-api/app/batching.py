@@ -0,0 +1,291 @@
+"""
+Dynamic batching with an adaptive batch size and queue wait.
+
+Requests queue up in ``AdaptiveBatcher``; one batch at a time is formed
+from the oldest request plus whatever arrives within ``max_wait`` (up to
+``max_batch`` requests) and scored in one forward pass on a worker thread.
+
+``BatchController`` re-tunes ``max_batch`` and ``max_wait`` every few
+seconds from what the batcher measured:
+
+- the time per batch size (``BatchCostModel``: a moving average per observed
+  size, extrapolated linearly to sizes not seen yet),
+- the arrival rate over a sliding window and the p95 latency (queue wait +
+  batch inference) since the previous update.
+
+A request can arrive just after a batch started, wait for it, wait up to
+``max_wait`` for its own batch to fill and then wait for that batch, so
+``max_batch`` is the largest size with ``2 * time(max_batch) + max_wait``
+within the latency budget. ``max_wait`` is the time the arrival rate needs
+to fill such a batch, capped by what is left of the budget, and zero when
+fewer than half a request would arrive meanwhile (quiet hours). The budget
+starts at 80% of the SLO and is cut whenever the measured p95 exceeds the
+SLO (unless arrivals outpace full batches, where only bigger batches help),
+then grown back slowly while there is headroom.
+"""
+
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+import torch
+
+from app.inference import InferenceError
+
+logger = logging.getLogger(__name__)
+
+
+class SlidingWindow:
+    """Timestamped samples of the last ``seconds`` seconds."""
+
+    def __init__(self, seconds: float = 10.0):
+        self.seconds = seconds
+        self._samples: Deque[Tuple[float, float]] = deque()
+
+    def add(self, value: float, now: Optional[float] = None) -> None:
+        self._samples.append((time.monotonic() if now is None else now, value))
+
+    def values(self, now: Optional[float] = None, since: Optional[float] = None) -> List[float]:
+        """Values in the window, or only those added after ``since``."""
+        cutoff = (time.monotonic() if now is None else now) - self.seconds
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        if since is None:
+            return [value for _, value in self._samples]
+        return [value for timestamp, value in self._samples if timestamp > since]
+
+    def rate(self, now: Optional[float] = None) -> float:
+        """Samples per second over the window."""
+        return len(self.values(now)) / self.seconds
+
+    def percentile(self, q: float, now: Optional[float] = None, since: Optional[float] = None) -> Optional[float]:
+        values = sorted(self.values(now, since))
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class BatchCostModel:
+    """Forward-pass time per batch size: a moving average per size, linear in between and beyond."""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.ms: Dict[int, float] = {}
+
+    def observe(self, batch_size: int, ms: float) -> None:
+        previous = self.ms.get(batch_size)
+        self.ms[batch_size] = ms if previous is None else previous + self.alpha * (ms - previous)
+
+    @property
+    def largest_observed(self) -> int:
+        return max(self.ms, default=0)
+
+    def predict(self, batch_size: int) -> Optional[float]:
+        if batch_size in self.ms:
+            return self.ms[batch_size]
+        sizes = sorted(self.ms)
+        if not sizes:
+            return None
+        if len(sizes) == 1:
+            # One size seen: assume no gain from batching until a second size is measured
+            return self.ms[sizes[0]] * batch_size / sizes[0]
+        if sizes[0] < batch_size < sizes[-1]:
+            # Interpolate between the neighbouring observed sizes
+            i = bisect.bisect(sizes, batch_size)
+            lo, hi = sizes[i - 1], sizes[i]
+            return self.ms[lo] + (self.ms[hi] - self.ms[lo]) * (batch_size - lo) / (hi - lo)
+        # Outside the observed sizes: least-squares line through the averages
+        mean_x = sum(sizes) / len(sizes)
+        mean_y = sum(self.ms[b] for b in sizes) / len(sizes)
+        slope = max(0.0, sum((b - mean_x) * (self.ms[b] - mean_y) for b in sizes)
+                    / sum((b - mean_x) ** 2 for b in sizes))
+        ms = mean_y + slope * (batch_size - mean_x)
+        # Never predict a larger batch to be faster than the largest one measured
+        return max(ms, self.ms[sizes[-1]]) if batch_size > sizes[-1] else max(ms, 0.0)
+
+
+class BatchController:
+    """Chooses ``max_batch`` and ``max_wait_ms`` to keep p95 latency under ``slo_ms``."""
+
+    def __init__(self, slo_ms: float, batch_limit: int = 32, initial_budget: float = 0.8,
+                 min_budget: float = 0.2, max_budget: float = 0.9):
+        self.slo_ms = slo_ms
+        self.batch_limit = batch_limit
+        self.budget = initial_budget
+        self.min_budget = min_budget
+        self.max_budget = max_budget
+        self.max_batch = 1
+        self.max_wait_ms = 0.0
+
+    def update(self, costs: BatchCostModel, arrival_rate: float, p95_ms: Optional[float]) -> None:
+        """
+        Re-tune the batch size and wait.
+
+        Args:
+            costs: Measured batch times
+            arrival_rate: Requests per second
+            p95_ms: p95 latency since the previous update, None without traffic
+        """
+        batch_ms = costs.predict(self.max_batch)
+        overloaded = batch_ms is not None and arrival_rate * batch_ms / 1000.0 > self.max_batch
+        if p95_ms is not None:
+            # An SLO miss while arrivals outpace full batches is queueing; a smaller budget would only
+            # shrink batches and make it worse, so the budget is only cut when there is spare capacity
+            if p95_ms > self.slo_ms and not overloaded:
+                self.budget = max(self.min_budget, self.budget * 0.8)
+            elif p95_ms < 0.7 * self.slo_ms:
+                self.budget = min(self.max_budget, self.budget + 0.02)
+        budget_ms = self.budget * self.slo_ms
+
+        # Sizes far beyond what has been measured rely on extrapolation; grow at most 2x per update
+        ceiling = min(self.batch_limit, max(2, 2 * costs.largest_observed))
+        max_batch = 1
+        for batch_size in range(1, ceiling + 1):
+            ms = costs.predict(batch_size)
+            if ms is None or 2 * ms <= budget_ms:
+                max_batch = batch_size
+            else:
+                break
+        self.max_batch = max_batch
+
+        batch_ms = costs.predict(max_batch) or 0.0
+        slack_ms = max(0.0, budget_ms - 2 * batch_ms)
+        if arrival_rate <= 0 or max_batch == 1:
+            self.max_wait_ms = 0.0
+            return
+        fill_ms = 1000.0 * (max_batch - 1) / arrival_rate
+        wait_ms = min(fill_ms, slack_ms)
+        # Not worth delaying a request for less than half an expected arrival
+        self.max_wait_ms = wait_ms if arrival_rate * wait_ms / 1000.0 >= 0.5 else 0.0
+
+    def describe(self) -> Dict:
+        return {
+            'slo_ms': self.slo_ms,
+            'budget_ms': round(self.budget * self.slo_ms, 1),
+            'max_batch': self.max_batch,
+            'max_wait_ms': round(self.max_wait_ms, 2),
+        }
+
+
+class _Pending:
+    __slots__ = ('tensor', 'future', 'arrival')
+
+    def __init__(self, tensor: torch.Tensor, future: asyncio.Future, arrival: float):
+        self.tensor = tensor
+        self.future = future
+        self.arrival = arrival
+
+
+class AdaptiveBatcher:
+    """Batches single-image requests into one forward pass; see the module docstring."""
+
+    def __init__(self, predict_batch: Callable[[torch.Tensor], List], controller: BatchController,
+                 window_seconds: float = 10.0, update_interval: float = 2.0):
+        self.predict_batch = predict_batch
+        self.controller = controller
+        self.costs = BatchCostModel()
+        self.arrivals = SlidingWindow(window_seconds)
+        self.latencies = SlidingWindow(window_seconds)
+        self.update_interval = update_interval
+        self.batches = 0
+        self.requests = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_update = 0.0
+        # Decisions and measurements are read by /metrics while the batch loop updates them
+        self._lock = threading.Lock()
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, tensor: torch.Tensor):
+        """Queue one preprocessed 1 x 3 x H x W input and wait for its prediction."""
+        future = asyncio.get_running_loop().create_future()
+        now = time.monotonic()
+        with self._lock:
+            self.arrivals.add(1.0, now)
+            # Also re-tuned on arrival, so the first request after a quiet period sees the quiet-period wait
+            self._maybe_update(now)
+        self._queue.put_nowait(_Pending(tensor, future, now))
+        return await future
+
+    def _maybe_update(self, now: float) -> None:
+        if now - self._last_update >= self.update_interval:
+            recent_p95 = self.latencies.percentile(0.95, now, since=self._last_update)
+            self.controller.update(self.costs, self.arrivals.rate(now), recent_p95)
+            self._last_update = now
+
+    async def _next_batch(self) -> List[_Pending]:
+        batch = [await self._queue.get()]
+        max_batch, max_wait = self.controller.max_batch, self.controller.max_wait_ms / 1000.0
+        # The wait counts from the oldest request's arrival, not from when the loop got to it
+        deadline = batch[0].arrival + max_wait
+        while len(batch) < max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            start = time.monotonic()
+            try:
+                results = await loop.run_in_executor(
+                    None, self.predict_batch, torch.cat([pending.tensor for pending in batch]))
+            except Exception as e:
+                logger.error(f"Batch of {len(batch)} failed: {str(e)}", exc_info=True)
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(InferenceError(f"Model prediction failed: {str(e)}"))
+                continue
+            done = time.monotonic()
+            for pending, result in zip(batch, results):
+                if not pending.future.done():
+                    pending.future.set_result(result)
+
+            with self._lock:
+                self.costs.observe(len(batch), (done - start) * 1000)
+                for pending in batch:
+                    self.latencies.add((done - pending.arrival) * 1000, done)
+                self.batches += 1
+                self.requests += len(batch)
+                self._maybe_update(done)
+
+    def describe(self) -> Dict:
+        """Current decisions and the measurements they were based on."""
+        with self._lock:
+            p95 = self.latencies.percentile(0.95)
+            return {
+                **self.controller.describe(),
+                'arrival_rate': round(self.arrivals.rate(), 2),
+                'p95_ms': None if p95 is None else round(p95, 1),
+                'batch_ms': {size: round(ms, 2) for size, ms in sorted(self.costs.ms.items())},
+                'queued': self._queue.qsize() if self._queue is not None else 0,
+                'batches': self.batches,
+                'requests': self.requests,
+            }
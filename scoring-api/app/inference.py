@@ -0,0 +1,141 @@
+"""
+Decode, preprocess and score a single image.
+
+Shared by every execution mode of the API (inline, threadpool, the
+process-pool workers in ``app/process_pool.py`` and the batcher in
+``app/batching.py``), so they all return the same results and error
+messages.
+"""
+
+import io
+import time
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import torch
+import torch.nn as nn
+from PIL import Image, UnidentifiedImageError
+
+from app.models.registry import IMAGENET_MEAN, IMAGENET_STD
+
+Prediction = Tuple[int, float, List[float]]
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class InferenceError(Exception):
+    """A prediction step failed because of the input; the message is returned to the client as is."""
+
+
+def score_batch(model: nn.Module, batch: torch.Tensor) -> List[Prediction]:
+    """(predicted class, confidence, probability per class) for each image of a preprocessed batch."""
+    with torch.no_grad():
+        probabilities = torch.softmax(model(batch), dim=1).cpu()
+    predictions = []
+    for row in probabilities.tolist():
+        predicted_class = max(range(len(row)), key=row.__getitem__)
+        predictions.append((predicted_class, float(row[predicted_class]), row))
+    return predictions
+
+
+def _invalid_image(error: Exception) -> InferenceError:
+    # PIL's message for unrecognized data embeds the repr of the BytesIO it was given
+    reason = "cannot identify image file" if isinstance(error, UnidentifiedImageError) else str(error)
+    return InferenceError(f"Invalid image format: {reason}")
+
+
+def prepare_image(transform: Callable, device: torch.device, contents: Buffer) -> torch.Tensor:
+    """Decode an encoded image (JPEG, PNG, ...) of any size into a 1 x 3 x H x W model input."""
+    # Failures are reported through the request's log record (app/request_log.py), not logged here
+    try:
+        image = Image.open(io.BytesIO(contents))
+    except Exception as img_error:
+        raise _invalid_image(img_error)
+
+    # Convert to RGB if necessary
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    try:
+        image_tensor = transform(image).unsqueeze(0).to(device)
+    except Exception as transform_error:
+        raise InferenceError(f"Image preprocessing failed: {str(transform_error)}")
+    return image_tensor
+
+
+_pixel_norms = {}
+
+
+def _pixel_norm(device: torch.device) -> Tuple[torch.Tensor, torch.Tensor]:
+    # ToTensor + Normalize fused into one multiply-add per channel
+    if device not in _pixel_norms:
+        scale = torch.tensor([1.0 / (255.0 * std) for std in IMAGENET_STD], device=device).view(3, 1, 1)
+        shift = torch.tensor([-mean / std for mean, std in zip(IMAGENET_MEAN, IMAGENET_STD)],
+                             device=device).view(3, 1, 1)
+        _pixel_norms[device] = (scale, shift)
+    return _pixel_norms[device]
+
+
+def prepare_pixels(device: torch.device, pixels: torch.Tensor) -> torch.Tensor:
+    """Normalize height x width x 3 uint8 RGB pixels already at the model's input size."""
+    scale, shift = _pixel_norm(device)
+    return pixels.to(device).permute(2, 0, 1).float().mul_(scale).add_(shift).unsqueeze(0)
+
+
+def decode_sized(contents: Buffer, height: int, width: int) -> torch.Tensor:
+    """Decode a JPEG/PNG that must be exactly ``height`` x ``width`` into uint8 pixels."""
+    try:
+        # convert() forces the full decode, so truncated data is caught here as well
+        image = Image.open(io.BytesIO(contents)).convert('RGB')
+    except (OSError, UnidentifiedImageError) as img_error:
+        raise _invalid_image(img_error)
+    if image.size != (width, height):
+        raise InferenceError(f"Image is {image.size[0]}x{image.size[1]}, declared {width}x{height}")
+    return torch.from_numpy(np.array(image))
+
+
+def prepare(transform: Callable, device: torch.device, kind: str, data: Buffer,
+            shape: Optional[Tuple[int, int]] = None) -> torch.Tensor:
+    """
+    Model input of shape 1 x 3 x H x W for one request.
+
+    Args:
+        kind: ``'image'`` (encoded image, resized by ``transform``), ``'pixels'``
+            (raw height x width x 3 uint8) or ``'sized'`` (encoded image of exactly ``shape``)
+        data: Request body
+        shape: (height, width) for ``'pixels'`` and ``'sized'``
+    """
+    if kind == 'image':
+        return prepare_image(transform, device, data)
+    height, width = shape
+    if kind == 'pixels':
+        pixels = torch.frombuffer(data, dtype=torch.uint8).view(height, width, 3)
+    elif kind == 'sized':
+        pixels = decode_sized(data, height, width)
+    else:
+        raise ValueError(f"Unknown task kind '{kind}'")
+    return prepare_pixels(device, pixels)
+
+
+def run_task(model: nn.Module, transform: Callable, device: torch.device, kind: str, data: Buffer,
+             shape: Optional[Tuple[int, int]] = None, timings: Optional[Dict[str, float]] = None) -> Prediction:
+    """
+    Score one request (see ``prepare`` for the arguments).
+
+    Args:
+        timings: If given, receives the milliseconds spent in ``preprocess`` and ``forward``
+
+    Returns:
+        (predicted class, confidence, probability per class)
+    """
+    start = time.perf_counter()
+    image_tensor = prepare(transform, device, kind, data, shape)
+    prepared = time.perf_counter()
+    try:
+        predicted_class, confidence, probabilities = score_batch(model, image_tensor)[0]
+    except Exception as pred_error:
+        raise InferenceError(f"Model prediction failed: {str(pred_error)}")
+    if timings is not None:
+        timings['preprocess'] = (prepared - start) * 1000
+        timings['forward'] = (time.perf_counter() - prepared) * 1000
+    return predicted_class, confidence, probabilities
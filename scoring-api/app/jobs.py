@@ -0,0 +1,312 @@
+"""
+Bulk scoring jobs backed by a local SQLite queue.
+
+A job is a set of uploaded images (files or the images inside a zip). Images
+are written to disk and queued as job items in SQLite, so queued and
+half-finished jobs survive restarts. A pool of background worker threads
+claims pending items in large batches and scores them a sub-batch (one
+forward pass) at a time, recording each sub-batch's results. Workers wait
+whenever interactive requests are in flight (see ``InteractiveGate``),
+checked before every sub-batch, so bulk jobs only use otherwise idle time
+and an interactive request waits for at most one sub-batch.
+"""
+
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+import zipfile
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+import torch
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+COPY_CHUNK_BYTES = 1 << 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    predicted_class INTEGER,
+    confidence REAL,
+    error TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS job_items_pending ON job_items (status, job_id, idx);
+"""
+
+
+class InteractiveGate:
+    """Counts in-flight interactive requests so background work can yield to them."""
+
+    def __init__(self):
+        self._active = 0
+        self._idle = threading.Condition()
+
+    def __enter__(self):
+        with self._idle:
+            self._active += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._idle:
+            self._active -= 1
+            if self._active == 0:
+                self._idle.notify_all()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Block until no interactive request is running; returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._active == 0, timeout)
+
+
+def iter_images(filename: str, fileobj: BinaryIO) -> Iterator[Tuple[str, BinaryIO]]:
+    """(name, readable stream) of every image in an upload; zips are expanded, other files taken as is."""
+    if not filename.lower().endswith('.zip'):
+        yield filename, fileobj
+        return
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                with archive.open(info) as entry:
+                    yield info.filename, entry
+
+
+def _copy_limited(source: BinaryIO, path: str, limit: int, error: str) -> int:
+    """Stream ``source`` into ``path``; raises ValueError(error) once more than ``limit`` bytes were read."""
+    written = 0
+    with open(path, 'wb') as f:
+        while True:
+            # Counted while decompressing: a zip entry's declared size can't be trusted
+            chunk = source.read(min(COPY_CHUNK_BYTES, limit - written + 1))
+            if not chunk:
+                return written
+            written += len(chunk)
+            if written > limit:
+                raise ValueError(error)
+            f.write(chunk)
+
+
+class JobStore:
+    """SQLite job queue; images are stored under ``root_dir`` until they are scored."""
+
+    def __init__(self, root_dir: str, max_image_bytes: int = 50 << 20, max_job_bytes: int = 2 << 30):
+        self.root_dir = root_dir
+        # Uncompressed size limits, so a small zip can't expand into an arbitrarily large job
+        self.max_image_bytes = max_image_bytes
+        self.max_job_bytes = max_job_bytes
+        os.makedirs(root_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(root_dir, 'jobs.sqlite'), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        # Items claimed by a worker that was stopped by a restart go back to the queue
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE job_items SET status = 'pending' WHERE status = 'running'")
+            self._conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+
+    def create(self, uploads: List[Tuple[str, BinaryIO]]) -> Tuple[str, int]:
+        """
+        Queue a job for the images in ``uploads`` ((filename, file) pairs, zips expanded).
+
+        Blocking: images are streamed to disk one by one, so call it from a worker thread.
+        Raises ValueError for an unreadable, empty or oversized upload.
+
+        Returns:
+            The job id and its number of images
+        """
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.root_dir, job_id)
+        os.makedirs(job_dir)
+        rows = []
+        total_bytes = 0
+        try:
+            for upload_name, fileobj in uploads:
+                try:
+                    for filename, source in iter_images(upload_name, fileobj):
+                        idx = len(rows)
+                        # Stored by index, never by the uploaded name, so archive paths can't escape job_dir
+                        path = os.path.join(job_dir, f'{idx:06d}')
+                        if self.max_job_bytes - total_bytes < self.max_image_bytes:
+                            limit = self.max_job_bytes - total_bytes
+                            error = f"images larger than {self.max_job_bytes >> 20} MiB in total"
+                        else:
+                            limit = self.max_image_bytes
+                            error = f"{filename} is larger than {self.max_image_bytes >> 20} MiB"
+                        total_bytes += _copy_limited(source, path, limit, error)
+                        rows.append((job_id, idx, filename, path, 'pending'))
+                except Exception as e:
+                    raise ValueError(f"Could not read {upload_name}: {str(e)}") from e
+            if not rows:
+                raise ValueError("No images in upload")
+        except Exception:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO job_items (job_id, idx, filename, path, status) VALUES (?, ?, ?, ?, ?)', rows)
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, total, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, len(rows), now, now))
+        return job_id, len(rows)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT id, status, total, completed, failed, created_at, updated_at FROM jobs WHERE id = ?',
+                (job_id,)).fetchone()
+        if row is None:
+            return None
+        keys = ('job_id', 'status', 'total', 'completed', 'failed', 'created_at', 'updated_at')
+        return dict(zip(keys, row))
+
+    def results(self, job_id: str, offset: int = 0, limit: int = 1000) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT idx, filename, status, predicted_class, confidence, error FROM job_items '
+                'WHERE job_id = ? ORDER BY idx LIMIT ? OFFSET ?', (job_id, limit, offset)).fetchall()
+        keys = ('index', 'filename', 'status', 'predicted_class', 'confidence', 'error')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def claim(self, batch_size: int) -> List[Tuple[str, int, str]]:
+        """Mark up to ``batch_size`` pending items as running, oldest job first."""
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT i.job_id, i.idx, i.path FROM job_items i JOIN jobs j ON j.id = i.job_id "
+                "WHERE i.status = 'pending' ORDER BY j.created_at, i.idx LIMIT ?", (batch_size,)).fetchall()
+            self._conn.executemany(
+                "UPDATE job_items SET status = 'running' WHERE job_id = ? AND idx = ?",
+                [(job_id, idx) for job_id, idx, _ in rows])
+            self._conn.executemany(
+                "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'queued'",
+                [(time.time(), job_id) for job_id in {row[0] for row in rows}])
+        return rows
+
+    def complete(self, results: List[Tuple[str, int, Optional[int], Optional[float], Optional[str]]]) -> List[str]:
+        """Record (job_id, idx, predicted_class, confidence, error) for claimed items; returns jobs now done."""
+        now = time.time()
+        with self._lock, self._conn:
+            for job_id, idx, predicted_class, confidence, error in results:
+                status = 'failed' if error else 'done'
+                self._conn.execute(
+                    'UPDATE job_items SET status = ?, predicted_class = ?, confidence = ?, error = ? '
+                    'WHERE job_id = ? AND idx = ?', (status, predicted_class, confidence, error, job_id, idx))
+                column = 'failed' if error else 'completed'
+                self._conn.execute(f'UPDATE jobs SET {column} = {column} + 1, updated_at = ? WHERE id = ?',
+                                   (now, job_id))
+            finished = [row[0] for row in self._conn.execute(
+                "SELECT id FROM jobs WHERE status != 'done' AND completed + failed = total")]
+            self._conn.executemany("UPDATE jobs SET status = 'done' WHERE id = ?", [(job_id,) for job_id in finished])
+        return finished
+
+    def remove_job_dir(self, job_id: str) -> None:
+        """Remove a finished job's directory, empty once all its images were scored and deleted."""
+        try:
+            os.rmdir(os.path.join(self.root_dir, job_id))
+        except OSError:
+            pass
+
+
+class JobWorkerPool:
+    """Background threads that drain the job queue in batches when interactive traffic is idle."""
+
+    def __init__(self, store: JobStore, predict_batch: Callable[[torch.Tensor], torch.Tensor],
+                 transform: Callable, gate: InteractiveGate, workers: int = 1, batch_size: int = 32,
+                 sub_batch_size: int = 8, poll_interval: float = 0.5):
+        self.store = store
+        self.predict_batch = predict_batch
+        self.transform = transform
+        self.gate = gate
+        # Items claimed per queue transaction, and per forward pass between interactive checks
+        self.batch_size = batch_size
+        self.sub_batch_size = max(1, min(sub_batch_size, batch_size))
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                         for i in range(workers)]
+
+    def start(self) -> None:
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    def _wait_idle(self) -> bool:
+        """Wait until no interactive request is in flight; False when the pool is stopping."""
+        while not self.gate.wait_idle(timeout=self.poll_interval):
+            if self._stop.is_set():
+                return False
+        return not self._stop.is_set()
+
+    def _run(self) -> None:
+        while self._wait_idle():
+            items = self.store.claim(self.batch_size)
+            if not items:
+                self._stop.wait(self.poll_interval)
+                continue
+            for start in range(0, len(items), self.sub_batch_size):
+                # Items not scored when stopping stay claimed; JobStore requeues them on restart
+                if start and not self._wait_idle():
+                    return
+                self._score_and_record(items[start:start + self.sub_batch_size])
+
+    def _score_and_record(self, items: List[Tuple[str, int, str]]) -> None:
+        try:
+            results = self._score(items)
+        except Exception as e:
+            logger.error(f"Job batch failed: {str(e)}", exc_info=True)
+            results = [(job_id, idx, None, None, str(e)) for job_id, idx, _ in items]
+        try:
+            finished = self.store.complete(results)
+        except Exception as e:
+            # The items stay claimed and are requeued on restart, so their images are kept
+            logger.error(f"Could not record results of {len(items)} job items: {str(e)}", exc_info=True)
+            return
+        # Every item has a recorded result, so its image is no longer needed
+        for _, _, path in items:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        for job_id in finished:
+            self.store.remove_job_dir(job_id)
+
+    def _score(self, items: List[Tuple[str, int, str]]) -> List[Tuple]:
+        tensors, scored, results = [], [], []
+        for job_id, idx, path in items:
+            try:
+                with Image.open(path) as image:
+                    tensors.append(self.transform(image.convert('RGB')))
+                scored.append((job_id, idx))
+            except Exception as e:
+                results.append((job_id, idx, None, None, f"Invalid image: {str(e)}"))
+
+        if tensors:
+            probabilities = self.predict_batch(torch.stack(tensors))
+            confidence, predicted = probabilities.max(dim=1)
+            for (job_id, idx), cls, conf in zip(scored, predicted.tolist(), confidence.tolist()):
+                results.append((job_id, idx, cls, conf, None))
+        return results
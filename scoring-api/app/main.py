@@ -1,16 +1,58 @@
-from fastapi import FastAPI, File, UploadFile
+from fastapi import Depends, FastAPI, File, Form, Header, HTTPException, Request, UploadFile
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import numpy as np
+from starlette.concurrency import run_in_threadpool
+import asyncio
 import io
+import json
 from PIL import Image
 import torch
-import torchvision.transforms as transforms
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 import os
-from app.models.mobilenetv3 import MobileNetV3Classifier
+from app.models.loader import load_model
+from app.models.precision import resolve_precision
+from app.models.registry import DEFAULT_WEIGHTS, build_transform
+from app.batching import AdaptiveBatcher, BatchController
+from app.inference import InferenceError, prepare, run_task, score_batch
+from app.process_pool import ProcessPool
+from app.profiling import Profiler
+from app.jobs import InteractiveGate, JobStore, JobWorkerPool
+from app.persistence import PredictionWriter, prediction_row
+from app import request_log
+from app.request_log import RequestLog
+from app.vector_index import UserIndexStore
+import hashlib
+import hmac
 import logging
+import re
+import uuid
+from contextlib import asynccontextmanager
 
-app = FastAPI(title="Model Inference API")
+@asynccontextmanager
+async def lifespan(app):
+    global index_store
+    request_logger.start()
+    # Hashes the weights file, so it runs in a worker thread
+    index_store = await run_in_threadpool(open_index_store)
+    if process_pool is not None:
+        await run_in_threadpool(process_pool.start)
+    if batcher is not None:
+        await batcher.start()
+    job_workers.start()
+    if prediction_writer is not None:
+        await prediction_writer.start()
+    yield
+    if prediction_writer is not None:
+        await prediction_writer.stop()
+    job_workers.stop()
+    if batcher is not None:
+        await batcher.stop()
+    if process_pool is not None:
+        process_pool.stop()
+    request_logger.stop()
+
+
+app = FastAPI(title="Model Inference API", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -23,100 +65,437 @@ app.add_middleware(
 
 # Initialize model and move to device
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model = MobileNetV3Classifier(num_classes=2).to(device)
-
-# Load the trained model weights
-model_path = os.path.join(os.path.dirname(__file__), 'models', 'efficientnet_b3_model.pth')
-model.load_state_dict(torch.load(model_path, map_location=device))
-model.eval()
-
-# Image preprocessing
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-])
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+
+# Load the trained model weights (MODEL_NAME/MODEL_PATH override the bundled model)
+model_name = os.environ.get('MODEL_NAME', 'mobilenetv3')
+model_path = os.environ.get('MODEL_PATH') or DEFAULT_WEIGHTS[model_name]
+# PRECISION: fp32 (default), bf16-autocast or bf16 weights; bf16 falls back to fp32 without native support
+precision = resolve_precision(os.environ.get('PRECISION', 'fp32'), device)
+model, input_size = load_model(model_name, model_path, device, precision=precision)
+
+# Image preprocessing at the model's declared input resolution
+transform = build_transform(input_size)
+
+# Bulk scoring jobs (see app/jobs.py), drained in the background while interactive endpoints are idle
+INTERACTIVE_PATHS = {"/predict", "/predict/raw", "/embed"}
+interactive_gate = InteractiveGate()
+
+
+def predict_batch(images: torch.Tensor) -> torch.Tensor:
+    with torch.inference_mode():
+        return torch.softmax(model(images.to(device)), dim=1).cpu()
+
+
+job_store = JobStore(
+    os.environ.get('JOBS_DIR', 'jobs'),
+    max_image_bytes=int(os.environ.get('JOB_MAX_IMAGE_MB', '50')) << 20,
+    max_job_bytes=int(os.environ.get('JOB_MAX_UPLOAD_MB', '2048')) << 20,
+)
+job_workers = JobWorkerPool(
+    job_store, predict_batch, transform, interactive_gate,
+    workers=int(os.environ.get('JOB_WORKERS', '1')),
+    batch_size=int(os.environ.get('JOB_BATCH_SIZE', '32')),
+    sub_batch_size=int(os.environ.get('JOB_SUB_BATCH_SIZE', '8')),
+)
+
+# Which side inserts each prediction: the mobile app records its scans itself, so by default
+# ('client') the server writes nothing; 'server' writes every prediction to the predictions table
+# of DATABASE_URL (see app/persistence.py), for clients that don't record their own predictions
+PREDICTION_PERSISTENCE = os.environ.get('PREDICTION_PERSISTENCE', 'client')
+if PREDICTION_PERSISTENCE not in ('client', 'server'):
+    raise ValueError(f"PREDICTION_PERSISTENCE must be client or server, got '{PREDICTION_PERSISTENCE}'")
+if PREDICTION_PERSISTENCE == 'server' and not os.environ.get('DATABASE_URL'):
+    raise ValueError("PREDICTION_PERSISTENCE=server needs DATABASE_URL")
+
+prediction_writer = None
+if PREDICTION_PERSISTENCE == 'server':
+    prediction_writer = PredictionWriter(
+        os.environ['DATABASE_URL'],
+        batch_size=int(os.environ.get('DB_BATCH_SIZE', '200')),
+        flush_interval=float(os.environ.get('DB_FLUSH_INTERVAL', '1.0')),
+        writers=int(os.environ.get('DB_POOL_SIZE', '2')),
+    )
+
+
+def persist_prediction(probabilities: List[float], predicted_class: int, confidence: float,
+                       image_url: Optional[str], user_id: Optional[uuid.UUID]) -> None:
+    """Buffer the prediction for the predictions table with server-side persistence; returns immediately."""
+    if prediction_writer is not None:
+        prediction_writer.record(prediction_row(
+            predicted_class, confidence, probabilities, image_url, user_id))
+
+
+def parse_user_id(user_id: Optional[str]) -> Optional[uuid.UUID]:
+    """The predictions table references auth.users(id), so user ids must be UUIDs."""
+    if not user_id:
+        return None
+    try:
+        return uuid.UUID(user_id)
+    except ValueError:
+        raise ValueError(f"user_id must be a UUID, got '{user_id}'")
+
+
+def error_response(error) -> Dict[str, Any]:
+    """Error body returned to the client; also marks the request's log record as failed."""
+    request_log.fail(error)
+    return {
+        "error": str(error),
+        "status": "error"
+    }
+
+# Where /predict and /predict/raw decode, preprocess and score (see app/inference.py):
+#   inline   on the event loop (default)
+#   thread   in the threadpool, so the event loop keeps accepting requests
+#   process  in INFERENCE_WORKERS worker processes fed through shared memory (app/process_pool.py)
+#   batch    preprocessing in the threadpool, forward passes batched across requests with a batch
+#            size and queue wait tuned to keep p95 under LATENCY_SLO_MS (app/batching.py)
+INFERENCE_MODE = os.environ.get('INFERENCE_MODE', 'inline')
+process_pool: Optional[ProcessPool] = None
+batcher: Optional[AdaptiveBatcher] = None
+if INFERENCE_MODE == 'process':
+    workers = os.environ.get('INFERENCE_WORKERS')
+    process_pool = ProcessPool(model_name, model_path, workers=int(workers) if workers else None,
+                               precision=precision)
+elif INFERENCE_MODE == 'batch':
+    batcher = AdaptiveBatcher(
+        lambda batch: score_batch(model, batch),
+        BatchController(float(os.environ.get('LATENCY_SLO_MS', '200')),
+                        batch_limit=int(os.environ.get('MAX_BATCH_LIMIT', '32'))),
+    )
+elif INFERENCE_MODE not in ('inline', 'thread'):
+    raise ValueError(f"INFERENCE_MODE must be inline, thread, process or batch, got '{INFERENCE_MODE}'")
+
+
+async def infer(kind: str, data, shape: Optional[Tuple[int, int]] = None) -> Tuple[int, float, List[float]]:
+    """Score one request in the configured INFERENCE_MODE; raises InferenceError for a bad input."""
+    if process_pool is not None:
+        with request_log.timed('infer'):
+            return await process_pool.predict(kind, data, shape)
+    if batcher is not None:
+        with request_log.timed('preprocess'):
+            image_tensor = await run_in_threadpool(prepare, transform, device, kind, data, shape)
+        with request_log.timed('batch'):
+            return await batcher.submit(image_tensor)
+    record = request_log.current()
+    timings = record.timings if record is not None else None
+    if INFERENCE_MODE == 'thread':
+        return await run_in_threadpool(run_task, model, transform, device, kind, data, shape, timings)
+    return run_task(model, transform, device, kind, data, shape, timings)
+
+# On-demand profiling via /admin/profile, only enabled when ADMIN_TOKEN is set
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+profiler = Profiler(
+    model, torch_unavailable="inference runs in worker processes" if process_pool is not None else None)
+
+
+def require_admin(authorization: Optional[str] = Header(None)) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not authorization or not hmac.compare_digest(authorization, f"Bearer {ADMIN_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Admin token required")
+
+# Most similar scans /embed returns at once
+MAX_SIMILAR = 100
+
+# Per-user embedding indexes of /embed, opened at startup
+index_store: Optional[UserIndexStore] = None
+
+
+def open_index_store() -> UserIndexStore:
+    """Index store for the served weights; embeddings are only comparable within one set of weights."""
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    index_dir = os.path.join(os.environ.get('EMBEDDINGS_DIR', 'embeddings'),
+                             f"{model_name}-{digest.hexdigest()[:16]}")
+    return UserIndexStore(index_dir, model.embedding_dim,
+                          max_open=int(os.environ.get('EMBEDDINGS_MAX_OPEN', '256')))
+
+# Configure logging: written by a background thread, plus one JSON record per inference request
+# (see app/request_log.py) for all failed and REQUEST_LOG_SAMPLE_RATE of the successful requests
+request_logger = RequestLog(
+    sample_rate=float(os.environ.get('REQUEST_LOG_SAMPLE_RATE', '1.0')),
+    queue_size=int(os.environ.get('LOG_QUEUE_SIZE', '10000')),
+    static_fields={"model": model_name, "precision": precision, "inference_mode": INFERENCE_MODE},
+)
 logger = logging.getLogger(__name__)
 
+@app.middleware("http")
+async def interactive_priority(request: Request, call_next):
+    # Job workers wait while any interactive request is in flight
+    if request.url.path in INTERACTIVE_PATHS:
+        record = request_logger.begin(request.headers.get('x-request-id') or uuid.uuid4().hex, request.url.path)
+        try:
+            with interactive_gate:
+                response = await call_next(request)
+        except Exception as e:
+            record.fail(e)
+            request_logger.finish(record, 500)
+            raise
+        request_logger.finish(record, response.status_code)
+        response.headers['X-Request-Id'] = record.request_id
+        if profiler.active:
+            profiler.request_done()
+        return response
+    return await call_next(request)
+
 @app.get("/")
 async def root():
     return {"message": "Model Inference API is running"}
 
+@app.get("/metrics")
+async def metrics() -> Dict[str, Any]:
+    """Serving configuration and the current decisions of the adaptive components."""
+    return {
+        "model": model_name,
+        "precision": precision,
+        "inference_mode": INFERENCE_MODE,
+        "batching": batcher.describe() if batcher is not None else None,
+        "persistence": prediction_writer.stats if prediction_writer is not None else None,
+        "request_log": request_logger.stats,
+    }
+
+@app.post("/admin/profile")
+async def admin_profile(seconds: float = 10.0, requests: Optional[int] = None,
+                        _: None = Depends(require_admin)) -> Dict[str, Any]:
+    """
+    Profile live traffic for ``seconds`` (at most 300) or until ``requests`` inference requests finish.
+
+    Returns the top Python functions (sampling profile of all threads) and torch
+    operators, collapsed Python stacks and a Chrome trace of the profiled forward passes.
+    """
+    if profiler.active:
+        raise HTTPException(status_code=409, detail="A profile is already being captured")
+    logger.info(f"Profiling for up to {seconds}s" + (f" or {requests} requests" if requests else ""))
+    return await profiler.capture(min(seconds, 300.0), requests)
+
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)) -> Dict[str, Any]:
+async def predict(
+    file: UploadFile = File(...),
+    user_id: Optional[str] = Form(None),
+    image_url: Optional[str] = Form(None),
+) -> Dict[str, Any]:
     try:
-        logger.info(f"Received prediction request for file: {file.filename}")
-        logger.info(f"Content type: {file.content_type}")
+        try:
+            user_uuid = parse_user_id(user_id)
+        except ValueError as e:
+            return error_response(e)
 
         # Read and process the image
-        contents = await file.read()
-        logger.info(f"File size: {len(contents)} bytes")
+        with request_log.timed('read'):
+            contents = await file.read()
+        request_log.note(bytes=len(contents), content_type=file.content_type)
 
         if len(contents) == 0:
-            return {
-                "error": "Empty file received",
-                "status": "error"
-            }
+            return error_response("Empty file received")
 
-        # Try to open the image
-        try:
-            image = Image.open(io.BytesIO(contents))
-            logger.info(f"Image opened successfully. Mode: {image.mode}, Size: {image.size}")
-        except Exception as img_error:
-            logger.error(f"Failed to open image: {str(img_error)}")
-            return {
-                "error": f"Invalid image format: {str(img_error)}",
-                "status": "error"
-            }
-
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-            logger.info("Converted image to RGB")
-
-        # Preprocess the image
         try:
+            predicted_class, confidence, probabilities = await infer('image', contents)
+        except InferenceError as e:
+            return error_response(e)
+
+        persist_prediction(probabilities, predicted_class, confidence, image_url, user_uuid)
+
+        return {
+            "predicted_class": int(predicted_class),
+            "confidence": float(confidence),
+            "status": "success"
+        }
+
+    except Exception as e:
+        logger.error(f"Error during prediction: {str(e)}", exc_info=True)
+        return error_response(e)
+
+def parse_image_shape(header: str) -> Tuple[int, int, int]:
+    """Parse an X-Image-Shape header such as ``224,224,3`` or ``224x224x3`` (height, width, channels)."""
+    parts = [int(p) for p in re.split(r'[,x]', header.strip()) if p]
+    if len(parts) != 3 or parts[2] != 3:
+        raise ValueError(f"X-Image-Shape must be height,width,3, got '{header}'")
+    return parts[0], parts[1], parts[2]
+
+
+async def read_exact(request: Request, size: int) -> bytearray:
+    """Stream the request body into a preallocated buffer of exactly ``size`` bytes."""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    async for chunk in request.stream():
+        if received + len(chunk) > size:
+            raise ValueError(f"Body larger than the declared shape ({size} bytes)")
+        view[received:received + len(chunk)] = chunk
+        received += len(chunk)
+    if received != size:
+        raise ValueError(f"Expected {size} bytes for the declared shape, received {received}")
+    return buffer
+
+
+@app.post("/predict/raw")
+async def predict_raw(
+    request: Request,
+    x_image_shape: str = Header(...),
+    x_user_id: Optional[str] = Header(None),
+    x_image_url: Optional[str] = Header(None),
+) -> Dict[str, Any]:
+    """
+    Predict from an image the client already resized to the model's input size.
+
+    The body is either raw height x width x 3 uint8 RGB pixels
+    (``Content-Type: application/octet-stream``) or a small JPEG/PNG of that
+    size; ``X-Image-Shape`` declares the shape. Raw pixels are wrapped
+    without copying and normalized straight into the batch tensor, skipping
+    server-side decode and resize. ``X-User-Id`` and ``X-Image-Url`` play the
+    role of the ``user_id`` and ``image_url`` form fields of ``/predict``.
+    """
+    try:
+        height, width, channels = parse_image_shape(x_image_shape)
+        user_uuid = parse_user_id(x_user_id)
+        request_log.note(shape=[height, width, channels])
+        if (height, width) != (input_size, input_size):
+            return error_response(f"Image must be {input_size}x{input_size}, declared {height}x{width}")
+
+        content_type = request.headers.get('content-type', 'application/octet-stream')
+        if content_type.startswith('application/octet-stream'):
+            kind = 'pixels'
+            with request_log.timed('read'):
+                body = await read_exact(request, height * width * channels)
+        else:
+            kind = 'sized'
+            with request_log.timed('read'):
+                body = await request.body()
+        request_log.note(bytes=len(body), content_type=content_type)
+        predicted_class, confidence, probabilities = await infer(kind, body, (height, width))
+
+        persist_prediction(probabilities, predicted_class, confidence, x_image_url, user_uuid)
+
+        return {
+            "predicted_class": int(predicted_class),
+            "confidence": float(confidence),
+            "status": "success"
+        }
+
+    except (ValueError, InferenceError) as e:
+        return error_response(e)
+    except Exception as e:
+        logger.error(f"Error during raw prediction: {str(e)}", exc_info=True)
+        return error_response(e)
+
+
+@app.post("/embed")
+async def embed(
+    file: UploadFile = File(...),
+    user_id: Optional[str] = Form(None),
+    scan_id: Optional[str] = Form(None),
+    k: int = Form(5),
+) -> Dict[str, Any]:
+    """
+    Prediction plus the penultimate feature vector, from the same forward pass.
+
+    With ``user_id`` the response lists that user's ``k`` most similar earlier
+    scans; with ``scan_id`` as well, the scan is added to the user's index.
+    """
+    if not 1 <= k <= MAX_SIMILAR:
+        return error_response(f"k must be between 1 and {MAX_SIMILAR}, got {k}")
+    try:
+        with request_log.timed('read'):
+            contents = await file.read()
+        request_log.note(bytes=len(contents), content_type=file.content_type)
+        if len(contents) == 0:
+            return error_response("Empty file received")
+
+        with request_log.timed('preprocess'):
+            try:
+                image = Image.open(io.BytesIO(contents)).convert('RGB')
+            except Exception as img_error:
+                return error_response(f"Invalid image format: {str(img_error)}")
             image_tensor = transform(image).unsqueeze(0).to(device)
-            logger.info("Image preprocessed successfully")
-        except Exception as transform_error:
-            logger.error(f"Failed to preprocess image: {str(transform_error)}")
-            return {
-                "error": f"Image preprocessing failed: {str(transform_error)}",
-                "status": "error"
-            }
-
-        # Make prediction
-        try:
+
+        with request_log.timed('forward'):
             with torch.no_grad():
-                logger.info("Starting model inference")
-                prediction = model(image_tensor)
-                logger.info("Model inference completed")
-                probabilities = torch.softmax(prediction, dim=1)
+                logits, features = model.forward_with_features(image_tensor)
+                probabilities = torch.softmax(logits, dim=1)
                 predicted_class = torch.argmax(probabilities, dim=1).item()
                 confidence = probabilities[0][predicted_class].item()
-                logger.info(f"Prediction completed: class {predicted_class}, confidence {confidence}")
-        except Exception as pred_error:
-            logger.error(f"Model prediction failed: {str(pred_error)}")
-            return {
-                "error": f"Model prediction failed: {str(pred_error)}",
-                "status": "error"
-            }
+            embedding = features[0].float().cpu().numpy()
+
+        similar = []
+        if user_id:
+            # Index reads and IVF rebuilds block, so they run in worker threads
+            matches = await run_in_threadpool(index_store.search, user_id, embedding, k, scan_id)
+            similar = [
+                {"scan_id": similar_id, "similarity": similarity}
+                for similar_id, similarity in matches
+            ]
+            if scan_id:
+                await run_in_threadpool(index_store.add, user_id, scan_id, embedding)
 
         return {
             "predicted_class": int(predicted_class),
             "confidence": float(confidence),
+            "embedding": embedding.tolist(),
+            "similar": similar,
             "status": "success"
         }
 
     except Exception as e:
-        logger.error(f"Error during prediction: {str(e)}", exc_info=True)
+        logger.error(f"Error during embedding: {str(e)}", exc_info=True)
+        return error_response(e)
+
+@app.post("/jobs")
+async def create_job(files: List[UploadFile] = File(...)) -> Dict[str, Any]:
+    """Queue a bulk scoring job for the uploaded images and/or zip archives of images."""
+    # Starlette spools uploads to temporary files; they are copied into the job off the event loop
+    uploads = [(upload.filename or '', upload.file) for upload in files]
+    try:
+        job_id, total = await run_in_threadpool(job_store.create, uploads)
+    except ValueError as e:
         return {
             "error": str(e),
             "status": "error"
         }
+    logger.info(f"Queued job {job_id} with {total} images")
+    return {"job_id": job_id, "total": total, "status": "queued"}
+
+
+def _get_job(job_id: str) -> Dict[str, Any]:
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str) -> Dict[str, Any]:
+    """Job status and progress."""
+    return _get_job(job_id)
+
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(job_id: str, offset: int = 0, limit: int = 1000) -> Dict[str, Any]:
+    """Per-image results of a job, in upload order, ``limit`` at a time."""
+    job = _get_job(job_id)
+    job["results"] = job_store.results(job_id, offset, limit)
+    return job
+
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str, poll_interval: float = 0.5) -> StreamingResponse:
+    """Newline-delimited JSON progress updates until the job is done."""
+    _get_job(job_id)
+
+    async def events():
+        last = None
+        while True:
+            job = job_store.get(job_id)
+            progress = (job["status"], job["completed"], job["failed"])
+            if progress != last:
+                yield json.dumps(job) + "\n"
+                last = progress
+            if job["status"] == "done":
+                return
+            await asyncio.sleep(poll_interval)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
 
 if __name__ == "__main__":
     import uvicorn
@@ -3,10 +3,13 @@ import torch.nn as nn
 from torchvision.models import efficientnet_b3, EfficientNet_B3_Weights
 
 class EfficientNetB3Classifier(nn.Module):
-    def __init__(self, num_classes=2):
+    # Default input resolution; checkpoints may override it with 'input_size'
+    input_size = 224
+
+    def __init__(self, num_classes=2, pretrained=False):
         super().__init__()
-        # Load pretrained EfficientNet-B3
-        self.effnet = efficientnet_b3(weights=EfficientNet_B3_Weights.DEFAULT)
+        # ImageNet weights are only needed to start training; served weights come from a checkpoint
+        self.effnet = efficientnet_b3(weights=EfficientNet_B3_Weights.DEFAULT if pretrained else None)
 
         # Modify the classifier to match the training architecture
         num_features = self.effnet.classifier[1].in_features
@@ -20,3 +23,13 @@ class EfficientNetB3Classifier(nn.Module):
 
     def forward(self, x):
         return self.effnet(x)
+
+    @property
+    def embedding_dim(self):
+        return self.effnet.classifier[-1].in_features
+
+    def forward_with_features(self, x):
+        """Logits and the penultimate features (input to the last linear layer) in one pass."""
+        x = self.effnet.avgpool(self.effnet.features(x))
+        features = self.effnet.classifier[:-1](torch.flatten(x, 1))
+        return self.effnet.classifier[-1](features), features
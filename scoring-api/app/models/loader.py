@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+from typing import Dict, Tuple
+
+import torch
+import torch.nn as nn
+
+from app.models.precision import PRECISIONS, with_precision
+from app.models.registry import DEFAULT_WEIGHTS, MODELS
+
+# Loaded models per process, keyed by model, weights file identity, device and precision
+_CACHE: Dict[tuple, Tuple[nn.Module, int]] = {}
+_CACHE_LOCK = threading.Lock()
+
+SAFETENSORS_EXTENSION = '.safetensors'
+
+
+def _cache_key(name: str, weights_path: str, device: torch.device, num_classes: int, precision: str) -> tuple:
+    stat = os.stat(weights_path)
+    # Rewriting the file in place changes mtime/size, so stale entries are never reused
+    return (name, os.path.realpath(weights_path), stat.st_mtime_ns, stat.st_size, str(device), num_classes,
+            precision)
+
+
+def _read_safetensors(path: str) -> dict:
+    # Only needed for .safetensors weights
+    from safetensors import safe_open
+
+    # On CPU the tensors are views of a private memory map: paged in lazily and shared through the page cache
+    with safe_open(path, framework='pt', device='cpu') as f:
+        state_dict = {name: f.get_tensor(name) for name in f.keys()}
+        metadata = f.metadata() or {}
+    checkpoint = {'state_dict': state_dict}
+    # Checkpoint metadata is stored as JSON strings in the safetensors header
+    for key in ('arch', 'channel_config', 'input_size'):
+        if key in metadata:
+            checkpoint[key] = json.loads(metadata[key])
+    return checkpoint
+
+
+def read_checkpoint(path: str, device: torch.device = torch.device('cpu')) -> dict:
+    """
+    Read a state dict or metadata checkpoint without copying it into memory.
+
+    ``.pth`` files are memory-mapped with ``torch.load(mmap=True)``; legacy
+    (pre zipfile) checkpoints fall back to a regular load. ``.safetensors``
+    files are memory-mapped by the safetensors package (CPU only), with
+    metadata restored from the header.
+    """
+    if path.endswith(SAFETENSORS_EXTENSION):
+        checkpoint = _read_safetensors(path)
+        if device.type != 'cpu':
+            checkpoint['state_dict'] = {k: v.to(device) for k, v in checkpoint['state_dict'].items()}
+        return checkpoint
+    try:
+        return torch.load(path, map_location=device, mmap=True, weights_only=True)
+    except RuntimeError:
+        return torch.load(path, map_location=device, weights_only=True)
+
+
+def build_model(name: str, checkpoint: dict, num_classes: int = 2) -> Tuple[nn.Module, int, dict]:
+    """
+    Construct a registered model shaped for ``checkpoint`` without allocating weights.
+
+    The model is built on the meta device, so parameters are never allocated,
+    initialized or downloaded; ``load_state_dict(state_dict, assign=True)``
+    attaches the checkpoint tensors afterwards.
+
+    Returns:
+        The model, its input resolution and the checkpoint's state dict
+    """
+    with torch.device('meta'):
+        model = MODELS[name](num_classes=num_classes)
+        input_size = model.input_size
+        if 'state_dict' in checkpoint:
+            if 'channel_config' in checkpoint:
+                model.apply_channel_config(checkpoint['channel_config'])
+            input_size = checkpoint.get('input_size', input_size)
+            checkpoint = checkpoint['state_dict']
+    return model, input_size, checkpoint
+
+
+def load_model(name: str, weights_path: str = None, device: torch.device = torch.device('cpu'),
+               num_classes: int = 2, cache: bool = True, precision: str = 'fp32') -> Tuple[nn.Module, int]:
+    """
+    Build a registered model and load its weights, reusing it if already loaded.
+
+    The architecture is constructed without pretrained weights (see
+    ``build_model``). Accepts plain state dicts as well as checkpoints with
+    metadata from ml/fabian (``channel_config`` from prune.py, ``input_size``
+    from resolution_sweep.py).
+
+    Args:
+        name: Key in ``registry.MODELS``
+        weights_path: ``.pth`` or ``.safetensors`` file (default: the model's bundled weights)
+        device: Device to load onto
+        num_classes: Output classes of the classifier head
+        cache: Return the model already loaded by this process for the same file, if any
+        precision: One of ``precision.PRECISIONS``, applied as is (``precision.resolve_precision``
+            picks the fallback for devices without bf16)
+
+    Returns:
+        The model in eval mode on ``device`` and its input resolution
+    """
+    if name not in MODELS:
+        raise ValueError(f"Unknown model '{name}', expected one of {sorted(MODELS)}")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {list(PRECISIONS)}")
+    weights_path = weights_path or DEFAULT_WEIGHTS[name]
+    device = torch.device(device)
+
+    key = _cache_key(name, weights_path, device, num_classes, precision)
+    if cache:
+        with _CACHE_LOCK:
+            if key in _CACHE:
+                return _CACHE[key]
+
+    checkpoint = read_checkpoint(weights_path, device)
+    model, input_size, state_dict = build_model(name, checkpoint, num_classes)
+    model.load_state_dict(state_dict, assign=True)
+    loaded = with_precision(model.to(device).eval(), precision), input_size
+
+    if cache:
+        with _CACHE_LOCK:
+            _CACHE[key] = loaded
+    return loaded
+
+
+def clear_cache() -> None:
+    """Drop every cached model, e.g. between benchmark configurations."""
+    with _CACHE_LOCK:
+        _CACHE.clear()
@@ -1,8 +1,12 @@
 import torch
 import torch.nn as nn
 from torchvision.models import mobilenet_v3_large
+from torchvision.ops.misc import SqueezeExcitation
 
 class MobileNetV3Classifier(nn.Module):
+    # Default input resolution; checkpoints may override it with 'input_size'
+    input_size = 224
+
     def __init__(self, num_classes):
         super().__init__()
         # Initialize the model architecture without loading weights
@@ -11,4 +15,48 @@ class MobileNetV3Classifier(nn.Module):
         self.model.classifier[-1] = nn.Linear(self.model.classifier[-1].in_features, num_classes)
 
     def forward(self, x):
-        return self.model(x) 
\ No newline at end of file
+        return self.model(x)
+
+    @property
+    def embedding_dim(self):
+        return self.model.classifier[-1].in_features
+
+    def forward_with_features(self, x):
+        """Logits and the penultimate features (input to the last linear layer) in one pass."""
+        x = self.model.avgpool(self.model.features(x))
+        features = self.model.classifier[:-1](torch.flatten(x, 1))
+        return self.model.classifier[-1](features), features
+
+    def apply_channel_config(self, channel_config):
+        """Resize layers to the widths of a checkpoint from ml/fabian/prune.py.
+
+        ``channel_config`` maps feature block indices to their expanded width,
+        plus ``classifier`` to the classifier's hidden width. Layers are only
+        reshaped here; call ``load_state_dict`` afterwards.
+        """
+        for key, width in channel_config.items():
+            if key == 'classifier':
+                classifier = self.model.classifier
+                classifier[0] = nn.Linear(classifier[0].in_features, width)
+                classifier[-1] = nn.Linear(width, classifier[-1].out_features)
+            else:
+                _resize_block(self.model.features[int(key)], width)
+        return self
+
+
+def _resize_block(block, width):
+    expand, depthwise = block.block[0], block.block[1]
+    expand[0] = nn.Conv2d(expand[0].in_channels, width, 1, bias=False)
+    expand[1] = nn.BatchNorm2d(width, eps=expand[1].eps, momentum=expand[1].momentum)
+
+    conv = depthwise[0]
+    depthwise[0] = nn.Conv2d(width, width, conv.kernel_size, conv.stride, conv.padding,
+                             conv.dilation, groups=width, bias=False)
+    depthwise[1] = nn.BatchNorm2d(width, eps=depthwise[1].eps, momentum=depthwise[1].momentum)
+
+    for layer in block.block[2:]:
+        if isinstance(layer, SqueezeExcitation):
+            layer.fc1 = nn.Conv2d(width, layer.fc1.out_channels, 1)
+            layer.fc2 = nn.Conv2d(layer.fc2.in_channels, width, 1)
+        else:
+            layer[0] = nn.Conv2d(width, layer[0].out_channels, 1, bias=False)
@@ -0,0 +1,104 @@
+"""
+Numeric precision of inference: fp32, bf16 autocast or bf16 weights.
+
+- ``fp32``: the model as trained.
+- ``bf16-autocast``: fp32 weights, with convolutions and matmuls run in
+  bfloat16 under ``torch.autocast``; numerically sensitive ops (softmax,
+  batch norm statistics, ...) stay in fp32.
+- ``bf16``: weights and activations converted to bfloat16; half the weight
+  memory, and the most drift from fp32.
+
+Either way the wrapped model takes and returns fp32 tensors, so callers are
+unchanged. bf16 is only fast on CPUs with native support (AVX512-BF16 or
+AMX, e.g. Xeon Cooper Lake / Sapphire Rapids and later); elsewhere it is
+emulated and slower than fp32, so ``resolve_precision`` falls back to fp32.
+``offline_eval.py --precision-report`` measures agreement with fp32.
+"""
+
+import functools
+import logging
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+PRECISIONS = ('fp32', 'bf16-autocast', 'bf16')
+
+# /proc/cpuinfo flags of native bf16 arithmetic
+BF16_CPU_FLAGS = ('avx512_bf16', 'amx_bf16')
+
+
+@functools.lru_cache(maxsize=None)
+def cpu_supports_bf16() -> bool:
+    """Whether this CPU computes in bfloat16 natively rather than emulating it."""
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('flags'):
+                    flags = set(line.split(':', 1)[1].split())
+                    return any(flag in flags for flag in BF16_CPU_FLAGS)
+    except OSError:
+        pass
+    # No /proc/cpuinfo: ask oneDNN, which also counts AVX512 CPUs that only emulate bf16
+    checker = getattr(torch.ops.mkldnn, '_is_mkldnn_bf16_supported', None)
+    return bool(checker()) if checker is not None else False
+
+
+def bf16_supported(device: torch.device) -> bool:
+    device = torch.device(device)
+    if device.type == 'cuda':
+        return torch.cuda.is_bf16_supported()
+    return device.type == 'cpu' and cpu_supports_bf16()
+
+
+def resolve_precision(precision: str, device: torch.device = torch.device('cpu')) -> str:
+    """
+    The precision to serve with: ``precision``, or fp32 when the device has no native bf16.
+
+    Raises:
+        ValueError: For a precision not in ``PRECISIONS``
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {list(PRECISIONS)}")
+    if precision != 'fp32' and not bf16_supported(device):
+        logger.warning(f"{device} has no native bfloat16 support, using fp32 instead of {precision}")
+        return 'fp32'
+    return precision
+
+
+class PrecisionModel(nn.Module):
+    """Runs a classifier in bf16 (``bf16`` or ``bf16-autocast``) behind an fp32 interface."""
+
+    def __init__(self, model: nn.Module, precision: str):
+        super().__init__()
+        if precision not in ('bf16', 'bf16-autocast'):
+            raise ValueError(f"PrecisionModel runs bf16 or bf16-autocast, got '{precision}'")
+        self.model = model.to(torch.bfloat16) if precision == 'bf16' else model
+        self.precision = precision
+        self.input_size = model.input_size
+
+    @property
+    def embedding_dim(self):
+        return self.model.embedding_dim
+
+    def _run(self, fn, x):
+        device_type = x.device.type
+        if self.precision == 'bf16':
+            return fn(x.to(torch.bfloat16))
+        with torch.autocast(device_type, dtype=torch.bfloat16):
+            return fn(x)
+
+    def forward(self, x):
+        return self._run(self.model, x).float()
+
+    def forward_with_features(self, x):
+        logits, features = self._run(self.model.forward_with_features, x)
+        return logits.float(), features.float()
+
+
+def with_precision(model: nn.Module, precision: str) -> nn.Module:
+    """``model`` as is for fp32, otherwise wrapped in ``PrecisionModel`` (bf16 converts it in place)."""
+    if precision == 'fp32':
+        return model
+    return PrecisionModel(model, precision).eval()
@@ -0,0 +1,41 @@
+import os
+from typing import Dict
+
+import torchvision.transforms as transforms
+
+from app.models.efficientnet_b3 import EfficientNetB3Classifier
+from app.models.mobilenetv3 import MobileNetV3Classifier
+
+MODELS_DIR = os.path.dirname(__file__)
+
+# Model classes that can be served or evaluated, by name
+MODELS: Dict[str, type] = {
+    'mobilenetv3': MobileNetV3Classifier,
+    'efficientnet_b3': EfficientNetB3Classifier,
+}
+
+# Weights used when no explicit path is given
+DEFAULT_WEIGHTS: Dict[str, str] = {
+    'mobilenetv3': os.path.join(MODELS_DIR, 'efficientnet_b3_model.pth'),
+    'efficientnet_b3': os.path.join(MODELS_DIR, '..', '..', '..', 'ml', 'fabian', '0306_model.pth'),
+}
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+# Bump whenever build_transform changes so cached evaluation results are recomputed
+PREPROCESSING_VERSION = 1
+
+
+def build_transform(input_size: int) -> transforms.Compose:
+    """Preprocessing shared by the API and the offline evaluator."""
+    return transforms.Compose([
+        transforms.Resize((input_size, input_size)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD)
+    ])
+
+
+def preprocessing_id(input_size: int) -> str:
+    """Identifies the preprocessing applied at ``input_size``, e.g. ``'v1-224'``."""
+    return f'v{PREPROCESSING_VERSION}-{input_size}'
@@ -0,0 +1,176 @@
+"""
+Server-side persistence of predictions to the Postgres ``predictions`` table.
+
+Requests only append a row to an in-memory buffer (``PredictionWriter.record``
+never awaits or touches the network). Background writer tasks drain the
+buffer through an asyncpg connection pool, one multi-row INSERT per batch of
+up to ``batch_size`` rows or every ``flush_interval`` seconds, whichever
+comes first. When the database is slow or down the buffer fills up to
+``max_buffered`` rows and further rows are dropped and counted rather than
+slowing down inference.
+
+asyncpg is only needed when persistence is enabled
+(``PREDICTION_PERSISTENCE=server``). By default the mobile app inserts its own
+rows and the server writes none, so no prediction is stored twice.
+"""
+
+import asyncio
+import datetime
+import logging
+import uuid
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Class index -> label stored in predictions.prediction, as the mobile app names them
+CLASS_LABELS = ('Low Risk', 'High Risk')
+
+COLUMNS = ('user_id', 'image_url', 'prediction', 'confidence', 'low_risk_probability',
+           'high_risk_probability', 'created_at')
+
+# One prepared statement for any batch size: each column is sent as an array and unnested into rows
+INSERT_SQL = (
+    f"INSERT INTO predictions ({', '.join(COLUMNS)}) "
+    "SELECT * FROM unnest($1::uuid[], $2::text[], $3::text[], $4::float8[], $5::float8[], "
+    "$6::float8[], $7::timestamptz[])"
+)
+
+
+def prediction_row(predicted_class: int, confidence: float, probabilities: List[float],
+                   image_url: Optional[str], user_id: Optional[uuid.UUID] = None) -> tuple:
+    """Row for the predictions table, in ``COLUMNS`` order, timestamped now; ``image_url`` may be None."""
+    return (
+        user_id,
+        image_url,
+        CLASS_LABELS[predicted_class],
+        float(confidence),
+        float(probabilities[0]),
+        float(probabilities[1]),
+        datetime.datetime.now(datetime.timezone.utc),
+    )
+
+
+class PredictionWriter:
+    """Buffers prediction rows and writes them to Postgres in batches."""
+
+    def __init__(self, dsn: str, batch_size: int = 200, flush_interval: float = 1.0,
+                 max_buffered: int = 10000, writers: int = 2, retry_delay: float = 2.0, max_retries: int = 3):
+        self.dsn = dsn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.writers = writers
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.stats = {'written': 0, 'dropped': 0, 'failed': 0}
+        self._pool = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Rows taken off the queue by a writer but not yet written or given up on
+        self._in_flight = 0
+
+    async def start(self) -> None:
+        import asyncpg
+        # The queue is created here so it belongs to the server's event loop
+        self._queue = asyncio.Queue(maxsize=self.max_buffered)
+        # min_size=0: connections are opened by the first flush, so an unreachable database never delays startup
+        self._pool = await asyncpg.create_pool(self.dsn, min_size=0, max_size=self.writers)
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.writers)]
+        logger.info(f"Persisting predictions to Postgres ({self.writers} writers, batches of {self.batch_size})")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Flush buffered rows (waiting at most ``timeout`` seconds) and close the pool."""
+        if self._queue is None:
+            return
+
+        async def drain():
+            # One sentinel per writer: each writes what it holds and exits
+            for _ in self._tasks:
+                await self._queue.put(None)
+            await asyncio.gather(*self._tasks)
+
+        try:
+            await asyncio.wait_for(drain(), timeout)
+            await self._pool.close()
+        except asyncio.TimeoutError:
+            unwritten = self._queue.qsize() + self._in_flight
+            logger.error(f"Gave up flushing predictions after {timeout}s, {unwritten} rows not written")
+            self._pool.terminate()
+        self._queue = None
+        logger.info(f"Prediction writer stopped: {self.stats}")
+
+    def record(self, row: tuple) -> None:
+        """Buffer one row; never blocks. Rows are dropped when the buffer is full."""
+        if self._queue is None:
+            return
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.stats['dropped'] += 1
+            if self.stats['dropped'] % 1000 == 1:
+                logger.warning(f"Prediction buffer full, dropped {self.stats['dropped']} rows so far")
+
+    async def _next_batch(self) -> tuple:
+        """Wait for one row, then collect more until the batch is full or the interval has passed."""
+        loop = asyncio.get_running_loop()
+        rows = []
+        row = await self._queue.get()
+        deadline = loop.time() + self.flush_interval
+        while row is not None:
+            rows.append(row)
+            if len(rows) >= self.batch_size:
+                break
+            try:
+                row = self._queue.get_nowait()
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                row = await asyncio.wait_for(self._queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return rows, row is None
+
+    async def _run(self) -> None:
+        while True:
+            rows, done = await self._next_batch()
+            if rows:
+                self._in_flight += len(rows)
+                await self._write(rows)
+                self._in_flight -= len(rows)
+            if done:
+                return
+
+    async def _write(self, rows: List[tuple]) -> None:
+        import asyncpg
+        columns = list(zip(*rows))
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._pool.acquire() as conn:
+                    await conn.execute(INSERT_SQL, *columns)
+                self.stats['written'] += len(rows)
+                return
+            except asyncpg.PostgresError as e:
+                # The server rejected the data (e.g. an unknown user_id); keep the rows that are valid
+                logger.error(f"Batch insert of {len(rows)} predictions failed: {str(e)}")
+                await self._write_individually(rows)
+                return
+            except Exception as e:
+                logger.warning(f"Postgres unavailable (attempt {attempt + 1}): {str(e)}")
+                await asyncio.sleep(self.retry_delay * (attempt + 1))
+        self.stats['failed'] += len(rows)
+        logger.error(f"Dropped {len(rows)} predictions after {self.max_retries + 1} attempts")
+
+    async def _write_individually(self, rows: List[tuple]) -> None:
+        import asyncpg
+        for row in rows:
+            try:
+                async with self._pool.acquire() as conn:
+                    await conn.execute(INSERT_SQL, *[[value] for value in row])
+                self.stats['written'] += 1
+            except (asyncpg.PostgresError, OSError) as e:
+                self.stats['failed'] += 1
+                logger.error(f"Prediction not persisted: {str(e)}")
@@ -0,0 +1,272 @@
+"""
+Inference in a pool of worker processes.
+
+Decode, preprocessing and the forward pass of each request run in a worker
+process with its own copy of the model, so they don't contend on the API
+process's GIL. Request bodies are not pickled: they are copied into a slot
+of one preallocated ``multiprocessing.shared_memory`` block (a ring of
+``slots`` fixed-size buffers) and the worker reads them in place. Only small
+(request id, slot, length, kind, shape) tuples go over the per-worker task
+queues, and (request id, prediction) tuples come back over one result
+queue, which a collector thread in the API process hands to the waiting
+requests.
+
+Bodies larger than a slot are sent inline through the task queue instead.
+A worker that dies fails its in-flight requests and is restarted.
+"""
+
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from collections import deque
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import torch
+
+from app.inference import Buffer, InferenceError, Prediction, run_task
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_main(index: int, model_name: str, weights_path: Optional[str], precision: str, shm_name: str,
+                 slot_bytes: int, tasks: multiprocessing.Queue, results: multiprocessing.Queue, threads: int) -> None:
+    from app.models.loader import load_model
+    from app.models.registry import build_transform
+
+    # Same log format as the API process, which configures logging in app.main
+    logging.basicConfig(level=logging.INFO)
+    torch.set_num_threads(threads)
+    device = torch.device('cpu')
+    model, input_size = load_model(model_name, weights_path, device, precision=precision)
+    transform = build_transform(input_size)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    results.put((index, None, True, input_size))
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            request_id, slot, length, kind, shape, inline = task
+            data = inline if slot < 0 else shm.buf[slot * slot_bytes:slot * slot_bytes + length]
+            try:
+                results.put((index, request_id, True, run_task(model, transform, device, kind, data, shape)))
+            except InferenceError as e:
+                results.put((index, request_id, False, str(e)))
+            except Exception as e:
+                logger.error(f"Inference worker {index} failed: {str(e)}", exc_info=True)
+                results.put((index, request_id, False, str(e)))
+            finally:
+                if isinstance(data, memoryview):
+                    data.release()
+    finally:
+        shm.close()
+
+
+class _Request:
+    __slots__ = ('future', 'slot', 'worker')
+
+    def __init__(self, future: concurrent.futures.Future, slot: int, worker: int):
+        self.future = future
+        self.slot = slot
+        self.worker = worker
+
+
+class ProcessPool:
+    """Worker processes that score requests passed through shared-memory slots."""
+
+    def __init__(self, model_name: str, weights_path: Optional[str] = None, workers: Optional[int] = None,
+                 slots: Optional[int] = None, slot_bytes: int = 4 << 20, start_timeout: float = 300.0,
+                 precision: str = 'fp32'):
+        self.model_name = model_name
+        self.weights_path = weights_path
+        # Already resolved by the API process (see app.models.precision.resolve_precision)
+        self.precision = precision
+        self.workers = workers or os.cpu_count() or 1
+        # Two slots per worker: one being scored, one already filled and queued
+        self.slots = slots or 2 * self.workers
+        self.slot_bytes = slot_bytes
+        self.start_timeout = start_timeout
+        self.threads_per_worker = max(1, (os.cpu_count() or 1) // self.workers)
+        # Spawned rather than forked: forking a process that already initialized torch's thread pools can hang
+        self._ctx = multiprocessing.get_context('spawn')
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._free_slots: deque = deque()
+        self._slot_available = threading.Condition()
+        self._lock = threading.Lock()
+        self._pending: Dict[int, _Request] = {}
+        self._in_flight: List[int] = [0] * self.workers
+        self._ready = [threading.Event() for _ in range(self.workers)]
+        self._processes: List[multiprocessing.Process] = [None] * self.workers
+        self._tasks: List[multiprocessing.Queue] = [None] * self.workers
+        self._results = None
+        self._collector: Optional[threading.Thread] = None
+        self._request_ids = itertools.count()
+        self._started = False
+        self._startup_error: Optional[str] = None
+        self._stopping = False
+
+    def start(self) -> None:
+        """Start the workers and wait until each has loaded the model."""
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_bytes)
+        self._free_slots.extend(range(self.slots))
+        self._results = self._ctx.Queue()
+        for index in range(self.workers):
+            self._spawn(index)
+        self._collector = threading.Thread(target=self._collect, name='process-pool-results', daemon=True)
+        self._collector.start()
+        for index, ready in enumerate(self._ready):
+            if not ready.wait(self.start_timeout):
+                self._startup_error = f"Inference worker {index} did not start within {self.start_timeout}s"
+            if self._startup_error:
+                self.stop()
+                raise RuntimeError(self._startup_error)
+        self._started = True
+        logger.info(f"Started {self.workers} inference workers ({self.threads_per_worker} threads each, "
+                    f"{self.slots} x {self.slot_bytes >> 20} MiB shared slots)")
+
+    def _spawn(self, index: int) -> None:
+        self._ready[index].clear()
+        self._close_tasks(index)
+        self._tasks[index] = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_main, name=f'inference-worker-{index}', daemon=True,
+            args=(index, self.model_name, self.weights_path, self.precision, self._shm.name, self.slot_bytes,
+                  self._tasks[index], self._results, self.threads_per_worker))
+        process.start()
+        self._processes[index] = process
+
+    def _close_tasks(self, index: int) -> None:
+        tasks = self._tasks[index]
+        if tasks is not None:
+            # Tasks a dead worker never read would otherwise block interpreter exit
+            tasks.cancel_join_thread()
+            tasks.close()
+
+    def stop(self) -> None:
+        self._stopping = True
+        for index, process in enumerate(self._processes):
+            if process is not None and process.is_alive():
+                self._tasks[index].put(None)
+        for process in self._processes:
+            if process is not None:
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.kill()
+        if self._collector is not None:
+            self._collector.join()
+        for index in range(self.workers):
+            self._close_tasks(index)
+        self._fail_pending(lambda request: True, "Inference pool stopped")
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def _acquire_slot(self, timeout: Optional[float] = None) -> Optional[int]:
+        with self._slot_available:
+            if not self._slot_available.wait_for(lambda: self._free_slots, timeout):
+                return None
+            return self._free_slots.popleft()
+
+    def _release_slot(self, slot: int) -> None:
+        if slot < 0:
+            return
+        with self._slot_available:
+            self._free_slots.append(slot)
+            self._slot_available.notify()
+
+    def _dispatch(self, slot: int, kind: str, data: Buffer, shape: Optional[Tuple[int, int]]) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        # Claimed up front: a cancelled request then only cancels its asyncio wrapper, and the
+        # worker's late reply can still be set here (and frees the slot) instead of raising
+        future.set_running_or_notify_cancel()
+        inline = None
+        if slot >= 0:
+            start = slot * self.slot_bytes
+            self._shm.buf[start:start + len(data)] = data
+        else:
+            inline = bytes(data)
+        with self._lock:
+            request_id = next(self._request_ids)
+            # Least loaded worker
+            worker = min(range(self.workers), key=self._in_flight.__getitem__)
+            self._in_flight[worker] += 1
+            self._pending[request_id] = _Request(future, slot, worker)
+            self._tasks[worker].put((request_id, slot, len(data), kind, shape, inline))
+        return future
+
+    async def predict(self, kind: str, data: Buffer, shape: Optional[Tuple[int, int]] = None) -> Prediction:
+        """
+        Score one request (see ``app.inference.run_task``) without blocking the event loop.
+
+        Waits in the default executor while every slot is in use. Raises
+        InferenceError when the worker could not score the input.
+        """
+        slot = -1
+        if len(data) <= self.slot_bytes:
+            slot = self._acquire_slot(timeout=0)
+            if slot is None:
+                waiting = asyncio.get_running_loop().run_in_executor(None, self._acquire_slot)
+                try:
+                    slot = await asyncio.shield(waiting)
+                except asyncio.CancelledError:
+                    # The executor thread still gets a slot eventually; give it back
+                    waiting.add_done_callback(lambda f: None if f.cancelled() or f.exception()
+                                              else self._release_slot(f.result()))
+                    raise
+        ok, result = await asyncio.wrap_future(self._dispatch(slot, kind, data, shape))
+        if not ok:
+            raise InferenceError(result)
+        return result
+
+    def _finish(self, request_id: int, ok: bool, result) -> None:
+        with self._lock:
+            request = self._pending.pop(request_id, None)
+            if request is None:
+                return
+            self._in_flight[request.worker] -= 1
+        self._release_slot(request.slot)
+        if not request.future.done():
+            request.future.set_result((ok, result))
+
+    def _fail_pending(self, matches, message: str) -> None:
+        with self._lock:
+            failed = [request_id for request_id, request in self._pending.items() if matches(request)]
+        for request_id in failed:
+            self._finish(request_id, False, message)
+
+    def _collect(self) -> None:
+        while True:
+            try:
+                index, request_id, ok, result = self._results.get(timeout=1.0)
+            except queue.Empty:
+                if self._stopping and not any(p is not None and p.is_alive() for p in self._processes):
+                    return
+                self._check_workers()
+                continue
+            if request_id is None:
+                self._ready[index].set()
+            else:
+                self._finish(request_id, ok, result)
+
+    def _check_workers(self) -> None:
+        if self._stopping:
+            return
+        for index, process in enumerate(self._processes):
+            if process.is_alive():
+                continue
+            if not self._started:
+                # Failed while loading the model; restarting would just fail again
+                self._startup_error = f"Inference worker {index} exited with code {process.exitcode} during startup"
+                self._ready[index].set()
+                continue
+            logger.error(f"Inference worker {index} exited with code {process.exitcode}, restarting")
+            self._fail_pending(lambda request: request.worker == index, "Inference worker exited unexpectedly")
+            self._spawn(index)
@@ -0,0 +1,264 @@
+"""
+On-demand profiling of a live instance (``POST /admin/profile``).
+
+A capture runs for a number of seconds or requests and combines:
+
+- a ``torch.profiler`` trace of the model's forward passes. The profiler
+  only records the thread that started it, so forward hooks start and stop
+  it around each forward pass, on whichever thread runs it (event loop,
+  threadpool or batcher); one forward pass is profiled at a time.
+- a Python sampling profile: a thread snapshots every thread's stack with
+  ``sys._current_frames()`` at a fixed interval, skipping threads that are
+  idle in a selector, lock or queue wait.
+
+With ``INFERENCE_MODE=process`` the forward passes run in the worker
+processes, out of reach of these hooks, so the torch part is skipped and the
+response says why (``"torch": null`` and a ``reason``).
+
+Nothing is installed outside a capture: the hooks are registered when it
+starts and removed when it ends, and the only per-request cost is the
+``active`` check in the request middleware.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import torch
+import torch.nn as nn
+from torch.profiler import ProfilerActivity, profile
+
+# (file name, function) of leaf frames where a thread is waiting rather than working
+IDLE_FRAMES = {
+    ('selectors.py', 'select'),
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('thread.py', '_worker'),
+    ('queues.py', '_feed'),
+    ('connection.py', '_recv'),
+    ('connection.py', '_poll'),
+}
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of all threads every ``interval`` seconds."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((os.path.basename(code.co_filename), code.co_name, frame.f_lineno))
+                    frame = frame.f_back
+                if (stack[0][0], stack[0][1]) in IDLE_FRAMES:
+                    self.idle_samples += 1
+                    continue
+                self.stacks[tuple(reversed(stack))] += 1
+                self.samples += 1
+
+    def top_functions(self, limit: int = 25) -> List[Dict]:
+        """Functions by samples spent in them (self) and in them or their callees (total)."""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1][:2]] += count
+            for function in {frame[:2] for frame in stack}:
+                total[function] += count
+        return [
+            {
+                'function': f"{name} ({filename})",
+                'self_pct': round(100.0 * own[(filename, name)] / max(self.samples, 1), 1),
+                'total_pct': round(100.0 * count / max(self.samples, 1), 1),
+            }
+            for (filename, name), count in total.most_common(limit)
+        ]
+
+    def collapsed(self) -> List[str]:
+        """Stacks in the collapsed format read by flamegraph.pl and speedscope."""
+        return [
+            ';'.join(f"{name} ({filename}:{line})" for filename, name, line in stack) + f" {count}"
+            for stack, count in self.stacks.most_common()
+        ]
+
+
+class TorchCapture:
+    """Profiles forward passes of ``model`` while attached."""
+
+    def __init__(self, model: nn.Module, max_traces: int = 20):
+        self.model = model
+        self.max_traces = max_traces
+        self.forward_passes = 0
+        self.skipped = 0
+        self.trace_events: List[Dict] = []
+        self.ops: Dict[str, List[float]] = {}
+        self._active = threading.local()
+        self._lock = threading.Lock()
+        self._results_lock = threading.Lock()
+        self._handles = []
+        self._activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            self._activities.append(ProfilerActivity.CUDA)
+
+    def attach(self) -> None:
+        self._handles = [self.model.register_forward_pre_hook(self._before),
+                         self.model.register_forward_hook(self._after, always_call=True)]
+
+    def detach(self) -> None:
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+
+    def _before(self, module, inputs) -> None:
+        # Concurrent forward passes (threadpool, jobs) run unprofiled rather than contending for the profiler
+        if not self._lock.acquire(blocking=False):
+            self.skipped += 1
+            return
+        prof = profile(activities=self._activities, record_shapes=True)
+        prof.__enter__()
+        self._active.prof = prof
+
+    def _after(self, module, inputs, output) -> None:
+        prof = getattr(self._active, 'prof', None)
+        if prof is None:
+            return
+        self._active.prof = None
+        try:
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+            prof.__exit__(None, None, None)
+            self._collect(prof)
+        finally:
+            self._lock.release()
+
+    def _collect(self, prof) -> None:
+        events = []
+        if self.forward_passes < self.max_traces:
+            with tempfile.NamedTemporaryFile(suffix='.json') as f:
+                prof.export_chrome_trace(f.name)
+                with open(f.name) as trace:
+                    events = json.load(trace).get('traceEvents', [])
+        with self._results_lock:
+            self.forward_passes += 1
+            self.trace_events.extend(events)
+            for event in prof.key_averages():
+                totals = self.ops.setdefault(event.key, [0, 0.0, 0.0])
+                totals[0] += event.count
+                totals[1] += event.self_cpu_time_total
+                totals[2] += event.cpu_time_total
+
+    def top_ops(self, limit: int = 25) -> List[Dict]:
+        """Operators by total self CPU time over all profiled forward passes."""
+        total_self = sum(totals[1] for totals in self.ops.values()) or 1.0
+        rows = sorted(self.ops.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [
+            {
+                'op': name,
+                'calls': calls,
+                'self_cpu_ms': round(self_us / 1000, 3),
+                'cpu_total_ms': round(total_us / 1000, 3),
+                'self_pct': round(100.0 * self_us / total_self, 1),
+            }
+            for name, (calls, self_us, total_us) in rows
+        ]
+
+
+class Profiler:
+    """Runs one capture at a time; see the module docstring."""
+
+    def __init__(self, model: nn.Module, torch_unavailable: Optional[str] = None):
+        self.model = model
+        # Why forward passes can't be traced in this process, if they can't
+        self.torch_unavailable = torch_unavailable
+        self.active = False
+        self.requests = 0
+        self._requests_done: Optional[asyncio.Event] = None
+        self._request_limit: Optional[int] = None
+
+    def request_done(self) -> None:
+        """Called by the request middleware for each finished inference request while active."""
+        self.requests += 1
+        if self._request_limit is not None and self.requests >= self._request_limit:
+            self._requests_done.set()
+
+    async def capture(self, seconds: float, requests: Optional[int] = None, interval: float = 0.005,
+                      max_traces: int = 20) -> Dict:
+        """
+        Profile until ``seconds`` have passed or ``requests`` inference requests have finished.
+
+        Returns:
+            Summary of top Python functions and torch operators, the collapsed Python
+            stacks and the Chrome trace (``chrome://tracing``, Perfetto) of up to
+            ``max_traces`` forward passes
+        """
+        if self.active:
+            raise RuntimeError("A profile is already being captured")
+        sampler = SamplingProfiler(interval)
+        torch_capture = TorchCapture(self.model, max_traces) if self.torch_unavailable is None else None
+        self.requests = 0
+        self._request_limit = requests
+        self._requests_done = asyncio.Event()
+        start = time.monotonic()
+
+        if torch_capture is not None:
+            torch_capture.attach()
+        sampler.start()
+        self.active = True
+        try:
+            await asyncio.wait_for(self._requests_done.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.active = False
+            sampler.stop()
+            if torch_capture is not None:
+                torch_capture.detach()
+            self._request_limit = None
+
+        report = {
+            'seconds': round(time.monotonic() - start, 3),
+            'requests': self.requests,
+            'python': {
+                'interval_ms': interval * 1000,
+                'samples': sampler.samples,
+                'idle_samples': sampler.idle_samples,
+                'top_functions': sampler.top_functions(),
+                'collapsed_stacks': sampler.collapsed(),
+            },
+        }
+        if torch_capture is None:
+            report.update({'torch': None, 'reason': self.torch_unavailable})
+        else:
+            report.update({
+                'forward_passes': torch_capture.forward_passes,
+                'forward_passes_not_profiled': torch_capture.skipped,
+                'torch': {
+                    'top_ops': torch_capture.top_ops(),
+                    'trace': {'traceEvents': torch_capture.trace_events},
+                },
+            })
+        return report
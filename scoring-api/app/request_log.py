@@ -0,0 +1,182 @@
+"""
+Non-blocking logging: one structured JSON record per inference request.
+
+``RequestLog.start`` routes the root logger through a bounded queue; a
+``QueueListener`` thread formats and writes everything to stderr, so no
+thread that logs ever waits on the stream. Records that don't fit in the
+queue are dropped and counted instead of blocking.
+
+The request middleware opens a ``RequestRecord`` per inference request
+(held in a context variable, so the endpoint and ``infer`` can add sizes and
+stage timings) and hands it to ``RequestLog.finish``, which keeps every
+error and a ``sample_rate`` fraction of successes. The JSON is only built
+on the listener thread. A record looks like::
+
+    {"ts": "2024-05-01T12:00:00.123+00:00", "request_id": "4f0c...", "path": "/predict",
+     "status": 200, "outcome": "success", "bytes": 183422, "model": "mobilenetv3",
+     "inference_mode": "inline", "timings_ms": {"read": 0.4, "preprocess": 21.3,
+     "forward": 17.9, "total": 41.2}}
+"""
+
+import contextlib
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from typing import Any, Dict, Iterator, Optional
+
+# Errors are truncated so one oversized exception message can't bloat the log
+MAX_ERROR_LENGTH = 500
+
+_current: contextvars.ContextVar = contextvars.ContextVar('request_record', default=None)
+
+
+class RequestRecord:
+    """Fields of one request's log record, filled in while it is served."""
+
+    __slots__ = ('request_id', 'path', 'started', 'fields', 'timings', 'outcome', 'error')
+
+    def __init__(self, request_id: str, path: str):
+        self.request_id = request_id
+        self.path = path
+        self.started = time.perf_counter()
+        self.fields: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {}
+        self.outcome = 'success'
+        self.error: Optional[str] = None
+
+    def fail(self, error) -> None:
+        self.outcome = 'error'
+        self.error = str(error)[:MAX_ERROR_LENGTH]
+
+
+def current() -> Optional[RequestRecord]:
+    """Record of the request being served, if any."""
+    return _current.get()
+
+
+def note(**fields) -> None:
+    """Add fields (sizes, shapes, ...) to the current request's record."""
+    record = _current.get()
+    if record is not None:
+        record.fields.update(fields)
+
+
+def fail(error) -> None:
+    """Mark the current request as failed with ``error`` (always logged)."""
+    record = _current.get()
+    if record is not None:
+        record.fail(error)
+
+
+@contextlib.contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Record the time spent in the block as ``stage`` of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = _current.get()
+        if record is not None:
+            record.timings[stage] = (time.perf_counter() - start) * 1000
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue: queue.Queue, stats: Dict[str, int]):
+        super().__init__(log_queue)
+        self.stats = stats
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.stats['dropped'] += 1
+
+
+class _Formatter(logging.Formatter):
+    """Request records as one line of JSON, everything else in ``logging.basicConfig``'s format."""
+
+    def __init__(self):
+        super().__init__(logging.BASIC_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = getattr(record, 'request', None)
+        if data is None:
+            return super().format(record)
+        ts = datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+        return json.dumps({'ts': ts.isoformat(timespec='milliseconds'), **data}, separators=(',', ':'))
+
+
+class RequestLog:
+    """The logging queue, its listener thread and the per-request records; see the module docstring."""
+
+    def __init__(self, sample_rate: float = 1.0, queue_size: int = 10000, level: int = logging.INFO,
+                 static_fields: Optional[Dict[str, Any]] = None, stream=None):
+        self.sample_rate = sample_rate
+        self.level = level
+        # Fields repeated in every record, e.g. the model name
+        self.static_fields = static_fields or {}
+        self.stats = {'logged': 0, 'sampled_out': 0, 'dropped': 0}
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._handler = _DroppingQueueHandler(self._queue, self.stats)
+        stream_handler = logging.StreamHandler(stream or sys.stderr)
+        stream_handler.setFormatter(_Formatter())
+        self._listener = logging.handlers.QueueListener(self._queue, stream_handler)
+        self._running = False
+
+    def start(self) -> None:
+        """Route the root logger through the queue and start writing; a no-op when already started."""
+        if self._running:
+            return
+        root = logging.getLogger()
+        root.addHandler(self._handler)
+        root.setLevel(self.level)
+        self._listener.start()
+        self._running = True
+
+    def stop(self) -> None:
+        """Write out what is queued and detach from the root logger."""
+        if not self._running:
+            return
+        logging.getLogger().removeHandler(self._handler)
+        self._listener.stop()
+        self._running = False
+
+    def begin(self, request_id: str, path: str) -> RequestRecord:
+        record = RequestRecord(request_id, path)
+        _current.set(record)
+        return record
+
+    def finish(self, record: RequestRecord, status: int) -> None:
+        """Queue the record of a finished request: always for errors, a sample of successes."""
+        if status >= 400:
+            record.outcome = 'error'
+        if record.outcome == 'success' and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.stats['sampled_out'] += 1
+            return
+        record.timings['total'] = (time.perf_counter() - record.started) * 1000
+        data = {
+            'request_id': record.request_id,
+            'path': record.path,
+            'status': status,
+            'outcome': record.outcome,
+            **record.fields,
+            **self.static_fields,
+            'timings_ms': {stage: round(ms, 2) for stage, ms in record.timings.items()},
+        }
+        if record.error is not None:
+            data['error'] = record.error
+        # Built directly rather than through Logger.info, which would also look up the caller's frame
+        log_record = logging.makeLogRecord({
+            'name': 'app.requests', 'levelno': logging.INFO, 'levelname': 'INFO', 'msg': '', 'request': data,
+        })
+        try:
+            self._queue.put_nowait(log_record)
+            self.stats['logged'] += 1
+        except queue.Full:
+            self.stats['dropped'] += 1
@@ -0,0 +1,63 @@
+"""
+Per-phase timing of service startup, for ``python -m app --profile-startup``.
+
+Nothing heavy is imported at module level: the first phase measures the
+torch/torchvision import itself, so this must run in a fresh process.
+"""
+
+import os
+import time
+from typing import Dict, Optional
+
+
+def profile_startup(model_name: str = 'mobilenetv3', weights_path: Optional[str] = None) -> Dict[str, object]:
+    """
+    Time each startup phase of serving ``model_name`` from ``weights_path``.
+
+    Phases are the torch/torchvision import, the weight read, the architecture
+    build, attaching the weights to the module and the first forward pass on a
+    preprocessed image.
+
+    Returns:
+        Dictionary with the model, weights path, input size and per-phase milliseconds
+    """
+    phases = {}
+    start = time.perf_counter()
+
+    import torch
+    import torchvision  # noqa: F401
+    phases['import_torch'] = time.perf_counter() - start
+
+    mark = time.perf_counter()
+    from app.models.loader import build_model, read_checkpoint
+    from app.models.registry import DEFAULT_WEIGHTS, build_transform
+    phases['import_app'] = time.perf_counter() - mark
+
+    weights_path = weights_path or DEFAULT_WEIGHTS[model_name]
+    mark = time.perf_counter()
+    checkpoint = read_checkpoint(weights_path)
+    phases['read_weights'] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    model, input_size, state_dict = build_model(model_name, checkpoint)
+    phases['build'] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    model.load_state_dict(state_dict, assign=True)
+    model.eval()
+    phases['load_state_dict'] = time.perf_counter() - mark
+
+    from PIL import Image
+    image = Image.new('RGB', (input_size, input_size), (180, 120, 100))
+    mark = time.perf_counter()
+    with torch.inference_mode():
+        model(build_transform(input_size)(image).unsqueeze(0))
+    phases['first_forward'] = time.perf_counter() - mark
+
+    phases['total'] = time.perf_counter() - start
+    return {
+        'model': model_name,
+        'weights': os.path.abspath(weights_path),
+        'input_size': input_size,
+        'phases_ms': {name: seconds * 1000 for name, seconds in phases.items()},
+    }
@@ -0,0 +1,235 @@
+"""
+Per-user similarity index over lesion embeddings.
+
+Each user's scans are kept as rows of an L2-normalized float32 matrix, so
+cosine similarity to a query is one matrix-vector product and top-k is an
+``argpartition``. Large indexes can additionally be partitioned with a small
+k-means (IVF): a query then only scores the rows of its ``n_probe`` nearest
+partitions.
+
+Each user's index is a directory: vectors are appended as raw float32 rows
+to ``vectors.f32`` and scan ids as lines to ``ids.txt``, so adding a scan
+writes one row rather than the whole matrix; IVF centroids are saved to
+``ivf.npz`` whenever they are rebuilt.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Build IVF partitions once an index has this many vectors, and rebuild when it doubles
+IVF_MIN_VECTORS = 4096
+IVF_VECTORS_PER_LIST = 256
+# k-means is trained on at most this many vectors per partition
+IVF_TRAIN_PER_LIST = 64
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def kmeans(vectors: np.ndarray, n_clusters: int, n_iter: int = 10, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Spherical k-means on normalized vectors.
+
+    Returns:
+        (centroids of shape (n_clusters, dim), cluster assignment per vector)
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = (vectors @ centroids.T).argmax(1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        # Empty clusters keep their previous centroid
+        filled = counts > 0
+        centroids[filled] = _normalize(sums[filled])
+    return centroids, (vectors @ centroids.T).argmax(1)
+
+
+class VectorIndex:
+    """Cosine-similarity index of scan embeddings with optional IVF partitioning.
+
+    With a ``path`` directory every ``add`` is appended to disk and the index
+    can be reopened with ``VectorIndex.open``.
+    """
+
+    def __init__(self, dim: int, path: Optional[str] = None):
+        self.dim = dim
+        self.path = path
+        # Rows beyond self.size are spare capacity, so appends are amortized O(1)
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self.ids: List[str] = []
+        self._rows_by_id: Dict[str, List[int]] = {}
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments: Optional[np.ndarray] = None
+        self._ivf_size = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:self.size]
+
+    def _append(self, ids: List[str], vectors: np.ndarray) -> None:
+        needed = self.size + len(ids)
+        if needed > len(self._vectors):
+            grown = np.empty((max(needed, 2 * len(self._vectors), 64), self.dim), dtype=np.float32)
+            grown[:self.size] = self.vectors
+            self._vectors = grown
+        self._vectors[self.size:needed] = vectors
+        if self.centroids is not None:
+            self.assignments = np.concatenate([self.assignments, (vectors @ self.centroids.T).argmax(1)])
+        for row, scan_id in enumerate(ids, start=self.size):
+            self._rows_by_id.setdefault(scan_id, []).append(row)
+        self.ids.extend(ids)
+
+    def add(self, ids: List[str], vectors: np.ndarray) -> None:
+        vectors = _normalize(np.atleast_2d(vectors))
+        if vectors.shape != (len(ids), self.dim):
+            raise ValueError(f"Expected {len(ids)} vectors of dimension {self.dim}, got {vectors.shape}")
+        if any('\n' in scan_id for scan_id in ids):
+            raise ValueError("Scan ids must not contain newlines")
+        self._append(ids, vectors)
+
+        if self.path is not None:
+            with open(os.path.join(self.path, 'vectors.f32'), 'ab') as f:
+                f.write(vectors.tobytes())
+            with open(os.path.join(self.path, 'ids.txt'), 'a', encoding='utf-8') as f:
+                f.writelines(scan_id + '\n' for scan_id in ids)
+
+        if self.size >= IVF_MIN_VECTORS and self.size >= 2 * self._ivf_size:
+            self.build_ivf()
+
+    def build_ivf(self, n_lists: Optional[int] = None, n_iter: int = 10) -> None:
+        """Partition the index into ``n_lists`` k-means clusters (default: one per 256 vectors)."""
+        n_lists = min(n_lists or max(1, self.size // IVF_VECTORS_PER_LIST), self.size)
+        sample = self.vectors
+        if len(sample) > n_lists * IVF_TRAIN_PER_LIST:
+            rows = np.random.default_rng(0).choice(len(sample), n_lists * IVF_TRAIN_PER_LIST, replace=False)
+            sample = sample[rows]
+        self.centroids, _ = kmeans(sample, n_lists, n_iter)
+        self.assignments = (self.vectors @ self.centroids.T).argmax(1)
+        self._ivf_size = self.size
+        if self.path is not None:
+            tmp_path = os.path.join(self.path, 'ivf.tmp.npz')
+            np.savez(tmp_path, centroids=self.centroids, assignments=self.assignments)
+            os.replace(tmp_path, os.path.join(self.path, 'ivf.npz'))
+
+    def search(self, query: np.ndarray, k: int = 5, n_probe: Optional[int] = 8,
+               exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Most similar stored scans to ``query``.
+
+        Args:
+            query: Embedding of shape (dim,)
+            k: Number of results
+            n_probe: IVF partitions to scan; ``None`` (or no IVF built) scans every vector
+            exclude: Scan id to leave out of the results, e.g. the query scan itself
+
+        Returns:
+            (scan id, cosine similarity) pairs, most similar first
+        """
+        if self.size == 0:
+            return []
+        query = _normalize(query)
+        rows = np.arange(self.size)
+        if self.centroids is not None and n_probe is not None and n_probe < len(self.centroids):
+            lists = _top_k(self.centroids @ query, n_probe)
+            rows = np.flatnonzero(np.isin(self.assignments, lists))
+        scores = self.vectors[rows] @ query if len(rows) < self.size else self.vectors @ query
+
+        if exclude in self._rows_by_id:
+            scores[np.isin(rows, self._rows_by_id[exclude])] = -np.inf
+        top = _top_k(scores, k)
+        return [(self.ids[rows[i]], float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    @classmethod
+    def open(cls, path: str, dim: int) -> 'VectorIndex':
+        """Open (or create) the index stored in directory ``path``."""
+        os.makedirs(path, exist_ok=True)
+        index = cls(dim, path)
+        ids_path = os.path.join(path, 'ids.txt')
+        if not os.path.exists(ids_path):
+            return index
+        with open(ids_path, encoding='utf-8') as f:
+            ids = f.read().splitlines()
+        vectors_path = os.path.join(path, 'vectors.f32')
+        vectors = np.fromfile(vectors_path, dtype=np.float32)
+        vectors = vectors[:len(vectors) // dim * dim].reshape(-1, dim)
+        count = min(len(ids), len(vectors))
+        if count != len(ids) or count * dim * 4 != os.path.getsize(vectors_path):
+            # An interrupted append left one file ahead of the other; trim both to the complete rows
+            with open(ids_path, 'w', encoding='utf-8') as f:
+                f.writelines(scan_id + '\n' for scan_id in ids[:count])
+            vectors[:count].tofile(vectors_path)
+        index._append(ids[:count], vectors[:count])
+
+        ivf_path = os.path.join(path, 'ivf.npz')
+        if os.path.exists(ivf_path):
+            with np.load(ivf_path) as data:
+                index.centroids = data['centroids']
+                assignments = data['assignments'][:count]
+            rest = (index.vectors[len(assignments):] @ index.centroids.T).argmax(1)
+            index.assignments = np.concatenate([assignments, rest])
+            index._ivf_size = len(assignments)
+        return index
+
+
+class UserIndexStore:
+    """One VectorIndex per user, opened lazily from ``root_dir``.
+
+    Only the ``max_open`` most recently used indexes stay in memory. Calls
+    block on file reads, and on k-means when an index reaches an IVF rebuild,
+    so the API makes them from worker threads.
+    """
+
+    def __init__(self, root_dir: str, dim: int, max_open: int = 256):
+        self.root_dir = root_dir
+        self.dim = dim
+        self.max_open = max_open
+        # Least recently used first; evicted indexes are reopened from disk when needed again
+        self._indexes: 'OrderedDict[str, VectorIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+
+    def _path(self, user_id: str) -> str:
+        # Hashed so arbitrary user ids map to safe directory names
+        return os.path.join(self.root_dir, hashlib.sha256(user_id.encode('utf-8')).hexdigest())
+
+    def _get(self, user_id: str) -> VectorIndex:
+        index = self._indexes.get(user_id)
+        if index is not None:
+            self._indexes.move_to_end(user_id)
+            return index
+        index = self._indexes[user_id] = VectorIndex.open(self._path(user_id), self.dim)
+        while len(self._indexes) > self.max_open:
+            self._indexes.popitem(last=False)
+        return index
+
+    def search(self, user_id: str, query: np.ndarray, k: int = 5,
+               exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        with self._lock:
+            return self._get(user_id).search(query, k, exclude=exclude)
+
+    def add(self, user_id: str, scan_id: str, vector: np.ndarray) -> None:
+        with self._lock:
+            self._get(user_id).add([scan_id], vector)
@@ -0,0 +1,129 @@
+"""
+Startup benchmark: time-to-first-prediction and memory for each weight format.
+
+Every run is a fresh Python process that imports the app's model code, loads
+the weights, preprocesses one image and runs one forward pass:
+
+    pickle       original path: build with random init, torch.load, copy into the module
+    mmap-pth     app.models.loader with torch.load(mmap=True) and assign=True
+    safetensors  app.models.loader with the memory-mapped safetensors reader
+
+RssAnon is private memory; RssFile is file-backed pages that other processes
+serving the same weights share through the page cache. Runs use a warm page
+cache (the file is read once before timing).
+
+Usage:
+    python convert_weights.py app/models/efficientnet_b3_model.pth
+    python bench_startup.py --model mobilenetv3 --weights app/models/efficientnet_b3_model.pth --repeats 5
+"""
+
+import time
+
+_PROCESS_START = time.perf_counter()
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import statistics  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+
+MODES = ['pickle', 'mmap-pth', 'safetensors']
+
+
+def _memory_kb():
+    fields = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'RssAnon', 'RssFile'):
+                fields[key] = int(value.split()[0])
+    return fields
+
+
+def run_one(mode, model_name, weights):
+    import numpy as np
+    import torch
+    from PIL import Image
+
+    from app.models.loader import load_model
+    from app.models.registry import MODELS, build_transform
+    imported = time.perf_counter()
+
+    if mode == 'pickle':
+        model = MODELS[model_name](num_classes=2)
+        model.load_state_dict(torch.load(weights, map_location='cpu'))
+        model.eval()
+        input_size = model.input_size
+    else:
+        model, input_size = load_model(model_name, weights)
+    loaded = time.perf_counter()
+
+    image = Image.fromarray(np.random.default_rng(0).integers(0, 256, (480, 640, 3), dtype=np.uint8))
+    with torch.inference_mode():
+        model(build_transform(input_size)(image).unsqueeze(0))
+    predicted = time.perf_counter()
+
+    memory = _memory_kb()
+    print(json.dumps({
+        'import_s': imported - _PROCESS_START,
+        'load_s': loaded - imported,
+        'first_forward_s': predicted - loaded,
+        'time_to_first_prediction_s': predicted - _PROCESS_START,
+        'rss_mb': memory.get('VmRSS', 0) / 1024,
+        'rss_anon_mb': memory.get('RssAnon', 0) / 1024,
+        'rss_file_mb': memory.get('RssFile', 0) / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare cold start across weight formats')
+    parser.add_argument('--model', default='mobilenetv3')
+    parser.add_argument('--weights', required=True, help='.pth weights; the .safetensors file next to it is used too')
+    parser.add_argument('--safetensors', help='Safetensors file (default: --weights with a .safetensors extension)')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', default='startup_report.json')
+    parser.add_argument('--run-one', nargs=2, metavar=('MODE', 'WEIGHTS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_one(args.run_one[0], args.model, args.run_one[1])
+        return
+
+    safetensors = args.safetensors or os.path.splitext(args.weights)[0] + '.safetensors'
+    if not os.path.exists(safetensors):
+        sys.exit(f"{safetensors} not found; create it with: python convert_weights.py {args.weights}")
+    paths = {'pickle': args.weights, 'mmap-pth': args.weights, 'safetensors': safetensors}
+    for path in set(paths.values()):
+        with open(path, 'rb') as f:
+            while f.read(1 << 24):
+                pass
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    report = {}
+    for mode in MODES:
+        runs = []
+        for _ in range(args.repeats):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--model', args.model, '--weights', args.weights,
+                 '--run-one', mode, paths[mode]],
+                cwd=here, capture_output=True, text=True, check=True,
+            ).stdout
+            runs.append(json.loads(out.strip().splitlines()[-1]))
+        report[mode] = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+    with open(args.output, 'w') as f:
+        json.dump({'model': args.model, 'weights': args.weights, 'repeats': args.repeats, 'results': report}, f,
+                  indent=2)
+
+    print(f"{'mode':<12} {'import s':>9} {'load s':>7} {'forward s':>10} {'TTFP s':>7} "
+          f"{'RSS MB':>7} {'anon MB':>8} {'file MB':>8}")
+    for mode, row in report.items():
+        print(f"{mode:<12} {row['import_s']:>9.2f} {row['load_s']:>7.3f} {row['first_forward_s']:>10.3f} "
+              f"{row['time_to_first_prediction_s']:>7.2f} {row['rss_mb']:>7.0f} {row['rss_anon_mb']:>8.0f} "
+              f"{row['rss_file_mb']:>8.0f}")
+    print(f"\nMedian of {args.repeats} runs per mode, report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
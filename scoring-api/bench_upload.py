@@ -0,0 +1,152 @@
+"""
+Upload benchmark: bandwidth and server CPU per request for each upload path.
+
+Starts the API in a subprocess and sends the same synthetic lesions as
+
+    multipart   full camera-size JPEG to /predict (server decodes and resizes)
+    raw         pre-resized 224x224x3 uint8 pixels to /predict/raw
+    jpeg        pre-resized 224x224 JPEG to /predict/raw
+
+Server CPU is read from /proc/<pid>/stat around each batch of requests, so it
+covers everything the server process does (HTTP parsing, decode, resize,
+normalization and the forward pass). The client-side resize/encode cost the
+pre-resized paths move onto the phone is reported separately.
+
+Usage:
+    python bench_upload.py --requests 50 --camera-size 1536 --quality 90
+"""
+
+import argparse
+import io
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+import requests
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from synthetic_lesions import generate  # noqa: E402
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _cpu_seconds(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def _start_server(port, env=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--host', '127.0.0.1', '--port', str(port),
+         '--log-level', 'warning'],
+        cwd=here,
+        env=dict(os.environ, **(env or {})),
+    )
+    for _ in range(600):
+        try:
+            requests.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('API did not start')
+
+
+def _client_payloads(camera_jpegs, size, quality):
+    """Resize and encode on the 'client'; returns (raw payloads, jpeg payloads, ms per image)."""
+    raw, small, start = [], [], time.perf_counter()
+    for data in camera_jpegs:
+        image = Image.open(io.BytesIO(data)).convert('RGB').resize((size, size), Image.BILINEAR)
+        raw.append(np.asarray(image).tobytes())
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=quality)
+        small.append(buffer.getvalue())
+    return raw, small, (time.perf_counter() - start) * 1000 / len(camera_jpegs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare multipart JPEG and pre-resized uploads')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per path (default: 50)')
+    parser.add_argument('--images', type=int, default=10, help='Distinct synthetic images (default: 10)')
+    parser.add_argument('--camera-size', type=int, default=1536, help='Full-size upload resolution')
+    parser.add_argument('--input-size', type=int, default=224, help='Model input resolution')
+    parser.add_argument('--quality', type=int, default=90, help='JPEG quality (default: 90)')
+    parser.add_argument('--output', default='upload_report.json')
+    args = parser.parse_args()
+
+    print(f"Generating {args.images} synthetic {args.camera_size}px lesions...")
+    camera = [item['jpeg'] for item in generate(args.images, args.camera_size, args.quality)]
+    raw, small, client_ms = _client_payloads(camera, args.input_size, args.quality)
+    shape = f'{args.input_size},{args.input_size},3'
+
+    port = _free_port()
+    server = _start_server(port)
+    url = f'http://127.0.0.1:{port}'
+    paths = {
+        'multipart': lambda i: requests.Request(
+            'POST', f'{url}/predict', files={'file': ('image.jpg', camera[i], 'image/jpeg')}),
+        'raw': lambda i: requests.Request(
+            'POST', f'{url}/predict/raw', data=raw[i],
+            headers={'X-Image-Shape': shape, 'Content-Type': 'application/octet-stream'}),
+        'jpeg': lambda i: requests.Request(
+            'POST', f'{url}/predict/raw', data=small[i],
+            headers={'X-Image-Shape': shape, 'Content-Type': 'image/jpeg'}),
+    }
+
+    report = {}
+    try:
+        with requests.Session() as session:
+            for name, build in paths.items():
+                prepared = [build(i).prepare() for i in range(args.images)]
+                for request in prepared[:3]:
+                    session.send(request).raise_for_status()
+
+                latencies, body_bytes = [], []
+                cpu_start = _cpu_seconds(server.pid)
+                for n in range(args.requests):
+                    request = prepared[n % args.images]
+                    start = time.perf_counter()
+                    result = session.send(request).json()
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    body_bytes.append(len(request.body))
+                    if result.get('status') != 'success':
+                        raise RuntimeError(f'{name}: {result}')
+                cpu = _cpu_seconds(server.pid) - cpu_start
+
+                report[name] = {
+                    'request_kb': statistics.mean(body_bytes) / 1024,
+                    'server_cpu_ms': cpu * 1000 / args.requests,
+                    'latency_median_ms': statistics.median(latencies),
+                    'client_prepare_ms': 0.0 if name == 'multipart' else client_ms,
+                }
+    finally:
+        server.terminate()
+        server.wait()
+
+    with open(args.output, 'w') as f:
+        json.dump({'camera_size': args.camera_size, 'input_size': args.input_size, 'quality': args.quality,
+                   'requests': args.requests, 'results': report}, f, indent=2)
+
+    print(f"\n{'path':<10} {'request KB':>11} {'server CPU ms':>14} {'latency ms':>11} {'client ms':>10}")
+    for name, row in report.items():
+        print(f"{name:<10} {row['request_kb']:>11.1f} {row['server_cpu_ms']:>14.1f} "
+              f"{row['latency_median_ms']:>11.1f} {row['client_prepare_ms']:>10.1f}")
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
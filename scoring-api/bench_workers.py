@@ -0,0 +1,114 @@
+"""
+Throughput benchmark of the inference modes (thread vs process by default).
+
+Starts the API once per INFERENCE_MODE and sends the same synthetic lesions
+to /predict from ``--concurrency`` client threads for ``--duration`` seconds,
+reporting requests per second and latency percentiles. Run it on the box you
+deploy to (8+ cores): the process pool only pays off when there are cores
+for the workers to run on. The client shares those cores, so the numbers are
+a lower bound for a remote client.
+
+Usage:
+    python bench_workers.py --concurrency 16 --duration 30 --workers 8
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_upload import _free_port, _start_server  # noqa: E402
+from synthetic_lesions import generate  # noqa: E402
+
+
+def _client(url, images, deadline, latencies, errors):
+    with requests.Session() as session:
+        n = 0
+        while time.perf_counter() < deadline:
+            image = images[n % len(images)]
+            start = time.perf_counter()
+            result = session.post(f'{url}/predict', files={'file': ('image.jpg', image, 'image/jpeg')}).json()
+            if result.get('status') == 'success':
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors.append(result)
+            n += 1
+
+
+def run_mode(mode, images, concurrency, duration, workers, warmup):
+    env = {'INFERENCE_MODE': mode, 'JOB_WORKERS': '0'}
+    if workers:
+        env['INFERENCE_WORKERS'] = str(workers)
+    port = _free_port()
+    server = _start_server(port, env)
+    url = f'http://127.0.0.1:{port}'
+    try:
+        _run_clients(url, images, concurrency, warmup, [], [])
+        latencies, errors = [], []
+        start = time.perf_counter()
+        _run_clients(url, images, concurrency, duration, latencies, errors)
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+    if errors:
+        raise RuntimeError(f'{mode}: {errors[0]}')
+    latencies.sort()
+    return {
+        'requests_per_second': len(latencies) / elapsed,
+        'latency_median_ms': statistics.median(latencies),
+        'latency_p95_ms': latencies[int(0.95 * (len(latencies) - 1))],
+        'requests': len(latencies),
+    }
+
+
+def _run_clients(url, images, concurrency, duration, latencies, errors):
+    deadline = time.perf_counter() + duration
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(_client, url, images, deadline, latencies, errors) for _ in range(concurrency)]:
+            future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare inference modes under concurrent load')
+    parser.add_argument('--modes', nargs='+', default=['thread', 'process'],
+                        choices=['inline', 'thread', 'process', 'batch'])
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients (default: 16)')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds measured per mode (default: 30)')
+    parser.add_argument('--warmup', type=float, default=5, help='Unmeasured seconds per mode (default: 5)')
+    parser.add_argument('--workers', type=int, help='INFERENCE_WORKERS for process mode (default: one per core)')
+    parser.add_argument('--images', type=int, default=10, help='Distinct synthetic images (default: 10)')
+    parser.add_argument('--size', type=int, default=1024, help='Upload resolution (default: 1024)')
+    parser.add_argument('--output', default='workers_report.json')
+    args = parser.parse_args()
+
+    print(f"Generating {args.images} synthetic {args.size}px lesions...")
+    images = [item['jpeg'] for item in generate(args.images, args.size, 90)]
+
+    report = {}
+    for mode in args.modes:
+        print(f"Benchmarking {mode} mode ({args.concurrency} clients, {args.duration:.0f}s)...")
+        report[mode] = run_mode(mode, images, args.concurrency, args.duration, args.workers, args.warmup)
+
+    with open(args.output, 'w') as f:
+        json.dump({'cpu_count': os.cpu_count(), 'concurrency': args.concurrency, 'size': args.size,
+                   'workers': args.workers, 'results': report}, f, indent=2)
+
+    print(f"\n{os.cpu_count()} CPUs, {args.concurrency} clients, {args.size}px JPEGs")
+    print(f"{'mode':<8} {'req/s':>8} {'median ms':>10} {'p95 ms':>8}")
+    for mode, row in report.items():
+        print(f"{mode:<8} {row['requests_per_second']:>8.1f} {row['latency_median_ms']:>10.1f} "
+              f"{row['latency_p95_ms']:>8.1f}")
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
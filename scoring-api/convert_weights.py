@@ -0,0 +1,44 @@
+"""
+Convert served weights from a pickled .pth checkpoint to safetensors.
+
+Plain state dicts and checkpoints with metadata (channel_config from
+ml/fabian/prune.py, input_size from ml/fabian/resolution_sweep.py) are both
+supported; metadata is kept in the safetensors header. Point MODEL_PATH at
+the result to serve it memory-mapped.
+
+Usage:
+    python convert_weights.py app/models/efficientnet_b3_model.pth
+    python convert_weights.py pruned/step_3.pth --output app/models/pruned.safetensors
+"""
+
+import argparse
+import json
+import os
+
+import torch
+from safetensors.torch import save_file
+
+
+def convert(src: str, dst: str) -> None:
+    checkpoint = torch.load(src, map_location='cpu', weights_only=True)
+    metadata = {}
+    if 'state_dict' in checkpoint:
+        metadata = {key: json.dumps(checkpoint[key])
+                    for key in ('arch', 'channel_config', 'input_size') if key in checkpoint}
+        checkpoint = checkpoint['state_dict']
+    save_file({name: tensor.contiguous() for name, tensor in checkpoint.items()}, dst, metadata)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert .pth weights to safetensors')
+    parser.add_argument('weights', help='.pth state dict or checkpoint')
+    parser.add_argument('--output', help='Output path (default: same name with .safetensors)')
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.weights)[0] + '.safetensors'
+    convert(args.weights, output)
+    print(f"Wrote {output} ({os.path.getsize(output) / 1e6:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
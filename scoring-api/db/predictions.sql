@@ -0,0 +1,24 @@
+-- predictions table from create_tables.sql for a local Postgres container.
+-- Supabase provides auth.users and uuid-ossp; a minimal auth.users stands in for it here.
+CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+
+CREATE SCHEMA IF NOT EXISTS auth;
+CREATE TABLE IF NOT EXISTS auth.users (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4()
+);
+
+CREATE TABLE IF NOT EXISTS predictions (
+  id UUID DEFAULT uuid_generate_v4() PRIMARY KEY,
+  user_id UUID REFERENCES auth.users(id),
+  -- NULL for server-side rows of requests without an image_url
+  image_url TEXT,
+  prediction TEXT NOT NULL,
+  confidence FLOAT NOT NULL,
+  low_risk_probability FLOAT NOT NULL,
+  high_risk_probability FLOAT NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL
+);
+
+INSERT INTO auth.users (id) VALUES
+  ('a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11')
+ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,90 @@
+import asyncio
+import random
+import time
+
+import torch
+
+from app.batching import AdaptiveBatcher, BatchController, BatchCostModel
+
+# Simulated forward pass: fixed overhead plus a smaller cost per image, as on CPU
+OVERHEAD_MS = 8.0
+PER_IMAGE_MS = 1.5
+
+
+def _costs():
+    costs = BatchCostModel()
+    for batch_size in (1, 2, 4, 8):
+        costs.observe(batch_size, OVERHEAD_MS + PER_IMAGE_MS * batch_size)
+    return costs
+
+
+def test_controller():
+    """No waiting when traffic is sparse, batching when it is dense, backing off after an SLO miss."""
+    costs = _costs()
+
+    quiet = BatchController(slo_ms=200)
+    quiet.update(costs, arrival_rate=0.5, p95_ms=20)
+    assert quiet.max_wait_ms == 0, quiet.describe()
+
+    busy = BatchController(slo_ms=200)
+    busy.update(costs, arrival_rate=400, p95_ms=60)
+    assert busy.max_batch == 16, busy.describe()  # capped at twice the largest measured size
+    assert 0 < busy.max_wait_ms <= 1000 * 15 / 400, busy.describe()
+    assert 2 * costs.predict(busy.max_batch) + busy.max_wait_ms <= busy.budget * busy.slo_ms
+
+    tight = BatchController(slo_ms=40)
+    tight.update(costs, arrival_rate=50, p95_ms=60)
+    assert tight.budget < 0.8
+    assert 2 * costs.predict(tight.max_batch) <= tight.budget * tight.slo_ms, tight.describe()
+
+    # Arrivals outpace unbatched inference: the miss is queueing, so the budget is kept
+    overloaded = BatchController(slo_ms=40)
+    overloaded.update(costs, arrival_rate=400, p95_ms=60)
+    assert overloaded.budget == 0.8 and overloaded.max_batch > 1, overloaded.describe()
+    print(f"quiet {quiet.describe()}\nbusy  {busy.describe()}\ntight {tight.describe()}\n"
+          f"overloaded {overloaded.describe()}")
+    return True
+
+
+def _simulated_model(batch):
+    time.sleep((OVERHEAD_MS + PER_IMAGE_MS * len(batch)) / 1000)
+    return [(0, 1.0, [1.0, 0.0])] * len(batch)
+
+
+async def _load(batcher, rate, seconds):
+    rng = random.Random(0)
+    tasks = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        tasks.append(asyncio.ensure_future(batcher.submit(torch.zeros(1, 3, 8, 8))))
+        await asyncio.sleep(rng.expovariate(rate))
+    await asyncio.gather(*tasks)
+
+
+async def _run_batcher(slo_ms):
+    batcher = AdaptiveBatcher(_simulated_model, BatchController(slo_ms), update_interval=0.5)
+    await batcher.start()
+    try:
+        # Sparse, then more traffic than unbatched inference (about 100/s) could serve
+        await _load(batcher, rate=5, seconds=2)
+        sparse = batcher.describe()
+        await _load(batcher, rate=300, seconds=6)
+        busy = batcher.describe()
+    finally:
+        await batcher.stop()
+    return sparse, busy
+
+
+def test_batcher(slo_ms=150):
+    """Under a simulated load the batcher batches enough to keep up and stays within the SLO."""
+    sparse, busy = asyncio.run(_run_batcher(slo_ms))
+    assert sparse['max_wait_ms'] == 0, sparse
+    assert busy['max_batch'] > 1 and busy['requests'] / busy['batches'] > 1.5, busy
+    assert busy['p95_ms'] <= slo_ms, busy
+    print(f"sparse {sparse}\nbusy   {busy}")
+    return True
+
+
+if __name__ == "__main__":
+    test_controller()
+    test_batcher()
@@ -0,0 +1,37 @@
+import os
+import tempfile
+
+import torch
+from safetensors.torch import load_file
+
+from app.models.loader import load_model
+from app.models.mobilenetv3 import MobileNetV3Classifier
+from convert_weights import convert
+
+
+def test_convert_weights():
+    """A converted checkpoint keeps its tensors and metadata and serves the same predictions."""
+    with tempfile.TemporaryDirectory() as tmp:
+        state_dict = MobileNetV3Classifier(num_classes=2).eval().state_dict()
+        src = os.path.join(tmp, 'mobilenetv3.pth')
+        dst = os.path.join(tmp, 'mobilenetv3.safetensors')
+        torch.save({'state_dict': state_dict, 'input_size': 192}, src)
+        convert(src, dst)
+
+        converted = load_file(dst)
+        assert converted.keys() == state_dict.keys()
+        assert all(torch.equal(converted[name], tensor) for name, tensor in state_dict.items())
+
+        images = torch.randn(2, 3, 192, 192)
+        outputs = []
+        for path in (src, dst):
+            model, input_size = load_model('mobilenetv3', path, cache=False)
+            assert input_size == 192
+            with torch.inference_mode():
+                outputs.append(model(images))
+        assert torch.equal(outputs[0], outputs[1])
+    return True
+
+
+if __name__ == "__main__":
+    test_convert_weights()
@@ -0,0 +1,136 @@
+import io
+import os
+import tempfile
+import time
+import zipfile
+
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+from app.jobs import InteractiveGate, JobStore, JobWorkerPool
+
+
+def _png(color=(200, 120, 90)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 32), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _zip(entries) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def _expect_error(fn, text):
+    try:
+        fn()
+    except ValueError as e:
+        assert text in str(e), e
+    else:
+        raise AssertionError(f"expected an error containing '{text}'")
+
+
+def test_store():
+    """Zips are expanded and size-capped; claimed items are completed, or requeued after a restart."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JobStore(tmp, max_image_bytes=1 << 20, max_job_bytes=3 << 20)
+        archive = _zip([('a.png', _png()), ('dir/', b''), ('notes.txt', b'x'), ('../b.jpg', _png())])
+        job_id, total = store.create([('batch.zip', archive), ('c.png', io.BytesIO(_png()))])
+        assert total == 3 and store.get(job_id)['status'] == 'queued'
+        assert sorted(os.listdir(os.path.join(tmp, job_id))) == ['000000', '000001', '000002']
+
+        # Counted decompressed: these zips are a few KiB each
+        zeros = b'\0' * (2 << 20)
+        _expect_error(lambda: store.create([('big.zip', _zip([('a.png', zeros)]))]), 'larger than 1 MiB')
+        many = _zip([(f'{i}.png', zeros[:900 << 10]) for i in range(4)])
+        _expect_error(lambda: store.create([('many.zip', many)]), 'larger than 3 MiB in total')
+        _expect_error(lambda: store.create([('bad.zip', io.BytesIO(b'not a zip'))]), 'Could not read bad.zip')
+        _expect_error(lambda: store.create([('empty.zip', _zip([('notes.txt', b'x')]))]), 'No images in upload')
+        assert [name for name in os.listdir(tmp) if not name.startswith('jobs.sqlite')] == [job_id]
+
+        claimed = store.claim(2)
+        assert [idx for _, idx, _ in claimed] == [0, 1] and store.get(job_id)['status'] == 'running'
+        assert store.complete([(job_id, 0, 1, 0.9, None), (job_id, 1, None, None, 'Invalid image')]) == []
+
+        # Claimed but never completed, as when the server stops mid-batch
+        assert [idx for _, idx, _ in store.claim(5)] == [2]
+        store = JobStore(tmp)
+        assert [idx for _, idx, _ in store.claim(5)] == [2]
+        assert store.complete([(job_id, 2, 0, 0.7, None)]) == [job_id]
+        job = store.get(job_id)
+        assert (job['status'], job['completed'], job['failed']) == ('done', 2, 1), job
+        results = store.results(job_id)
+        assert [r['filename'] for r in results] == ['a.png', '../b.jpg', 'c.png']
+        assert results[1]['error'] == 'Invalid image' and results[2]['predicted_class'] == 0
+        assert store.claim(5) == []
+    return True
+
+
+def _workers(store, gate, scored):
+    def predict_batch(images):
+        scored.append(len(images))
+        return torch.tensor([[0.2, 0.8]]).repeat(len(images), 1)
+    transform = transforms.Compose([transforms.Resize((8, 8)), transforms.ToTensor()])
+    return JobWorkerPool(store, predict_batch, transform, gate, batch_size=4, sub_batch_size=2, poll_interval=0.01)
+
+
+def _wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_worker_yields():
+    """Workers only score while no interactive request is in flight, and finish the job afterwards."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JobStore(tmp)
+        gate = InteractiveGate()
+        scored = []
+        workers = _workers(store, gate, scored)
+        job_id, _ = store.create([(f'{i}.png', io.BytesIO(_png())) for i in range(6)])
+        with gate:
+            workers.start()
+            time.sleep(0.2)
+            assert scored == [] and store.get(job_id)['status'] == 'queued'
+        try:
+            _wait_for(lambda: store.get(job_id)['status'] == 'done')
+        finally:
+            workers.stop()
+        assert scored == [2, 2, 2], scored
+        assert all(r['predicted_class'] == 1 for r in store.results(job_id))
+        assert not os.path.exists(os.path.join(tmp, job_id))
+    return True
+
+
+def test_images_kept_until_recorded():
+    """When results can't be recorded the images stay on disk, so the requeued items can still be scored."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JobStore(tmp)
+        job_id, _ = store.create([(f'{i}.png', io.BytesIO(_png())) for i in range(2)])
+        workers = _workers(store, InteractiveGate(), [])
+
+        def broken_complete(results):
+            raise RuntimeError("database is locked")
+        store.complete = broken_complete
+        items = store.claim(2)
+        workers._score_and_record(items)
+        assert all(os.path.exists(path) for _, _, path in items)
+
+        store = JobStore(tmp)
+        items = store.claim(2)
+        _workers(store, InteractiveGate(), [])._score_and_record(items)
+        job = store.get(job_id)
+        assert (job['status'], job['completed'], job['failed']) == ('done', 2, 0), job
+    return True
+
+
+if __name__ == "__main__":
+    test_store()
+    test_worker_yields()
+    test_images_kept_until_recorded()
@@ -0,0 +1,70 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Prepended to every child process: any attempt to open a network connection fails
+NO_NETWORK = """
+import socket
+
+def _blocked(*args, **kwargs):
+    raise OSError('network access disabled for this test')
+
+socket.socket.connect = _blocked
+socket.socket.connect_ex = _blocked
+socket.create_connection = _blocked
+socket.getaddrinfo = _blocked
+"""
+
+SAVE_WEIGHTS = NO_NETWORK + """
+import sys
+import torch
+from app.models.efficientnet_b3 import EfficientNetB3Classifier
+torch.save(EfficientNetB3Classifier(num_classes=2).state_dict(), sys.argv[1])
+"""
+
+PROFILE = NO_NETWORK + """
+import sys
+from app.__main__ import main
+sys.argv = ['app'] + sys.argv[1:]
+main()
+"""
+
+
+def _run_offline(code, args, torch_home):
+    env = dict(os.environ, TORCH_HOME=torch_home, HF_HUB_OFFLINE='1')
+    return subprocess.run([sys.executable, '-c', code] + args, cwd=HERE, env=env,
+                          capture_output=True, text=True, timeout=600)
+
+
+def test_offline_startup():
+    """Build, load and profile EfficientNet-B3 with networking disabled and an empty TORCH_HOME."""
+    with tempfile.TemporaryDirectory() as tmp:
+        torch_home = os.path.join(tmp, 'torch_home')
+        os.makedirs(torch_home)
+        weights = os.path.join(tmp, 'efficientnet_b3.pth')
+
+        result = _run_offline(SAVE_WEIGHTS, [weights], torch_home)
+        assert result.returncode == 0, f"Construction needed the network:\n{result.stderr}"
+
+        result = _run_offline(PROFILE, ['--profile-startup', '--json', '--model', 'efficientnet_b3',
+                                        '--weights', weights], torch_home)
+        assert result.returncode == 0, f"Startup profile failed offline:\n{result.stderr}"
+
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        phases = report['phases_ms']
+        for phase in ('import_torch', 'read_weights', 'build', 'load_state_dict', 'first_forward', 'total'):
+            assert phase in phases, f"Missing phase {phase}"
+        assert not os.listdir(torch_home), "Pretrained weights were fetched into TORCH_HOME"
+
+        print("Startup profile (offline):")
+        for phase, ms in phases.items():
+            print(f"  {phase:<16} {ms:>9.1f} ms")
+    return True
+
+
+if __name__ == "__main__":
+    test_offline_startup()
@@ -0,0 +1,56 @@
+import os
+import tempfile
+
+import torch
+
+from app.models import precision as precision_module
+from app.models.loader import load_model
+from app.models.mobilenetv3 import MobileNetV3Classifier
+from app.models.precision import PRECISIONS, resolve_precision
+
+
+def test_precisions():
+    """Every precision takes and returns fp32, stays close to fp32 and leaves the fp32 model untouched."""
+    with tempfile.TemporaryDirectory() as tmp:
+        weights = os.path.join(tmp, 'mobilenetv3.pth')
+        torch.save(MobileNetV3Classifier(num_classes=2).state_dict(), weights)
+        images = torch.randn(4, 3, 224, 224)
+        fp32, _ = load_model('mobilenetv3', weights)
+        with torch.inference_mode():
+            reference = torch.softmax(fp32(images), dim=1)
+            for precision in PRECISIONS:
+                model, input_size = load_model('mobilenetv3', weights, precision=precision)
+                probabilities = torch.softmax(model(images), dim=1)
+                logits, features = model.forward_with_features(images)
+                assert input_size == 224 and probabilities.dtype == features.dtype == torch.float32
+                assert features.shape == (4, model.embedding_dim)
+                drift = (probabilities - reference).abs().max().item()
+                assert drift < 0.05, (precision, drift)
+                print(f"{precision:<14} max probability drift {drift:.2e}")
+        assert next(fp32.parameters()).dtype == torch.float32
+    return True
+
+
+def test_fallback():
+    """bf16 falls back to fp32 without native support; unknown precisions are rejected."""
+    detect = precision_module.cpu_supports_bf16
+    precision_module.cpu_supports_bf16 = lambda: False
+    try:
+        assert resolve_precision('bf16') == 'fp32'
+        assert resolve_precision('bf16-autocast') == 'fp32'
+        assert resolve_precision('fp32') == 'fp32'
+    finally:
+        precision_module.cpu_supports_bf16 = detect
+    try:
+        resolve_precision('fp16')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("fp16 should be rejected")
+    print(f"native bf16 on this CPU: {detect()}")
+    return True
+
+
+if __name__ == "__main__":
+    test_precisions()
+    test_fallback()
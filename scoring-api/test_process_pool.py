@@ -0,0 +1,57 @@
+import asyncio
+import os
+import tempfile
+
+import torch
+
+from app.inference import InferenceError
+from app.models.mobilenetv3 import MobileNetV3Classifier
+from app.process_pool import ProcessPool
+
+PIXELS = bytes(224 * 224 * 3)
+
+
+async def _cancel_then_predict(pool):
+    # One slot: the first request takes it, the second waits for it in the executor
+    first = asyncio.create_task(pool.predict('pixels', PIXELS, (224, 224)))
+    await asyncio.sleep(0.002)
+    waiting = asyncio.create_task(pool.predict('pixels', PIXELS, (224, 224)))
+    await asyncio.sleep(0.002)
+    # Cancelled while the worker is still scoring / while waiting for the slot
+    assert not first.done() and not waiting.done()
+    first.cancel()
+    waiting.cancel()
+    for task in (first, waiting):
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    # Both slots released and the result collector still alive
+    results = await asyncio.wait_for(
+        asyncio.gather(*[pool.predict('pixels', PIXELS, (224, 224)) for _ in range(3)]), timeout=60)
+    try:
+        await pool.predict('pixels', PIXELS[:10], (224, 224))
+    except InferenceError:
+        pass
+    return results
+
+
+def test_cancelled_requests():
+    """Cancelled requests (client disconnects) neither leak their slot nor break later requests."""
+    with tempfile.TemporaryDirectory() as tmp:
+        weights = os.path.join(tmp, 'mobilenetv3.pth')
+        torch.save(MobileNetV3Classifier(num_classes=2).state_dict(), weights)
+        pool = ProcessPool('mobilenetv3', weights, workers=1, slots=1)
+        pool.start()
+        try:
+            results = asyncio.run(_cancel_then_predict(pool))
+            assert len(results) == 3 and all(len(r[2]) == 2 for r in results), results
+            assert list(pool._free_slots) == [0] and not pool._pending, (pool._free_slots, pool._pending)
+        finally:
+            pool.stop()
+    print(f"served after cancellations: {results[0][:2]}")
+    return True
+
+
+if __name__ == "__main__":
+    test_cancelled_requests()
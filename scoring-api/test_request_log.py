@@ -0,0 +1,51 @@
+import io
+import json
+import logging
+
+from app import request_log
+from app.request_log import RequestLog
+
+
+def _serve(log, request_id, error=None, status=200):
+    record = log.begin(request_id, '/predict')
+    request_log.note(bytes=1234)
+    with request_log.timed('forward'):
+        pass
+    if error:
+        request_log.fail(error)
+    log.finish(record, status)
+
+
+def test_request_log():
+    """One JSON line per kept request; every error kept, successes sampled, other logging still written."""
+    stream = io.StringIO()
+    log = RequestLog(sample_rate=0.1, static_fields={'model': 'test'}, stream=stream)
+    log.start()
+    try:
+        for i in range(1000):
+            _serve(log, f'ok-{i}')
+        for i in range(20):
+            _serve(log, f'bad-{i}', error='Invalid image format: ' + 'x' * 2000)
+        _serve(log, 'http-error', status=422)
+        logging.getLogger('app.test').warning("plain message")
+    finally:
+        log.stop()
+
+    lines = stream.getvalue().splitlines()
+    records = [json.loads(line) for line in lines if line.startswith('{')]
+    errors = [r for r in records if r['outcome'] == 'error']
+    successes = [r for r in records if r['outcome'] == 'success']
+    assert len(errors) == 21, len(errors)
+    assert all(len(r.get('error', '')) <= request_log.MAX_ERROR_LENGTH for r in errors)
+    assert 50 <= len(successes) <= 150, len(successes)
+    assert log.stats['sampled_out'] == 1000 - len(successes) and log.stats['dropped'] == 0, log.stats
+    record = successes[0]
+    assert record['bytes'] == 1234 and record['model'] == 'test', record
+    assert set(record['timings_ms']) == {'forward', 'total'}, record
+    assert "WARNING:app.test:plain message" in lines
+    print(f"{len(successes)} of 1000 successes and {len(errors)} errors logged: {record}")
+    return True
+
+
+if __name__ == "__main__":
+    test_request_log()
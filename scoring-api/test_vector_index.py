@@ -0,0 +1,118 @@
+import os
+import tempfile
+
+import numpy as np
+
+from app import vector_index
+from app.vector_index import UserIndexStore, VectorIndex
+
+
+def _vectors(count, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+
+def test_search():
+    """Top-k by cosine similarity, best first, with the query scan excluded; k <= 0 returns nothing."""
+    vectors = _vectors(50)
+    index = VectorIndex(16)
+    assert index.search(vectors[0], k=3) == []
+    index.add([f'scan-{i}' for i in range(50)], vectors)
+    results = index.search(vectors[7] * 3, k=3)
+    assert results[0][0] == 'scan-7' and abs(results[0][1] - 1.0) < 1e-5, results
+    assert [s for _, s in results] == sorted((s for _, s in results), reverse=True)
+    expected = np.argsort(-(vector_index._normalize(vectors) @ vector_index._normalize(vectors[7])))[:3]
+    assert [scan_id for scan_id, _ in results] == [f'scan-{i}' for i in expected]
+    assert 'scan-7' not in [scan_id for scan_id, _ in index.search(vectors[7], k=3, exclude='scan-7')]
+    assert len(index.search(vectors[0], k=500)) == 50
+    assert index.search(vectors[0], k=0) == [] and index.search(vectors[0], k=-1) == []
+    try:
+        index.add(['bad\nid'], vectors[0])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("ids with newlines should be rejected")
+    return True
+
+
+def test_reopen():
+    """An index on disk reopens with the same contents, also after an interrupted append."""
+    vectors = _vectors(20)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = VectorIndex.open(tmp, 16)
+        index.add([f'scan-{i}' for i in range(10)], vectors[:10])
+        for i in range(10, 20):
+            index.add([f'scan-{i}'], vectors[i])
+        reopened = VectorIndex.open(tmp, 16)
+        assert reopened.ids == index.ids and np.allclose(reopened.vectors, index.vectors)
+        assert reopened.search(vectors[15], k=1)[0][0] == 'scan-15'
+
+        # A vector row written without its id, as if the process died between the two writes
+        with open(os.path.join(tmp, 'vectors.f32'), 'ab') as f:
+            f.write(vectors[0].tobytes()[:40])
+        reopened = VectorIndex.open(tmp, 16)
+        assert reopened.size == 20 and os.path.getsize(os.path.join(tmp, 'vectors.f32')) == 20 * 16 * 4
+    return True
+
+
+def test_ivf():
+    """IVF search only scores the probed partitions; centroids are saved and reopened with the index."""
+    vectors = _vectors(2000, seed=1)
+    ids = [f'scan-{i}' for i in range(2000)]
+    with tempfile.TemporaryDirectory() as tmp:
+        index = VectorIndex.open(tmp, 16)
+        index.add(ids, vectors)
+        assert index.centroids is None
+        index.build_ivf(n_lists=8)
+        assert index.centroids.shape == (8, 16) and os.path.exists(os.path.join(tmp, 'ivf.npz'))
+
+        query = vectors[123]
+        probed = index.search(query, k=10, n_probe=1)
+        assert probed[0][0] == 'scan-123'
+        nearest_list = index.assignments[123]
+        assert all(index.assignments[ids.index(scan_id)] == nearest_list for scan_id, _ in probed)
+        exact = index.search(query, k=10, n_probe=None)
+        assert index.search(query, k=10, n_probe=8) == exact
+
+        # Appended after the build: assigned to a partition immediately, and on reopen
+        index.add(['new'], query)
+        assert index.search(query, k=2, n_probe=1)[0][0] in ('new', 'scan-123')
+        reopened = VectorIndex.open(tmp, 16)
+        assert np.array_equal(reopened.centroids, index.centroids)
+        assert np.array_equal(reopened.assignments, index.assignments)
+        assert reopened.search(query, k=10, n_probe=2) == index.search(query, k=10, n_probe=2)
+
+    # Built automatically once an index reaches IVF_MIN_VECTORS
+    index = VectorIndex(16)
+    index.add(ids[:1000], vectors[:1000])
+    minimum = vector_index.IVF_MIN_VECTORS
+    vector_index.IVF_MIN_VECTORS = 1500
+    try:
+        index.add(ids[1000:], vectors[1000:])
+    finally:
+        vector_index.IVF_MIN_VECTORS = minimum
+    assert index.centroids is not None and len(index.assignments) == 2000
+    return True
+
+
+def test_user_store():
+    """Users' indexes are separate, and only the most recently used stay open."""
+    vectors = _vectors(4)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = UserIndexStore(tmp, 16, max_open=2)
+        for user, vector in zip(('ann', 'bob', 'cy'), vectors):
+            store.add(user, f'{user}-1', vector)
+        assert list(store._indexes) == ['bob', 'cy']
+        store.search('bob', vectors[3])
+        store.add('ann', 'ann-2', vectors[3])
+        assert list(store._indexes) == ['bob', 'ann']
+        # Reopened from disk after eviction
+        assert [scan_id for scan_id, _ in store.search('ann', vectors[3], k=5)] == ['ann-2', 'ann-1']
+        assert [scan_id for scan_id, _ in store.search('cy', vectors[0], k=5)] == ['cy-1']
+    return True
+
+
+if __name__ == "__main__":
+    test_search()
+    test_reopen()
+    test_ivf()
+    test_user_store()
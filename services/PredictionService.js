@@ -61,6 +61,8 @@ export async function createSpot(userId = null, location = null) {
   }
 }
 
+// The app owns this insert: the scoring API only writes predictions itself with
+// PREDICTION_PERSISTENCE=server, which is meant for clients that don't call this.
 export async function savePredictionToSupabase(result, imageUri, spotId) {
   try {
     const { data, error } = await supabase
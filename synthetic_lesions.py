@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Synthetic Lesion Image Generator
+Produces deterministic synthetic skin lesion images in memory for load tests,
+benchmarks and regression checks. Shapes, textures and noise are built with
+vectorized numpy (no per-pixel Python loops) and encoded to JPEG in a BytesIO,
+so thousands of realistic payloads can be generated without touching disk.
+
+Every image is a pure function of (seed, index, size, quality): the same
+arguments always give the same bytes, and any slice of a large set can be
+regenerated on its own.
+
+Usage:
+    python synthetic_lesions.py --count 2000 --sizes 224 512 --qualities 75 95 --seed 0
+    python synthetic_lesions.py --count 50 --output-dir synthetic/   # also write files
+"""
+
+import argparse
+import io
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+# (name, skin colour, lesion colour, expected class, lesion radius as a fraction of the image, irregularity)
+PATTERNS = [
+    ('melanoma_sim', '#ff6b6b', '#8b4513', 1, 0.28, 0.10),
+    ('benign_mole', '#ffb6c1', '#654321', 0, 0.28, 0.03),
+    ('inflamed_lesion', '#ffffff', '#ff0000', 1, 0.28, 0.08),
+    ('dark_mole', '#808080', '#000000', 0, 0.28, 0.03),
+    ('atypical_lesion', '#4169e1', '#800080', 1, 0.28, 0.15),
+    ('normal_skin', '#f5f5dc', '#d2b48c', 0, 0.28, 0.02),
+    ('irregular_melanoma', '#ff6b6b', '#8b4513', 1, 0.25, 0.30),
+    ('small_mole', '#fafafa', '#333333', 0, 0.06, 0.02),
+]
+
+
+def _rgb(hex_color):
+    return np.array([int(hex_color[i:i + 2], 16) for i in (1, 3, 5)], dtype=np.float32)
+
+
+def _smooth_noise(rng, size, cells):
+    """Low-frequency noise in [-1, 1]: a coarse random grid upsampled bilinearly."""
+    grid = rng.uniform(-1.0, 1.0, (cells + 1, cells + 1)).astype(np.float32)
+    coords = np.linspace(0, cells, size, dtype=np.float32)
+    i0 = np.minimum(coords.astype(np.int64), cells - 1)
+    frac = coords - i0
+    rows = grid[i0] * (1 - frac)[:, None] + grid[i0 + 1] * frac[:, None]
+    return rows[:, i0] * (1 - frac)[None, :] + rows[:, i0 + 1] * frac[None, :]
+
+
+def render_lesion(rng, size, skin, lesion, radius, irregularity):
+    """
+    Render one lesion on skin as a (size, size, 3) uint8 array.
+
+    The border is a circle whose radius is perturbed by a few random angular
+    harmonics (``irregularity`` scales their amplitude); the lesion blends into
+    the skin over a soft edge and both get mottled texture and sensor noise.
+    """
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32)
+    cx, cy = size * (0.5 + rng.uniform(-0.08, 0.08, 2))
+    dx, dy = x - cx, y - cy
+    angle = np.arctan2(dy, dx)
+    distance = np.hypot(dx, dy)
+
+    harmonics = np.arange(2, 7)
+    amplitudes = rng.uniform(0, irregularity, len(harmonics)) / harmonics
+    phases = rng.uniform(0, 2 * np.pi, len(harmonics))
+    boundary = size * radius * rng.uniform(0.85, 1.15) * (
+        1 + np.tensordot(amplitudes, np.cos(np.multiply.outer(harmonics, angle) + phases[:, None, None]), axes=1)
+    )
+
+    edge = max(size * 0.015, 1.0)
+    alpha = np.clip((boundary - distance) / edge, 0.0, 1.0)[..., None]
+
+    skin_texture = 1 + 0.06 * _smooth_noise(rng, size, 8)[..., None]
+    lesion_texture = 1 + 0.25 * _smooth_noise(rng, size, 24)[..., None]
+    image = skin * skin_texture * (1 - alpha) + lesion * lesion_texture * alpha
+
+    # Scattered dark speckles (hair, pigment dots) and per-pixel sensor noise
+    speckles = rng.random((size, size)) > 0.995
+    image[speckles] *= 0.3
+    image += rng.normal(0, 4.0, image.shape).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def encode_jpeg(array, quality=90):
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def make_image(index, size=224, quality=90, seed=0):
+    """
+    Deterministically generate image ``index`` of the set for ``seed``.
+
+    Returns:
+        Dictionary with 'name', 'description', 'expected' (class), 'size',
+        'quality' and 'jpeg' (encoded bytes)
+    """
+    name, skin, lesion, expected, radius, irregularity = PATTERNS[index % len(PATTERNS)]
+    rng = np.random.default_rng([seed, index])
+    array = render_lesion(rng, size, _rgb(skin), _rgb(lesion), radius, irregularity)
+    return {
+        'name': f'synthetic_{index:05d}_{name}.jpg',
+        'description': name,
+        'expected': expected,
+        'size': size,
+        'quality': quality,
+        'jpeg': encode_jpeg(array, quality),
+    }
+
+
+def generate(count, size=224, quality=90, seed=0, start=0):
+    """Yield ``count`` images starting at ``start``, cycling through every pattern."""
+    for index in range(start, start + count):
+        yield make_image(index, size, quality, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic lesion images in memory')
+    parser.add_argument('--count', type=int, default=1000, help='Images per size/quality (default: 1000)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[224])
+    parser.add_argument('--qualities', type=int, nargs='+', default=[90])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', help='Also write the images here, in benign/ and malignant/ folders')
+    args = parser.parse_args()
+
+    print(f"{'size':>5} {'quality':>8} {'images/s':>9} {'mean KB':>8} {'p95 KB':>7}")
+    for size in args.sizes:
+        for quality in args.qualities:
+            start = time.perf_counter()
+            payload_sizes = []
+            for item in generate(args.count, size, quality, args.seed):
+                payload_sizes.append(len(item['jpeg']))
+                if args.output_dir:
+                    folder = os.path.join(args.output_dir, f'{size}_q{quality}',
+                                          'malignant' if item['expected'] else 'benign')
+                    os.makedirs(folder, exist_ok=True)
+                    with open(os.path.join(folder, item['name']), 'wb') as f:
+                        f.write(item['jpeg'])
+            elapsed = time.perf_counter() - start
+            kb = np.array(payload_sizes) / 1024
+            print(f"{size:>5} {quality:>8} {args.count / elapsed:>9.1f} {kb.mean():>8.1f} "
+                  f"{np.percentile(kb, 95):>7.1f}")
+
+
+if __name__ == '__main__':
+    main()